@@ -0,0 +1,209 @@
+"""
+Parsing dei file da importare, singolarmente o per un'intera cartella mensile in parallelo.
+
+Le funzioni di questo modulo non scrivono sul database e non usano Tkinter, così
+possono girare nei processi di un `ProcessPoolExecutor`; la scrittura su DB, nell'ordine
+richiesto dalle dipendenze, resta in `ImportService.import_folder`.
+"""
+import datetime
+import logging
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Callable, List, Optional
+
+from parse_cache import ParseCache
+from parsers import (
+    DoppiaSpuntaResult,
+    parse_carrelisti,
+    parse_doppia_spunta,
+    parse_preparatori,
+    parse_ricevitori,
+)
+from report_fingerprint import (
+    TIPO_CARRELLISTI,
+    TIPO_DOPPIA_SPUNTA,
+    TIPO_PREPARATORI,
+    TIPO_RICEVITORI,
+    detect_report_type,
+)
+
+logger = logging.getLogger(__name__)
+
+# Ordine di scrittura su DB: le righe PICKING devono esistere prima
+# dell'aggiornamento penalità della Doppia Spunta
+BATCH_WRITE_ORDER = [TIPO_PREPARATORI, TIPO_CARRELLISTI, TIPO_RICEVITORI, TIPO_DOPPIA_SPUNTA]
+
+# Parole chiave nel nome file, usate quando le intestazioni non bastano a riconoscere il report
+_FILENAME_KEYWORDS = [
+    (TIPO_DOPPIA_SPUNTA, ["doppia spunta"]),
+    (TIPO_CARRELLISTI, ["carrellist", "carrelist"]),
+    (TIPO_PREPARATORI, ["preparatori"]),
+    (TIPO_RICEVITORI, ["ricevitori"]),
+]
+
+_EXCEL_SUFFIXES = {".xlsx", ".xlsm", ".xls"}
+
+
+def detect_tipo_from_filename(file_path: str) -> Optional[str]:
+    """Riconosce il tipo di report dal nome del file, None se non riconosciuto."""
+    name = Path(file_path).name.lower().replace("_", " ")
+    for tipo, keywords in _FILENAME_KEYWORDS:
+        if any(k in name for k in keywords):
+            return tipo
+    return None
+
+
+def parse_by_tipo(
+    file_path: str,
+    tipo: str,
+    data_rif: Optional[datetime.date] = None,
+    parse_cache: Optional[ParseCache] = None,
+) -> Any:
+    """
+    Applica il parser corrispondente al tipo di attività, passando dalla cache se indicata.
+
+    Returns:
+        DataFrame, DoppiaSpuntaResult oppure, per i Carrellisti, la tupla
+        (DataFrame, dettaglio sessioni) ancora da salvare su DB
+    """
+    def _run(parser_type: str, parse_func: Callable[[str], Any], extra: str = "") -> Any:
+        if parse_cache is None:
+            return parse_func(file_path)
+        return parse_cache.get_or_parse(file_path, parser_type, parse_func, extra=extra)
+
+    if "Preparatori" in tipo:
+        return _run("preparatori", parse_preparatori)
+    elif "Carrellisti" in tipo:
+        # I Carrellisti ora hanno la colonna Data nel file, quindi data_rif è opzionale
+        # Se non fornita, verrà usata quella dal file
+        if not data_rif:
+            data_rif = datetime.date.today()  # Fallback, ma il parser userà la data dal file
+        return _run(
+            "carrellisti",
+            lambda path: parse_carrelisti(path, data_rif),
+            extra=data_rif.isoformat(),
+        )
+    elif "Doppia" in tipo:
+        return _run("doppia_spunta", parse_doppia_spunta)
+    else:
+        return _run("ricevitori", parse_ricevitori)
+
+
+@dataclass
+class BatchFileResult:
+    """Esito del parsing (e poi della scrittura) di un file della cartella."""
+
+    file_path: str
+    tipo: str
+    output: Any = None
+    righe: int = 0
+    parse_seconds: float = 0.0
+    write_seconds: float = 0.0
+    records_scritti: int = 0
+    error: Optional[str] = None
+
+    @property
+    def righe_al_secondo(self) -> float:
+        return self.righe / self.parse_seconds if self.parse_seconds > 0 else 0.0
+
+    def summary(self) -> str:
+        name = Path(self.file_path).name
+        if self.error:
+            return f"❌ {name}: {self.error}"
+        return (
+            f"✓ {name}: {self.righe} record in {self.parse_seconds:.1f}s "
+            f"({self.righe_al_secondo:.0f} record/s), {self.records_scritti} scritti su DB "
+            f"in {self.write_seconds:.1f}s"
+        )
+
+
+def _count_rows(output: Any) -> int:
+    if isinstance(output, DoppiaSpuntaResult):
+        return len(output.records)
+    if isinstance(output, tuple):
+        return len(output[0])
+    return len(output)
+
+
+def _parse_worker(file_path: str, tipo: str, data_rif: Optional[datetime.date]) -> BatchFileResult:
+    """Eseguito in un processo separato: parsing di un solo file, senza accesso al DB."""
+    start = time.perf_counter()
+    output = parse_by_tipo(file_path, tipo, data_rif, ParseCache())
+    return BatchFileResult(
+        file_path=file_path,
+        tipo=tipo,
+        output=output,
+        righe=_count_rows(output),
+        parse_seconds=time.perf_counter() - start,
+    )
+
+
+def detect_tipo(file_path: str) -> Optional[str]:
+    """Tipo di report dalle intestazioni del foglio; se incerto, dal nome del file."""
+    try:
+        fingerprint = detect_report_type(file_path)
+    except Exception as e:
+        logger.warning("Impossibile leggere le intestazioni di %s: %s", file_path, e)
+        fingerprint = None
+    if fingerprint is not None and fingerprint.is_confident:
+        return fingerprint.tipo
+    return detect_tipo_from_filename(file_path)
+
+
+def find_batch_files(folder: str) -> List[BatchFileResult]:
+    """Elenca i file Excel riconosciuti nella cartella, nell'ordine di scrittura su DB."""
+    found: List[BatchFileResult] = []
+    for path in sorted(Path(folder).iterdir()):
+        if path.suffix.lower() not in _EXCEL_SUFFIXES or path.name.startswith("~$"):
+            continue
+        tipo = detect_tipo(str(path))
+        if tipo is None:
+            logger.info("File non riconosciuto, ignorato: %s", path.name)
+            continue
+        found.append(BatchFileResult(file_path=str(path), tipo=tipo))
+    found.sort(key=lambda r: BATCH_WRITE_ORDER.index(r.tipo))
+    return found
+
+
+def parse_files_parallel(
+    files: List[BatchFileResult],
+    data_rif: Optional[datetime.date] = None,
+    max_workers: Optional[int] = None,
+    on_parsed: Optional[Callable[[BatchFileResult], None]] = None,
+) -> List[BatchFileResult]:
+    """
+    Esegue il parsing dei file in parallelo in un pool di processi.
+
+    Args:
+        files: File da elaborare (da `find_batch_files`)
+        data_rif: Data di riferimento per i Carrellisti
+        max_workers: Numero massimo di processi (default: uno per file, entro il numero di CPU)
+        on_parsed: Callback chiamata nel processo principale al termine di ogni file
+
+    Returns:
+        Gli stessi file, nello stesso ordine, con output o errore valorizzati
+    """
+    if not files:
+        return []
+    workers = max_workers or min(len(files), os.cpu_count() or 1)
+    results = {r.file_path: r for r in files}
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {
+            pool.submit(_parse_worker, r.file_path, r.tipo, data_rif): r.file_path
+            for r in files
+        }
+        for future in as_completed(futures):
+            file_path = futures[future]
+            try:
+                results[file_path] = future.result()
+            except Exception as e:
+                logger.exception("Errore nel parsing di %s", file_path)
+                results[file_path].error = str(e)
+            if on_parsed:
+                on_parsed(results[file_path])
+
+    return [results[r.file_path] for r in files]
@@ -0,0 +1,442 @@
+"""
+Script di benchmark per il parser Carrellisti.
+
+Confronta l'estrazione vettoriale delle righe movimento (`_collect_carrellisti_rows`)
+con il vecchio ciclo `df.iterrows()` e il calcolo NumPy delle sessioni
+(`_compute_carrellisti_sessions`) con i vecchi cicli Python, sul file indicato e su una
+giornata sintetica da 50.000 movimenti, verificando che i risultati coincidano.
+Non scrive nulla sul database: il parsing viene interrotto dopo la lettura del file.
+"""
+import datetime
+import random
+import sys
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+import pandas as pd
+
+import parsers
+
+
+class _Captured(Exception):
+    """Interrompe `parse_carrelisti` dopo aver catturato gli argomenti dello STEP 1."""
+
+    def __init__(self, args: tuple):
+        super().__init__("argomenti catturati")
+        self.args_step1 = args
+
+
+def _legacy_collect_rows(
+    df: pd.DataFrame,
+    data_col: Optional[str],
+    prep_col: str,
+    tipo_col: str,
+    ora_inizio_col: str,
+    ora_fine_col: str,
+    errore_col: Optional[str],
+    data_rif: datetime.date,
+) -> List[Dict[str, Any]]:
+    """Implementazione originale dello STEP 1, riga per riga con `df.iterrows()`."""
+    all_rows = []
+    current_code = None
+
+    for _, row in df.iterrows():
+        prep = str(row[prep_col]).strip() if pd.notna(row[prep_col]) else ""
+        tipo = str(row[tipo_col]).strip() if pd.notna(row[tipo_col]) else ""
+
+        if prep.upper() == "TOTALE" or tipo.upper() == "TOTALE":
+            continue
+
+        if data_col and pd.notna(row[data_col]):
+            record_date = row[data_col]
+        else:
+            record_date = data_rif
+
+        if data_col and bool(row.get("_is_new_date_section", False)):
+            current_code = None
+
+        if prep and (not tipo or tipo.upper() in ["", "NAN", "ST", "AP", "CM"]):
+            current_code = prep
+            continue
+
+        if not current_code:
+            continue
+
+        if tipo and tipo.upper() != "NAN":
+            ora_inizio = row[ora_inizio_col] if pd.notna(row[ora_inizio_col]) else None
+            ora_fine = row[ora_fine_col] if pd.notna(row[ora_fine_col]) else None
+
+            if not ora_inizio or not ora_fine:
+                continue
+
+            errore = None
+            if errore_col and pd.notna(row[errore_col]):
+                errore = str(row[errore_col]).strip()
+
+            all_rows.append({
+                "data": record_date,
+                "codice": current_code,
+                "tipo": tipo,
+                "colli": 0 if errore else 1,
+                "ora_inizio": ora_inizio,
+                "ora_fine": ora_fine,
+                "errore": errore,
+                "raw_ora_inizio": row.get("_raw_ora_inizio"),
+                "raw_ora_fine": row.get("_raw_ora_fine"),
+            })
+
+    return all_rows
+
+
+def _legacy_compute_sessions(all_rows: List[Dict[str, Any]]) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+    """Implementazione originale degli STEP 1.5-4 (sessioni e ore gestionale) con cicli Python."""
+    # STEP 1.5: RAGGRUPPA righe duplicate (stesso data, codice, ora_inizio, ora_fine, tipo, errore)
+    # PRIMA di calcolare le sessioni!
+    righe_consolidate = {}
+    for row in all_rows:
+        chiave = (row["data"], row["codice"], row["ora_inizio"], row["ora_fine"], row["tipo"], row.get("errore"))
+        if chiave not in righe_consolidate:
+            righe_consolidate[chiave] = {
+                "data": row["data"],
+                "codice": row["codice"],
+                "tipo": row["tipo"],
+                "ora_inizio": row["ora_inizio"],
+                "ora_fine": row["ora_fine"],
+                "colli": 0,
+                "errore": row.get("errore"),
+                "raw_ora_inizio": row.get("raw_ora_inizio"),
+                "raw_ora_fine": row.get("raw_ora_fine"),
+            }
+        righe_consolidate[chiave]["colli"] += row["colli"]
+
+    # Converti il dizionario in lista
+    all_rows = list(righe_consolidate.values())
+    # STEP 2: Calcola sessioni con logica gap > 15 minuti
+    records_finali = []
+    sessioni_dettaglio = []  # Per salvare dettagli sessioni nel DB
+    # Raggruppa per (data, codice)
+    from itertools import groupby
+
+    all_rows_sorted = sorted(all_rows, key=lambda x: (x["data"], x["codice"], x["ora_inizio"]))
+
+    for (data, codice), group in groupby(all_rows_sorted, key=lambda x: (x["data"], x["codice"])):
+        righe_giorno = list(group)
+        righe_giorno.sort(key=lambda x: x["ora_inizio"])
+
+        # Dividi in sessioni
+        sessioni = []
+        sessione_corrente: List[dict] = []
+        session_end_dt: Optional[datetime.datetime] = None
+
+        for riga in righe_giorno:
+            dt_inizio = datetime.datetime.combine(datetime.date.today(), riga["ora_inizio"])
+            dt_fine = datetime.datetime.combine(datetime.date.today(), riga["ora_fine"])
+            if dt_fine < dt_inizio:
+                dt_fine += datetime.timedelta(days=1)
+
+            if not sessione_corrente:
+                sessione_corrente = [riga]
+                session_end_dt = dt_fine
+                continue
+
+            gap_minuti = (dt_inizio - session_end_dt).total_seconds() / 60 if session_end_dt else None
+
+            if gap_minuti is not None and gap_minuti > 15:
+                sessioni.append(sessione_corrente)
+                sessione_corrente = [riga]
+                session_end_dt = dt_fine
+            else:
+                sessione_corrente.append(riga)
+                if session_end_dt:
+                    session_end_dt = max(session_end_dt, dt_fine)
+
+        if sessione_corrente:
+            sessioni.append(sessione_corrente)
+
+        # STEP 3: Calcola tempo totale di TUTTE le sessioni e conta movimenti per tipo
+        tempo_totale_giornata_ore = 0.0
+        movimenti_per_tipo = {}  # Conta movimenti validi per tipo
+        errori_per_tipo_giornata = {}  # Conta errori per tipo
+        righe_con_sessione = []  # Lista di TUTTE le righe con info sessione
+
+        for num_sess, righe_sess in enumerate(sessioni, 1):
+            # Tempo totale sessione: da primo inizio a ultima fine
+            primo_inizio = righe_sess[0]["ora_inizio"]
+            ultima_fine = righe_sess[-1]["ora_fine"]
+
+            dt_inizio = datetime.datetime.combine(datetime.date.today(), primo_inizio)
+            dt_fine = datetime.datetime.combine(datetime.date.today(), ultima_fine)
+
+            # Gestisci caso di passaggio mezzanotte
+            if dt_fine < dt_inizio:
+                dt_fine += datetime.timedelta(days=1)
+
+            tempo_sessione_min = (dt_fine - dt_inizio).total_seconds() / 60
+            tempo_sessione_ore = tempo_sessione_min / 60.0
+            tempo_totale_giornata_ore += tempo_sessione_ore
+
+            # Conta movimenti per tipo in questa sessione
+            # Separa movimenti validi da errori
+            for riga in righe_sess:
+                tipo = riga["tipo"]
+                colli = riga["colli"]
+                errore = riga.get("errore")
+
+                if errore:
+                    # Conta gli errori separatamente
+                    if tipo not in errori_per_tipo_giornata:
+                        errori_per_tipo_giornata[tipo] = 0
+                    errori_per_tipo_giornata[tipo] += 1
+                else:
+                    # Conta solo i movimenti validi
+                    if tipo not in movimenti_per_tipo:
+                        movimenti_per_tipo[tipo] = 0
+                    movimenti_per_tipo[tipo] += colli
+
+            # Salva OGNI RIGA con i dettagli della sessione
+            for idx_riga, riga in enumerate(righe_sess):
+                righe_con_sessione.append({
+                    'riga': riga,
+                    'numero_sessione': num_sess,
+                    'ora_inizio_sessione': primo_inizio,
+                    'ora_fine_sessione': ultima_fine,
+                    'tempo_sessione_ore': tempo_sessione_ore,
+                    'totale_righe_sessione': len(righe_sess)
+                })
+
+        # STEP 4: Proporziona il tempo totale in base ai movimenti per tipo
+        totale_movimenti = sum(movimenti_per_tipo.values())
+
+        if totale_movimenti == 0:
+            continue
+
+        # Calcola ore gestionale per tipo in base ai movimenti totali
+        ore_gestionale_per_tipo = {}
+        for tipo, movimenti in movimenti_per_tipo.items():
+            proporzione = movimenti / totale_movimenti
+            ore_gestionale = tempo_totale_giornata_ore * proporzione
+            ore_gestionale_per_tipo[tipo] = ore_gestionale
+
+            # Crea note_errori se ci sono errori per questo tipo
+            note_errori = None
+            if tipo in errori_per_tipo_giornata:
+                num_errori = errori_per_tipo_giornata[tipo]
+                note_errori = f"{num_errori} movimento{'i' if num_errori > 1 else ''} con errore"
+
+            records_finali.append({
+                "data": data,
+                "codice_preparatore": codice,
+                "nome_preparatore": "",
+                "totale_colli": movimenti,
+                "penalita": 0,
+                "tipo_attivita": "CARRELLISTI",
+                "tipo": tipo,
+                "ore_tim": 0.0,
+                "ore_gestionale": round(ore_gestionale, 2),
+                "note_errori": note_errori,
+            })
+
+        # Salva OGNI riga con i dettagli della sessione
+        # ESCLUDE le righe con errore (non vanno in sessioni_carrellisti)
+        numero_riga_giornata = 0
+        sessione_corrente = None
+        tipo_gia_visto_in_giornata = set()
+        fine_riga_precedente_dt: Optional[datetime.datetime] = None
+
+        for riga_info in righe_con_sessione:
+            riga = riga_info['riga']
+            errore = riga.get('errore')
+
+            # SALTA le righe con errore - non vanno in sessioni_carrellisti
+            if errore:
+                continue
+
+            numero_riga_giornata += 1
+            tipo = riga['tipo']
+            num_sess = riga_info['numero_sessione']
+            ora_inizio = riga['ora_inizio']
+            ora_fine = riga['ora_fine']
+            conteggio_movimenti = riga['colli']  # Già consolidato!
+
+            # Calcola tempo di questa riga
+            dt_inizio_riga = datetime.datetime.combine(datetime.date.today(), ora_inizio)
+            dt_fine_riga = datetime.datetime.combine(datetime.date.today(), ora_fine)
+            if dt_fine_riga < dt_inizio_riga:
+                dt_fine_riga += datetime.timedelta(days=1)
+            tempo_riga_minuti = (dt_fine_riga - dt_inizio_riga).total_seconds() / 60
+
+            # Calcola gap: tempo tra FINE riga precedente e INIZIO riga corrente (NULL per prima riga o nuova sessione)
+            # IMPORTANTE: gap si azzera anche a inizio nuova sessione
+            if fine_riga_precedente_dt is not None and num_sess == sessione_corrente:
+                raw_gap = (dt_inizio_riga - fine_riga_precedente_dt).total_seconds() / 60
+                gap_minuti = round(max(0.0, raw_gap), 2)
+            else:
+                gap_minuti = None
+
+            # I totali vanno solo sulla PRIMA riga di ogni sessione
+            if num_sess != sessione_corrente:
+                # Nuova sessione - metti i totali
+                sessione_corrente = num_sess
+                ora_inizio_sess = riga_info['ora_inizio_sessione']
+                ora_fine_sess = riga_info['ora_fine_sessione']
+                tempo_sess = round(riga_info['tempo_sessione_ore'], 2)
+                tot_righe = riga_info['totale_righe_sessione']
+                fine_riga_precedente_dt = dt_fine_riga
+            else:
+                # Riga successiva della stessa sessione - NULL
+                ora_inizio_sess = None
+                ora_fine_sess = None
+                tempo_sess = None
+                tot_righe = None
+                fine_riga_precedente_dt = max(fine_riga_precedente_dt, dt_fine_riga)
+
+            # Movimenti: conteggio nella colonna corrispondente al tipo, NULL nelle altre
+            movimenti_st = conteggio_movimenti if tipo == 'ST' else None
+            movimenti_ss = conteggio_movimenti if tipo == 'SS' else None
+            movimenti_ap = conteggio_movimenti if tipo == 'AP' else None
+            movimenti_cm = conteggio_movimenti if tipo == 'CM' else None
+
+            # ore_gestionale per tipo va solo sulla PRIMA occorrenza del tipo nella giornata
+            if tipo not in tipo_gia_visto_in_giornata:
+                ore_gest_st = round(ore_gestionale_per_tipo.get('ST', 0), 2) if tipo == 'ST' else None
+                ore_gest_ss = round(ore_gestionale_per_tipo.get('SS', 0), 2) if tipo == 'SS' else None
+                ore_gest_ap = round(ore_gestionale_per_tipo.get('AP', 0), 2) if tipo == 'AP' else None
+                ore_gest_cm = round(ore_gestionale_per_tipo.get('CM', 0), 2) if tipo == 'CM' else None
+                tipo_gia_visto_in_giornata.add(tipo)
+            else:
+                ore_gest_st = None
+                ore_gest_ss = None
+                ore_gest_ap = None
+                ore_gest_cm = None
+
+            sessioni_dettaglio.append({
+                'data': data,
+                'codice_preparatore': codice,
+                'numero_riga': numero_riga_giornata,
+                'ora_inizio_riga': ora_inizio,
+                'ora_fine_riga': ora_fine,
+                'tempo_riga_minuti': round(tempo_riga_minuti, 2),
+                'gap_minuti': gap_minuti,
+                'movimenti_st': movimenti_st,
+                'movimenti_ss': movimenti_ss,
+                'movimenti_ap': movimenti_ap,
+                'movimenti_cm': movimenti_cm,
+                'errore': riga.get('errore'),
+                'numero_sessione': num_sess,
+                'ora_inizio_sessione': ora_inizio_sess,
+                'ora_fine_sessione': ora_fine_sess,
+                'tempo_sessione_ore': tempo_sess,
+                'totale_righe_sessione': tot_righe,
+                'ore_gestionale_st': ore_gest_st,
+                'ore_gestionale_ss': ore_gest_ss,
+                'ore_gestionale_ap': ore_gest_ap,
+                'ore_gestionale_cm': ore_gest_cm
+            })
+
+            # fine_riga_precedente_dt già aggiornato nella logica qui sopra
+
+    return records_finali, sessioni_dettaglio
+
+
+def _capture_step1_args(file_path: str) -> tuple:
+    """Esegue la lettura del file e restituisce gli argomenti passati allo STEP 1."""
+    original = parsers._collect_carrellisti_rows
+
+    def _capture(*args):
+        raise _Captured(args)
+
+    parsers._collect_carrellisti_rows = _capture
+    try:
+        parsers.parse_carrelisti(file_path, datetime.date.today())
+    except _Captured as captured:
+        return captured.args_step1
+    finally:
+        parsers._collect_carrellisti_rows = original
+    raise ValueError("Il file non contiene le colonne Ora inizio/fine: nessuna sessione da confrontare.")
+
+
+def _best_of(func, args: tuple, repeat: int) -> tuple:
+    best = float("inf")
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(*args)
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def _synthetic_rows(movimenti: int, operatori: int = 40, seed: int = 0) -> List[Dict[str, Any]]:
+    """Genera una giornata sintetica di movimenti (con pause, duplicati, errori e mezzanotte)."""
+    rng = random.Random(seed)
+    data = datetime.date(2025, 8, 1)
+    base = datetime.datetime.combine(data, datetime.time(5, 0))
+    rows = []
+    per_operatore = max(1, movimenti // operatori)
+    for op in range(operatori):
+        codice = f"c{op:03d}"
+        cursor = base + datetime.timedelta(minutes=rng.randint(0, 120))
+        for _ in range(per_operatore):
+            cursor += datetime.timedelta(seconds=rng.choice([5, 20, 45, 90, 300, 1200, 3000]))
+            fine = cursor + datetime.timedelta(seconds=rng.randint(0, 600))
+            errore = "ERR" if rng.random() < 0.03 else None
+            row = {
+                "data": data,
+                "codice": codice,
+                "tipo": rng.choice(["ST", "SS", "AP", "CM"]),
+                "colli": 0 if errore else 1,
+                "ora_inizio": cursor.time(),
+                "ora_fine": fine.time(),
+                "errore": errore,
+                "raw_ora_inizio": None,
+                "raw_ora_fine": None,
+            }
+            rows.append(row)
+            if rng.random() < 0.05:
+                rows.append(dict(row))
+    return rows
+
+
+def _frame_records(frame: pd.DataFrame) -> List[Dict[str, Any]]:
+    """Righe del DataFrame come dizionari, con None al posto di NaN/NA (come i cicli Python)."""
+    return frame.astype(object).where(frame.notna(), None).to_dict("records")
+
+
+def _compare_sessions(label: str, movimenti: pd.DataFrame, repeat: int) -> None:
+    all_rows = movimenti.to_dict("records")
+    legacy_time, legacy_result = _best_of(_legacy_compute_sessions, (all_rows,), repeat)
+    new_time, new_result = _best_of(parsers._compute_carrellisti_sessions, (movimenti,), repeat)
+    records, sessioni = new_result
+
+    print(f"{label} ({len(movimenti)} movimenti, {len(sessioni)} righe sessione)")
+    print(f"  Sessioni cicli Python: {legacy_time * 1000:10.1f} ms")
+    print(f"  Sessioni NumPy:        {new_time * 1000:10.1f} ms")
+    if new_time > 0:
+        print(f"  Speedup: {legacy_time / new_time:.1f}x")
+    identici = legacy_result == (_frame_records(records), _frame_records(sessioni))
+    print("  Risultati identici ✓" if identici else "  ❌ RISULTATI DIVERSI")
+
+
+def benchmark(file_path: str, repeat: int = 3) -> None:
+    """Stampa i tempi delle due implementazioni degli STEP 1-4 e verifica l'uguaglianza."""
+    args = _capture_step1_args(file_path)
+    df = args[0]
+    print(f"File: {file_path}")
+    print(f"Righe foglio: {len(df)}")
+
+    legacy_time, legacy_rows = _best_of(_legacy_collect_rows, args, repeat)
+    new_time, new_rows = _best_of(parsers._collect_carrellisti_rows, args, repeat)
+
+    print(f"STEP 1 iterrows:   {legacy_time * 1000:10.1f} ms ({len(legacy_rows)} righe)")
+    print(f"STEP 1 vettoriale: {new_time * 1000:10.1f} ms ({len(new_rows)} righe)")
+    if new_time > 0:
+        print(f"Speedup: {legacy_time / new_time:.1f}x")
+    print("Risultati identici ✓" if legacy_rows == new_rows.to_dict("records") else "❌ RISULTATI DIVERSI")
+
+    _compare_sessions("STEP 1.5-4 file", new_rows, repeat)
+    _compare_sessions("STEP 1.5-4 giornata sintetica", pd.DataFrame(_synthetic_rows(50_000)), repeat)
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("Uso: python benchmark_carrellisti.py <percorso_file_excel> [ripetizioni]")
+    else:
+        benchmark(sys.argv[1], int(sys.argv[2]) if len(sys.argv) > 2 else 3)
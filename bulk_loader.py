@@ -0,0 +1,180 @@
+"""
+Caricamento massivo tramite tabelle temporanee di appoggio (staging).
+
+Le righe vengono caricate in una tabella TEMPORARY della connessione, con
+`LOAD DATA LOCAL INFILE` se abilitato oppure con INSERT multi-riga a blocchi, e poi
+unite nelle tabelle definitive con una sola istruzione set-based. La colonna `seq`
+conserva l'ordine di arrivo: nel merge le righe duplicate si applicano nello stesso
+ordine dell'`executemany` riga per riga.
+"""
+import datetime
+import logging
+import os
+import tempfile
+import time
+from dataclasses import dataclass
+from decimal import Decimal
+from typing import Any, List, Optional, Sequence
+
+import mysql.connector
+
+from config import BULK_LOAD_CHUNK_SIZE, BULK_LOAD_LOCAL_INFILE
+
+logger = logging.getLogger(__name__)
+
+METODO_LOCAL_INFILE = "LOAD DATA LOCAL INFILE"
+METODO_VALUES = "INSERT multi-riga"
+
+
+@dataclass
+class BulkLoadStats:
+    """Tempi e volumi di un caricamento tramite tabella di appoggio."""
+
+    righe: int = 0
+    metodo: str = ""
+    secondi_caricamento: float = 0.0
+    secondi_merge: float = 0.0
+    righe_merge: int = 0
+
+    @property
+    def secondi(self) -> float:
+        return self.secondi_caricamento + self.secondi_merge
+
+    @property
+    def righe_al_secondo(self) -> float:
+        return self.righe / self.secondi if self.secondi > 0 else 0.0
+
+    def summary(self) -> str:
+        return (
+            f"{self.righe} righe via {self.metodo}: caricamento {self.secondi_caricamento:.2f}s, "
+            f"merge {self.secondi_merge:.2f}s ({self.righe_al_secondo:.0f} righe/s)"
+        )
+
+
+def create_staging_table(
+    cur: Any,
+    table: str,
+    columns_ddl: Sequence[str],
+    index_columns: Sequence[str] = (),
+) -> None:
+    """
+    Crea (o ricrea vuota) la tabella temporanea `table` con le colonne indicate più `seq`.
+
+    `index_columns`, se indicate, formano un indice usato dalle JOIN con le tabelle definitive.
+    """
+    definitions = ["seq INT AUTO_INCREMENT PRIMARY KEY", *columns_ddl]
+    if index_columns:
+        definitions.append(f"INDEX idx_staging ({', '.join(index_columns)})")
+    cur.execute(f"DROP TEMPORARY TABLE IF EXISTS {table}")
+    cur.execute(f"CREATE TEMPORARY TABLE {table} ({', '.join(definitions)})")
+
+
+def drop_staging_table(cur: Any, table: str) -> None:
+    """Elimina la tabella temporanea: le connessioni del pool sopravvivono alla singola operazione."""
+    cur.execute(f"DROP TEMPORARY TABLE IF EXISTS {table}")
+
+
+def _tsv_value(value: Any) -> str:
+    """Valore nel formato predefinito di LOAD DATA (tab come separatore, backslash come escape)."""
+    if value is None:
+        return "\\N"
+    if isinstance(value, bool):
+        return "1" if value else "0"
+    if isinstance(value, (datetime.date, datetime.time)):
+        return value.isoformat()
+    if isinstance(value, (int, float, Decimal)):
+        return str(value)
+    text = str(value)
+    return (
+        text.replace("\\", "\\\\")
+        .replace("\t", "\\t")
+        .replace("\n", "\\n")
+        .replace("\r", "\\r")
+    )
+
+
+def rows_to_tsv(rows: Sequence[Sequence[Any]]) -> str:
+    """Testo da caricare con LOAD DATA: una riga per record, campi separati da tab."""
+    return "".join("\t".join(_tsv_value(v) for v in row) + "\n" for row in rows)
+
+
+def _load_local_infile(cur: Any, table: str, columns: Sequence[str], rows: Sequence[Sequence[Any]]) -> None:
+    # Il buffer viene preparato in memoria; mysql-connector legge i file LOCAL solo da
+    # percorso, quindi passa da un file temporaneo eliminato subito dopo il caricamento
+    buffer = rows_to_tsv(rows)
+    fd, path = tempfile.mkstemp(suffix=".tsv")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8", newline="") as fh:
+            fh.write(buffer)
+        cur.execute(
+            f"LOAD DATA LOCAL INFILE %s INTO TABLE {table} CHARACTER SET utf8mb4 ({', '.join(columns)})",
+            (path,),
+        )
+    finally:
+        os.unlink(path)
+
+
+def insert_values_chunked(
+    cur: Any,
+    table: str,
+    columns: Sequence[str],
+    rows: Sequence[Sequence[Any]],
+    chunk_size: Optional[int] = None,
+    on_duplicate: str = "",
+) -> None:
+    """
+    INSERT multi-riga a blocchi di `chunk_size` righe (default `BULK_LOAD_CHUNK_SIZE`), senza commit.
+
+    `on_duplicate`, se indicato, è la parte SET di un `ON DUPLICATE KEY UPDATE`.
+    """
+    chunk_size = max(1, chunk_size or BULK_LOAD_CHUNK_SIZE)
+    placeholder = "(" + ", ".join(["%s"] * len(columns)) + ")"
+    prefix = f"INSERT INTO {table} ({', '.join(columns)}) VALUES "
+    suffix = f" ON DUPLICATE KEY UPDATE {on_duplicate}" if on_duplicate else ""
+    for start in range(0, len(rows), chunk_size):
+        chunk = rows[start:start + chunk_size]
+        params: List[Any] = [value for row in chunk for value in row]
+        cur.execute(prefix + ", ".join([placeholder] * len(chunk)) + suffix, params)
+
+
+def load_staging(
+    cur: Any,
+    table: str,
+    columns: Sequence[str],
+    rows: Sequence[Sequence[Any]],
+    chunk_size: Optional[int] = None,
+    local_infile: Optional[bool] = None,
+) -> BulkLoadStats:
+    """
+    Carica le righe nella tabella di appoggio, senza commit.
+
+    Args:
+        cur: Cursore della connessione che possiede la tabella temporanea
+        table: Tabella di appoggio (da `create_staging_table`)
+        columns: Colonne nell'ordine dei valori di ogni riga
+        rows: Righe da caricare
+        chunk_size: Righe per INSERT (default `BULK_LOAD_CHUNK_SIZE`)
+        local_infile: Forza o esclude LOAD DATA LOCAL INFILE (default `BULK_LOAD_LOCAL_INFILE`)
+
+    Returns:
+        BulkLoadStats con metodo usato e tempo di caricamento
+    """
+    use_local_infile = BULK_LOAD_LOCAL_INFILE if local_infile is None else local_infile
+    start = time.perf_counter()
+
+    metodo = METODO_VALUES
+    if use_local_infile:
+        try:
+            _load_local_infile(cur, table, columns, rows)
+            metodo = METODO_LOCAL_INFILE
+        except mysql.connector.Error as e:
+            logger.warning("LOAD DATA LOCAL INFILE non disponibile (%s): uso INSERT a blocchi", e)
+            cur.execute(f"DELETE FROM {table}")
+    if metodo == METODO_VALUES:
+        insert_values_chunked(cur, table, columns, rows, chunk_size)
+
+    return BulkLoadStats(
+        righe=len(rows),
+        metodo=metodo,
+        secondi_caricamento=time.perf_counter() - start,
+    )
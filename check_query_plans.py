@@ -0,0 +1,62 @@
+"""
+Verifica dei piani di esecuzione delle query mensili.
+
+Esegue EXPLAIN sulle query di calcolo premi e sulla griglia dati filtrata per mese e
+termina con codice 1 se una delle tabelle controllate viene letta con una scansione
+completa (type = ALL). Da eseguire sul database di produzione (o su una copia con un
+volume di dati realistico): su tabelle quasi vuote l'ottimizzatore può preferire la
+scansione anche quando l'indice è disponibile.
+"""
+import sys
+from contextlib import closing
+from typing import Any, Dict, List, Tuple
+
+from config import TABLE_NAME
+from data_viewer import build_dati_produzione_query
+from db_pool import get_connection
+from migrations import ensure_schema
+from premi_carrellisti_view import build_produzione_carrellisti_query
+from premi_preparatori_view import build_produzione_preparatori_query
+
+# Tabelle che non devono mai essere lette per intero dalle query controllate
+TABELLE_CONTROLLATE = {TABLE_NAME, "dp", "anomalie", "a"}
+
+
+def _queries(anno: int, mese: int) -> List[Tuple[str, str, List[Any]]]:
+    filters: Dict[str, Any] = {"use_date_filter": False, "anno": str(anno), "mese": mese}
+    return [
+        ("Premi carrellisti", *build_produzione_carrellisti_query(anno, mese)),
+        ("Premi preparatori", *build_produzione_preparatori_query(anno, mese)),
+        ("Griglia dati (anno/mese)", *build_dati_produzione_query(filters)),
+    ]
+
+
+def full_scans(cur: Any, query: str, params: List[Any]) -> List[Dict[str, Any]]:
+    """Righe di EXPLAIN con scansione completa su una delle tabelle controllate."""
+    cur.execute("EXPLAIN " + query, params)
+    rows = cur.fetchall()
+    return [row for row in rows if row.get("type") == "ALL" and row.get("table") in TABELLE_CONTROLLATE]
+
+
+def check(anno: int, mese: int) -> bool:
+    """Stampa il piano di ogni query; False se almeno una esegue una scansione completa."""
+    ensure_schema()
+    ok = True
+    with get_connection() as conn:
+        with closing(conn.cursor(dictionary=True)) as cur:
+            for label, query, params in _queries(anno, mese):
+                scans = full_scans(cur, query, params)
+                if scans:
+                    ok = False
+                    tabelle = ", ".join(str(row.get("table")) for row in scans)
+                    print(f"❌ {label}: scansione completa su {tabelle}")
+                else:
+                    print(f"✓ {label}: nessuna scansione completa")
+    return ok
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 3:
+        print("Uso: python check_query_plans.py <anno> <mese>")
+        sys.exit(2)
+    sys.exit(0 if check(int(sys.argv[1]), int(sys.argv[2])) else 1)
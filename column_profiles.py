@@ -0,0 +1,177 @@
+"""
+Profili di mappatura colonne per i report Excel.
+
+Per ogni tipo di report viene salvata, indicizzata con l'hash dell'intestazione, la
+corrispondenza tra campi logici (data, codice, colli...) e nomi reali delle colonne.
+Un layout già visto si risolve subito e sempre allo stesso modo; la ricerca fuzzy
+con `find_column` viene eseguita solo per i layout nuovi e il risultato salvato.
+
+Ogni profilo registra la versione dei parser che l'ha calcolato (`PARSER_VERSION`): i
+profili di versioni diverse vengono ignorati e ricalcolati. Il file è condiviso tra i
+processi dell'import parallelo, quindi ogni salvataggio rilegge l'archivio e vi unisce
+il nuovo profilo sotto un lock su file.
+"""
+import datetime
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Callable, Dict, Iterable, Iterator, Optional
+
+import pandas as pd
+
+from config import COLUMN_PROFILES_FILE
+from utils import normalize_string
+
+logger = logging.getLogger(__name__)
+
+ColumnMapping = Dict[str, Optional[str]]
+
+_LOCK_TIMEOUT_SECONDS = 10.0
+# Un lock più vecchio è rimasto da un processo terminato durante il salvataggio
+_LOCK_STALE_SECONDS = 60.0
+
+
+def header_signature(columns: Iterable[object]) -> str:
+    """Hash dell'intestazione: nomi colonna normalizzati, nell'ordine del file."""
+    joined = "\x1f".join(normalize_string(c) for c in columns)
+    return hashlib.sha1(joined.encode("utf-8")).hexdigest()
+
+
+@contextmanager
+def _file_lock(path: Path) -> Iterator[None]:
+    """Lock tra processi su `path`, tramite il file `<path>.lock` creato in modo esclusivo."""
+    lock_path = path.with_name(path.name + ".lock")
+    deadline = time.monotonic() + _LOCK_TIMEOUT_SECONDS
+    while True:
+        try:
+            fd = os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            break
+        except FileExistsError:
+            try:
+                if time.time() - lock_path.stat().st_mtime > _LOCK_STALE_SECONDS:
+                    lock_path.unlink(missing_ok=True)
+                    continue
+            except FileNotFoundError:
+                continue
+            if time.monotonic() > deadline:
+                raise TimeoutError(f"Lock {lock_path} non disponibile")
+            time.sleep(0.05)
+    os.close(fd)
+    try:
+        yield
+    finally:
+        lock_path.unlink(missing_ok=True)
+
+
+class ColumnProfileStore:
+    """Archivio JSON dei profili colonne: {tipo_report: {hash_intestazione: profilo}}."""
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = Path(path or COLUMN_PROFILES_FILE)
+        self._profiles: Optional[Dict[str, Dict[str, dict]]] = None
+
+    def _read(self) -> Dict[str, Dict[str, dict]]:
+        try:
+            with open(self.path, "r", encoding="utf-8") as fh:
+                return json.load(fh)
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as e:
+            logger.warning("Profili colonne non leggibili (%s), verranno ricreati: %s", self.path, e)
+            return {}
+
+    def _load(self, reload: bool = False) -> Dict[str, Dict[str, dict]]:
+        if self._profiles is None or reload:
+            self._profiles = self._read()
+        return self._profiles
+
+    def get(self, report_type: str, signature: str, version: int) -> Optional[ColumnMapping]:
+        """Mappatura salvata per l'intestazione, se calcolata dalla stessa versione dei parser."""
+        profile = self._load().get(report_type, {}).get(signature)
+        if profile is None:
+            # Il profilo può essere stato appena salvato da un altro processo
+            profile = self._load(reload=True).get(report_type, {}).get(signature)
+        if profile is None or profile.get("parser_version") != version:
+            return None
+        return dict(profile["columns"])
+
+    def put(
+        self,
+        report_type: str,
+        signature: str,
+        columns: Iterable[object],
+        mapping: ColumnMapping,
+        version: int,
+    ) -> None:
+        """Salva il profilo unendolo all'archivio su disco (gli altri profili restano invariati)."""
+        profile = {
+            "columns": mapping,
+            "header": [str(c) for c in columns],
+            "parser_version": version,
+            "created": datetime.datetime.now().isoformat(timespec="seconds"),
+        }
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            with _file_lock(self.path):
+                profiles = self._read()
+                profiles.setdefault(report_type, {})[signature] = profile
+                fd, tmp_name = tempfile.mkstemp(dir=self.path.parent, suffix=".tmp")
+                with os.fdopen(fd, "w", encoding="utf-8") as fh:
+                    json.dump(profiles, fh, ensure_ascii=False, indent=2)
+                os.replace(tmp_name, self.path)
+            self._profiles = profiles
+        except OSError as e:
+            logger.warning("Impossibile salvare i profili colonne in %s: %s", self.path, e)
+            self._load().setdefault(report_type, {})[signature] = profile
+
+    def resolve(
+        self,
+        df: pd.DataFrame,
+        report_type: str,
+        resolver: Callable[[pd.DataFrame], ColumnMapping],
+        version: int,
+    ) -> ColumnMapping:
+        """
+        Restituisce la mappatura colonne per l'intestazione di `df`.
+
+        Args:
+            df: DataFrame con le colonne del report
+            report_type: Tipo di report (es. "preparatori", "doppia_spunta")
+            resolver: Ricerca fuzzy usata solo per intestazioni mai viste
+            version: Versione dei parser (`PARSER_VERSION`); i profili di altre versioni
+                vengono ricalcolati
+
+        Returns:
+            Dizionario campo logico → nome colonna (None per i campi opzionali assenti)
+        """
+        signature = header_signature(df.columns)
+        mapping = self.get(report_type, signature, version)
+        if mapping is not None and all(col is None or col in df.columns for col in mapping.values()):
+            logger.debug("Profilo colonne %s riutilizzato (%s)", report_type, signature[:10])
+            return mapping
+
+        mapping = resolver(df)
+        logger.info("Nuovo profilo colonne %s (%s): %s", report_type, signature[:10], mapping)
+        self.put(report_type, signature, df.columns, mapping, version)
+        return mapping
+
+
+_default_store: Optional[ColumnProfileStore] = None
+
+
+def resolve_columns(
+    df: pd.DataFrame,
+    report_type: str,
+    resolver: Callable[[pd.DataFrame], ColumnMapping],
+    version: int,
+) -> ColumnMapping:
+    """Come `ColumnProfileStore.resolve`, usando l'archivio predefinito del processo."""
+    global _default_store
+    if _default_store is None:
+        _default_store = ColumnProfileStore()
+    return _default_store.resolve(df, report_type, resolver, version)
@@ -21,6 +21,36 @@ MYSQL_CONFIG_MAIN = {
 
 TABLE_NAME = "dati_produzione"
 
+# Pool di connessioni condiviso (db_pool.py): connessioni inattive mantenute per database
+# e secondi di inattività oltre i quali la connessione viene verificata prima dell'uso
+MYSQL_POOL_SIZE = int(os.getenv("APP_PREMI_DB_POOL_SIZE", "5"))
+MYSQL_POOL_CHECK_AFTER_SECONDS = float(os.getenv("APP_PREMI_DB_POOL_CHECK_AFTER", "5"))
+
+# Caricamento massivo (bulk_loader.py): gli import con almeno BULK_LOAD_MIN_ROWS righe passano
+# da una tabella temporanea di appoggio, caricata a blocchi di BULK_LOAD_CHUNK_SIZE righe
+BULK_LOAD_MIN_ROWS = int(os.getenv("APP_PREMI_BULK_MIN_ROWS", "5000"))
+BULK_LOAD_CHUNK_SIZE = int(os.getenv("APP_PREMI_BULK_CHUNK_SIZE", "1000"))
+# LOAD DATA LOCAL INFILE richiede anche local_infile=ON sul server; se rifiutato si usano gli INSERT a blocchi
+BULK_LOAD_LOCAL_INFILE = os.getenv("APP_PREMI_BULK_LOCAL_INFILE", "0") == "1"
+if BULK_LOAD_LOCAL_INFILE:
+    MYSQL_CONFIG["allow_local_infile"] = True
+
+# Anagrafica codici TIM (tim_registry.py): copia locale di codicegestionale + utente,
+# riletta da TIM quando è più vecchia di TIM_REGISTRY_MAX_AGE secondi
+TIM_REGISTRY_MAX_AGE = float(os.getenv("APP_PREMI_TIM_REGISTRY_MAX_AGE", "3600"))
+
+# ============== CACHE PARSING ==============
+# Risultati dei parser salvati su disco per i file Excel già importati (chiave: SHA-256 del file)
+PARSE_CACHE_DIR = os.getenv(
+    "APP_PREMI_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".app_premi", "parse_cache")
+)
+PARSE_CACHE_MAX_MB = int(os.getenv("APP_PREMI_CACHE_MAX_MB", "256"))
+
+# Profili di mappatura colonne per layout di report già visti
+COLUMN_PROFILES_FILE = os.getenv(
+    "APP_PREMI_COLUMN_PROFILES", os.path.join(os.path.expanduser("~"), ".app_premi", "column_profiles.json")
+)
+
 # ============== CONFIGURAZIONE GUI ==============
 WINDOW_CONFIG = {
     "width": 900,
@@ -8,13 +8,26 @@ import time
 import tkinter as tk
 from contextlib import closing
 from tkinter import messagebox, ttk
-from typing import Any, Dict, List, Optional, cast
+from typing import Any, Dict, List, Optional, Tuple, cast
 
 import mysql.connector
 
-from config import COLORS, FONTS, MYSQL_CONFIG, MYSQL_CONFIG_MAIN, TABLE_NAME
+from config import COLORS, FONTS, TABLE_NAME
 from database import load_nuove_aperture, save_nuove_aperture
+from db_pool import get_connection, get_tim_connection, log_pool_stats
+from sync_state import (
+    DayKey,
+    day_key,
+    dirty_days,
+    fetch_local_changes,
+    fetch_sync_state,
+    fetch_tim_signatures,
+    save_sync_state,
+    server_now,
+)
 from ui_components import create_button
+from tim_registry import TimCodice, fetch_codici_checksum, format_nominativo, get_tim_registry
+from utils import normalize_codice, period_range
 
 
 MONTH_CHOICES: List[tuple[str, Optional[int]]] = [
@@ -38,6 +51,119 @@ MONTH_LABEL_TO_VALUE: Dict[str, Optional[int]] = {
 }
 
 
+def build_dati_produzione_query(filters: Dict[str, Any]) -> Tuple[str, List[Any]]:
+    """Query della griglia dati con i filtri della vista (ricerca, attività, periodo)."""
+    query = (
+        "SELECT id, data, codice_preparatore, nome_preparatore, totale_colli, "
+        "penalita, tipo_attivita, tipo, ore_tim, ore_gestionale FROM "
+        f"{TABLE_NAME}"
+    )
+    conditions: List[str] = []
+    params: List[Any] = []
+
+    search_text = filters.get("search")
+    if search_text:
+        like = f"%{search_text}%"
+        conditions.append(
+            "(codice_preparatore LIKE %s OR nome_preparatore LIKE %s OR tipo_attivita LIKE %s)"
+        )
+        params.extend([like, like, like])
+
+    tipo_attivita = filters.get("tipo_attivita")
+    if tipo_attivita and tipo_attivita != "Tutti":
+        conditions.append("tipo_attivita = %s")
+        params.append(tipo_attivita)
+
+    if filters.get("use_date_filter"):
+        data_da = filters.get("data_da")
+        if data_da:
+            conditions.append("data >= %s")
+            params.append(data_da)
+
+        data_a = filters.get("data_a")
+        if data_a:
+            conditions.append("data <= %s")
+            params.append(data_a)
+    else:
+        anno = filters.get("anno")
+        mese = filters.get("mese")
+        if anno:
+            # Intervallo di date al posto di YEAR()/MONTH(): il filtro usa gli indici su data
+            inizio, fine = period_range(int(anno), int(mese) if mese else None)
+            conditions.append("data >= %s AND data < %s")
+            params.extend([inizio, fine])
+        elif mese:
+            conditions.append("MONTH(data) = %s")
+            params.append(mese)
+
+    if conditions:
+        query += " WHERE " + " AND ".join(conditions)
+
+    query += " ORDER BY data DESC, id DESC LIMIT 1000"
+    return query, params
+
+
+# Date per query verso TIM: una risincronizzazione annuale resta una dozzina di round trip
+TIM_DATE_CHUNK_SIZE = 31
+
+# Tipo attività locale -> descrizione del tipo attività in TIM
+TIPO_ATTIVITA_TIM: Dict[str, str] = {
+    "PICKING": "PICKING",
+    "CARRELLISTI": "CARRELLISTI",
+    "RICEVITORI": "MAG. RICEVIMENTO",
+    "DOPPIA_SPUNTA": "DOPPIA SPUNTA",
+}
+
+
+def build_durate_utenti_query(
+    date: List[str], utenti: List[str], tipi_attivita_id: List[str]
+) -> Tuple[str, List[Any]]:
+    """
+    Query TIM delle durate per utente, tipo attività e data.
+
+    Codici e validità sono risolti in locale con l'anagrafica `tim_registry`: a TIM si
+    chiedono solo le somme di `attivita` per gli utenti coinvolti, un blocco di date per query.
+    """
+    date_placeholders = ", ".join(["%s"] * len(date))
+    utenti_placeholders = ", ".join(["%s"] * len(utenti))
+    tipo_placeholders = ", ".join(["%s"] * len(tipi_attivita_id))
+    query = f"""
+        SELECT a.utente_id,
+               a.tipo_attivita_id,
+               a.data_riferimento,
+               COALESCE(SUM(a.durata), 0) AS durata_totale
+        FROM attivita a
+        WHERE a.utente_id IN ({utenti_placeholders})
+          AND a.tipo_attivita_id IN ({tipo_placeholders})
+          AND a.data_riferimento IN ({date_placeholders})
+        GROUP BY a.utente_id, a.tipo_attivita_id, a.data_riferimento
+    """
+    params: List[Any] = [*utenti, *tipi_attivita_id, *date]
+    return query, params
+
+
+def build_sync_scope(
+    codici: List[str], tipi_attivita: List[str], data_min: str, data_max: str
+) -> Tuple[str, List[Any]]:
+    """
+    Condizione SQL che limita le fasi della sincronizzazione alle righe sincronizzate.
+
+    Codici normalizzati, tipi attività locali e intervallo di date vengono dalle righe
+    lette con i filtri della vista: lettura colli e controlli anomalie scalano con il
+    periodo sincronizzato invece che con l'intera tabella (indice `idx_codice_norm`).
+    """
+    if not codici or not tipi_attivita:
+        return "1 = 0", []
+    code_placeholders = ", ".join(["%s"] * len(codici))
+    tipo_placeholders = ", ".join(["%s"] * len(tipi_attivita))
+    condition = (
+        f"codice_norm IN ({code_placeholders}) "
+        f"AND tipo_attivita IN ({tipo_placeholders}) "
+        "AND data >= %s AND data <= %s"
+    )
+    return condition, [*codici, *tipi_attivita, data_min, data_max]
+
+
 class DataViewer:
     """Visualizzatore dati in stile Excel con funzionalità di ricerca e filtro."""
 
@@ -64,9 +190,11 @@ class DataViewer:
         self.data_da_var = tk.StringVar()
         self.data_a_var = tk.StringVar()
         self.use_date_filter_var = tk.BooleanVar(value=False)
+        self.full_resync_var = tk.BooleanVar(value=False)
         self.anno_var = tk.StringVar(value=str(today.year))
         self.mese_var = tk.StringVar(value=MONTH_CHOICES[today.month][0])
         self._sync_in_progress = False
+        self._sync_force = False
         self._last_filters = None
         self._stats_text_before_sync = ""
 
@@ -322,6 +450,13 @@ class DataViewer:
         self.sync_button.configure(state=tk.NORMAL)
         self.sync_button.pack(side="right", padx=10, pady=10)
 
+        # Di norma si sincronizzano solo i giorni modificati dall'ultima volta
+        ttk.Checkbutton(
+            footer_frame,
+            text="Risincronizza tutto",
+            variable=self.full_resync_var,
+        ).pack(side="right", padx=(10, 0), pady=10)
+
         # Pulsante nuove aperture (visibile solo per Doppia Spunta)
         self.nuove_aperture_button = create_button(
             footer_frame,
@@ -386,53 +521,9 @@ class DataViewer:
             for item in self.tree.get_children():
                 self.tree.delete(item)
 
-            query = (
-                "SELECT id, data, codice_preparatore, nome_preparatore, totale_colli, "
-                "penalita, tipo_attivita, tipo, ore_tim, ore_gestionale FROM "
-                f"{TABLE_NAME}"
-            )
-            conditions: List[str] = []
-            params: List[str] = []
-
-            search_text = filters.get("search")
-            if search_text:
-                like = f"%{search_text}%"
-                conditions.append(
-                    "(codice_preparatore LIKE %s OR nome_preparatore LIKE %s OR tipo_attivita LIKE %s)"
-                )
-                params.extend([like, like, like])
-
-            tipo_attivita = filters.get("tipo_attivita")
-            if tipo_attivita and tipo_attivita != "Tutti":
-                conditions.append("tipo_attivita = %s")
-                params.append(tipo_attivita)
-
-            if filters.get("use_date_filter"):
-                data_da = filters.get("data_da")
-                if data_da:
-                    conditions.append("data >= %s")
-                    params.append(data_da)
-
-                data_a = filters.get("data_a")
-                if data_a:
-                    conditions.append("data <= %s")
-                    params.append(data_a)
-            else:
-                anno = filters.get("anno")
-                if anno:
-                    conditions.append("YEAR(data) = %s")
-                    params.append(str(anno))
-                mese = filters.get("mese")
-                if mese:
-                    conditions.append("MONTH(data) = %s")
-                    params.append(str(mese))
-
-            if conditions:
-                query += " WHERE " + " AND ".join(conditions)
-
-            query += " ORDER BY data DESC, id DESC LIMIT 1000"
+            query, params = build_dati_produzione_query(filters)
 
-            with closing(mysql.connector.connect(**MYSQL_CONFIG)) as conn:
+            with get_connection() as conn:
                 with closing(conn.cursor(dictionary=True)) as cur:
                     cur.execute(query, params)
                     rows = cast(List[Dict[str, Any]], cur.fetchall())
@@ -630,7 +721,7 @@ class DataViewer:
         print(f"{'='*60}\n")
         
         try:
-            with closing(mysql.connector.connect(**MYSQL_CONFIG)) as conn:
+            with get_connection() as conn:
                 with closing(conn.cursor()) as cursor:
                     cursor.execute(query, params)
                     negozi = [row[0] for row in cursor.fetchall()]
@@ -827,6 +918,7 @@ class DataViewer:
             return
 
         self._sync_in_progress = True
+        self._sync_force = self.full_resync_var.get()
         self._stats_text_before_sync = self.stats_label.cget("text")
         self.sync_button.config(state="disabled")
         
@@ -882,7 +974,7 @@ class DataViewer:
     def _sync_background(self) -> None:
         """Esegue la sincronizzazione fuori dal thread GUI."""
         self._sync_start_time = time.time()
-        result = self._perform_sync_with_progress()
+        result = self._perform_sync_with_progress(force=self._sync_force)
         result['elapsed_time'] = time.time() - self._sync_start_time
         self.window.after(0, lambda: self._on_sync_complete(result))
     def _update_progress(self, percent: float) -> None:
@@ -893,14 +985,22 @@ class DataViewer:
                 self.sync_progress_label.config(text=f"{percent}% - {elapsed}s trascorsi")
         self.window.after(0, update)
 
-    def _perform_sync_with_progress(self) -> Dict[str, Any]:
-        """Logica di sincronizzazione con avanzamento progressivo."""
+    def _perform_sync_with_progress(self, force: bool = False) -> Dict[str, Any]:
+        """
+        Logica di sincronizzazione con avanzamento progressivo.
+
+        Sincronizza solo i giorni modificati dall'ultima sincronizzazione (in locale o in
+        TIM); con `force` li riconcilia tutti.
+        """
         
         # Step 1: Leggi i codici e tipi da dati_produzione CON I FILTRI APPLICATI
         local_records = []
         try:
-            with closing(mysql.connector.connect(**MYSQL_CONFIG)) as local_conn:
+            with get_connection() as local_conn:
                 with closing(local_conn.cursor(dictionary=True)) as local_cursor:
+                    # Letta prima dei dati: le modifiche successive restano da sincronizzare
+                    sync_start = server_now(local_cursor)
+
                     # Costruisci query con gli stessi filtri della visualizzazione
                     query = """
                         SELECT DISTINCT codice_preparatore, tipo_attivita, data, nome_preparatore
@@ -911,6 +1011,8 @@ class DataViewer:
                     """
                     conditions: List[str] = []
                     params: List[Any] = []
+                    # Con filtri per operatore si riconciliano solo alcune righe dei giorni
+                    filtro_operatori = False
                     
                     # Applica gli stessi filtri della visualizzazione
                     if self._last_filters:
@@ -923,9 +1025,11 @@ class DataViewer:
                         if self._last_filters.get("codice"):
                             conditions.append("LOWER(codice_preparatore) LIKE LOWER(%s)")
                             params.append(f"%{self._last_filters['codice']}%")
+                            filtro_operatori = True
                         if self._last_filters.get("nome"):
                             conditions.append("LOWER(nome_preparatore) LIKE LOWER(%s)")
                             params.append(f"%{self._last_filters['nome']}%")
+                            filtro_operatori = True
                         tipo_filter = self._last_filters.get("tipo_attivita")
                         if tipo_filter and tipo_filter != "Tutti":
                             conditions.append("tipo_attivita = %s")
@@ -934,6 +1038,7 @@ class DataViewer:
                         if search_term:
                             conditions.append("(LOWER(codice_preparatore) LIKE LOWER(%s) OR LOWER(nome_preparatore) LIKE LOWER(%s))")
                             params.extend([f"%{search_term}%", f"%{search_term}%"])
+                            filtro_operatori = True
                     
                     if conditions:
                         query += " AND " + " AND ".join(conditions)
@@ -956,6 +1061,64 @@ class DataViewer:
                 "mapping_warning": False,
             }
 
+        # Step 2: Giorni da sincronizzare (modificati in locale o in TIM dall'ultima volta)
+        giorni = {
+            day_key(rec["data"], rec["tipo_attivita"])
+            for rec in local_records
+            if rec.get("tipo_attivita") in TIPO_ATTIVITA_TIM
+        }
+        date_giorni = sorted({data for data, _ in giorni})
+        tipi_giorni = sorted({tipo for _, tipo in giorni})
+
+        firme_tim: Dict[DayKey, str] = {}
+        checksum_codici: Optional[int] = None
+        try:
+            with get_tim_connection() as tim_conn:
+                with closing(tim_conn.cursor(dictionary=True)) as tim_cursor:
+                    checksum_codici = fetch_codici_checksum(tim_cursor)
+                    firme_per_tipo_tim = fetch_tim_signatures(
+                        tim_cursor,
+                        date_giorni,
+                        sorted({TIPO_ATTIVITA_TIM[t] for t in tipi_giorni}),
+                        checksum_codici,
+                    )
+            for data, tipo in giorni:
+                firma = firme_per_tipo_tim.get((data, TIPO_ATTIVITA_TIM[tipo]))
+                if firma is not None:
+                    firme_tim[(data, tipo)] = firma
+        except mysql.connector.Error as err:
+            # Senza firma TIM ogni giorno viene considerato da sincronizzare
+            print(f"⚠️ Firma attività TIM non disponibile ({err}): sincronizzo tutti i giorni")
+
+        giorni_da_sincronizzare = giorni
+        if not force:
+            try:
+                with get_connection() as state_conn:
+                    with closing(state_conn.cursor(dictionary=True)) as state_cursor:
+                        modifiche_locali = fetch_local_changes(state_cursor, date_giorni, tipi_giorni)
+                        stato = fetch_sync_state(state_cursor, date_giorni, tipi_giorni)
+            except mysql.connector.Error as err:
+                return {
+                    "success": False,
+                    "message": f"Errore durante la lettura dello stato di sincronizzazione:\n{err}",
+                }
+            giorni_da_sincronizzare = dirty_days(giorni, modifiche_locali, firme_tim, stato)
+            print(f"🔎 Giorni da sincronizzare: {len(giorni_da_sincronizzare)} su {len(giorni)}")
+            local_records = [
+                rec for rec in local_records
+                if day_key(rec["data"], rec["tipo_attivita"]) in giorni_da_sincronizzare
+            ]
+            if not local_records:
+                return {
+                    "success": True,
+                    "no_data": True,
+                    "up_to_date": True,
+                    "updated": 0,
+                    "non_mapped": [],
+                    "non_mapped_details": [],
+                    "mapping_warning": False,
+                }
+
         aggiornati = 0
         non_trovati_dettaglio: List[Dict[str, Any]] = []  # Codici non trovati in TIM
         anomalie_ore_count = 0
@@ -965,22 +1128,22 @@ class DataViewer:
         local_nome_map: Dict[tuple[str, str, str], str] = {}
 
         # Import per anomalie
-        from database import insert_anomalia
+        from database import write_anomalie_sync
+        # Anomalie raccolte durante la sincronizzazione e scritte in blocco alla fine
+        anomalie_batch: List[Dict[str, Any]] = []
         today = datetime.date.today()
 
         # Step 3: OTTIMIZZAZIONE - Recupera TUTTE le durate da TIM in una query
         try:
-            with closing(mysql.connector.connect(**MYSQL_CONFIG)) as app_conn:
+            with get_connection() as app_conn:
                 with closing(app_conn.cursor(dictionary=True)) as app_cursor:
                     # Mappa tipo_attivita locale -> tipo_attivita_id TIM
-                    tipo_mapping = {
-                        "PICKING": "PICKING",
-                        "CARRELLISTI": "CARRELLISTI",
-                        "RICEVITORI": "MAG. RICEVIMENTO",
-                        "DOPPIA_SPUNTA": "DOPPIA SPUNTA"
-                    }
+                    tipo_mapping = TIPO_ATTIVITA_TIM
                     
-                    with closing(mysql.connector.connect(**MYSQL_CONFIG_MAIN)) as tim_conn:
+                    # Anagrafica codici TIM locale (riletta da TIM se scaduta o cambiata)
+                    registry = get_tim_registry(checksum_codici=checksum_codici)
+
+                    with get_tim_connection() as tim_conn:
                         with closing(tim_conn.cursor(dictionary=True)) as tim_cursor:
                             
                             print("🚀 Recupero TUTTE le durate da TIM in una query...")
@@ -1006,63 +1169,61 @@ class DataViewer:
                                 
                                 tipo_tim = tipo_mapping.get(tipo_locale)
                                 if tipo_tim:
-                                    key = (codice.upper(), tipo_tim, str(data_rif))
+                                    key = (normalize_codice(codice), tipo_tim, str(data_rif))
                                     codici_date.add(key)
                                     if nome_locale:
                                         nome_str = str(nome_locale).strip()
                                         if nome_str:
                                             local_nome_map.setdefault(key, nome_str)
                             
-                            # Query batch per tutte le durate (ottimizzato per data)
+                            # Query batch per tutte le durate (una query per blocco di date)
                             durate_map: Dict[tuple[str, str, str], Dict[str, Any]] = {}
 
-                            codici_unici = sorted({cod.upper() for cod, _, _ in codici_date})
+                            codici_unici = sorted({cod for cod, _, _ in codici_date})
                             tipi_unici = sorted({tipo for _, tipo, _ in codici_date})
                             date_uniche = sorted({data for _, _, data in codici_date})
 
                             if codici_unici and tipi_unici and date_uniche:
-                                codici_lower = [c.lower() for c in codici_unici]
-                                code_placeholders = ", ".join(["%s"] * len(codici_lower))
-                                tipo_placeholders = ", ".join(["%s"] * len(tipi_unici))
-
-                                durate_query = f"""
-                                    SELECT LOWER(cg.codice) AS codice,
-                                           ta.descrizione AS tipo,
-                                           %s AS data_riferimento,
-                                           u.nome,
-                                           u.cognome,
-                                           COALESCE(SUM(a.durata), 0) AS durata_totale
-                                    FROM codicegestionale cg
-                                    JOIN utente u ON cg.utente_id = u.id
-                                    JOIN tipoattivita ta ON cg.tipo_attivita_id = ta.id
-                                    LEFT JOIN attivita a ON a.utente_id = u.id
-                                        AND a.tipo_attivita_id = ta.id
-                                        AND a.data_riferimento = %s
-                                    WHERE LOWER(cg.codice) IN ({code_placeholders})
-                                      AND ta.descrizione IN ({tipo_placeholders})
-                                      AND %s BETWEEN cg.valido_dal AND COALESCE(cg.valido_al, '9999-12-31')
-                                    GROUP BY codice, tipo, u.nome, u.cognome
-                                """
-
-                                for data_str in date_uniche:
-                                    params: List[Any] = [data_str, data_str]
-                                    params.extend(codici_lower)
-                                    params.extend(tipi_unici)
-                                    params.append(data_str)
-
-                                    tim_cursor.execute(durate_query, params)
-                                    rows = cast(List[Dict[str, Any]], tim_cursor.fetchall())
-
-                                    for row in rows:
-                                        codice_res = str(row.get("codice") or "").upper()
-                                        tipo_res = str(row.get("tipo") or "")
-                                        key = (codice_res, tipo_res, data_str)
-                                        durata_totale = row.get("durata_totale") or 0
-                                        durate_map[key] = {
-                                            "nome": str(row.get("nome") or "").strip(),
-                                            "cognome": str(row.get("cognome") or "").strip(),
-                                            "durata": float(durata_totale),
-                                        }
+                                # Codice -> utente valido per ogni data dall'anagrafica locale
+                                abbinamenti: Dict[tuple[str, str, str], TimCodice] = {}
+                                for codice in codici_unici:
+                                    for tipo_tim in tipi_unici:
+                                        for data_str in date_uniche:
+                                            trovato = registry.resolve(codice, tipo_tim, data_str)
+                                            if trovato:
+                                                abbinamenti[(codice, tipo_tim, data_str)] = trovato
+
+                                utenti = sorted({c.utente_id for c in abbinamenti.values()})
+                                tipi_id = sorted({c.tipo_attivita_id for c in abbinamenti.values()})
+                                durate_utenti: Dict[tuple[str, str, str], float] = {}
+
+                                if utenti:
+                                    for start in range(0, len(date_uniche), TIM_DATE_CHUNK_SIZE):
+                                        date_chunk = date_uniche[start:start + TIM_DATE_CHUNK_SIZE]
+                                        durate_query, params = build_durate_utenti_query(
+                                            date_chunk, utenti, tipi_id
+                                        )
+                                        tim_cursor.execute(durate_query, params)
+                                        rows = cast(List[Dict[str, Any]], tim_cursor.fetchall())
+
+                                        for row in rows:
+                                            data_res = row.get("data_riferimento")
+                                            data_str = (
+                                                data_res.strftime("%Y-%m-%d")
+                                                if hasattr(data_res, "strftime")
+                                                else str(data_res)
+                                            )
+                                            key_utente = (str(row["utente_id"]), str(row["tipo_attivita_id"]), data_str)
+                                            durate_utenti[key_utente] = float(row.get("durata_totale") or 0)
+
+                                for key, trovato in abbinamenti.items():
+                                    durate_map[key] = {
+                                        "nome": trovato.nome,
+                                        "cognome": trovato.cognome,
+                                        "durata": durate_utenti.get(
+                                            (trovato.utente_id, trovato.tipo_attivita_id, key[2]), 0.0
+                                        ),
+                                    }
 
                                 # Identifica codici mancanti (anomalia tipo 1)
                                 missing_keys = codici_date - set(durate_map.keys())
@@ -1085,7 +1246,7 @@ class DataViewer:
                                     except ValueError:
                                         data_anomalia = today
                                     
-                                    insert_anomalia(
+                                    anomalie_batch.append(dict(
                                         tipo_anomalia="CODICE_NON_ABBINATO",
                                         data_rilevamento=data_anomalia,
                                         codice_preparatore=codice,
@@ -1094,17 +1255,32 @@ class DataViewer:
                                         ore_tim=None,
                                         dettagli=f"Data: {data_str} - Codice non trovato in TIM",
                                         note=None,
-                                    )
+                                    ))
 
                             print(f"✅ Recuperate durate per {len(durate_map)} combinazioni codice/tipo/data")
                             
-                            # Recupera TUTTI i colli in una query
-                            print("🚀 Recupero TUTTI i colli locali...")
+                            # Le fasi successive leggono solo codici, attività e date sincronizzati
+                            tipi_locali = sorted(
+                                locale for locale, tim in tipo_mapping.items() if tim in tipi_unici
+                            )
+                            scope_sql, scope_params = build_sync_scope(
+                                codici_unici,
+                                tipi_locali,
+                                date_uniche[0] if date_uniche else "",
+                                date_uniche[-1] if date_uniche else "",
+                            )
+
+                            # Recupera i colli del periodo sincronizzato in una query
+                            print("🚀 Recupero i colli locali del periodo sincronizzato...")
                             
-                            app_cursor.execute("""
+                            app_cursor.execute(
+                                f"""
                                 SELECT codice_preparatore, tipo_attivita, data, tipo, totale_colli
                                 FROM dati_produzione
-                            """)
+                                WHERE {scope_sql}
+                                """,
+                                scope_params,
+                            )
                             all_records = cast(List[Dict[str, Any]], app_cursor.fetchall())
                             
                             # Raggruppa per (codice, tipo_attivita, data)
@@ -1118,7 +1294,7 @@ class DataViewer:
                                 
                                 tipo_tim = tipo_mapping.get(tipo_att)
                                 if codice and tipo_tim and data:
-                                    key = (codice.upper(), tipo_tim, data)
+                                    key = (normalize_codice(codice), tipo_tim, data)
                                     if key not in colli_map:
                                         colli_map[key] = []
                                     colli_map[key].append((codice, tipo_att, tipo_negozio, colli))
@@ -1140,17 +1316,8 @@ class DataViewer:
                                 ore_tim = float(tim_data['durata'])
                                 if ore_tim > 0 and key not in colli_map:
                                     # Anomalia: ore registrate in TIM ma nessuna produzione locale
-                                    nome = tim_data['nome'].strip()
-                                    cognome = tim_data['cognome'].strip()
                                     # Formato: "COGNOME NOME"
-                                    if cognome and nome:
-                                        nominativo = f"{cognome.upper()} {nome.upper()}"
-                                    elif cognome:
-                                        nominativo = cognome.upper()
-                                    elif nome:
-                                        nominativo = nome.upper()
-                                    else:
-                                        nominativo = ""
+                                    nominativo = format_nominativo(tim_data['nome'], tim_data['cognome'])
                                     
                                     ore_tim_decimal = ore_tim / 60.0  # Converti minuti in ore
                                     
@@ -1160,7 +1327,7 @@ class DataViewer:
                                     except ValueError:
                                         data_anomalia = today
                                     
-                                    insert_anomalia(
+                                    anomalie_batch.append(dict(
                                         tipo_anomalia="ORE_SENZA_PRODUZIONE",
                                         data_rilevamento=data_anomalia,
                                         codice_preparatore=codice_upper,
@@ -1169,7 +1336,7 @@ class DataViewer:
                                         ore_tim=ore_tim_decimal,
                                         dettagli=f"Data: {data_str} - {ore_tim} minuti ({ore_tim_decimal:.2f} ore) in TIM ma nessuna produzione locale",
                                         note=None
-                                    )
+                                    ))
                                     anomalie_ore_count += 1
                                     
                                     print(f"  ⚠️ Anomalia: {codice_upper} ({tipo_tim}) - {ore_tim} min in TIM, 0 colli locali (data: {data_str})")
@@ -1185,30 +1352,21 @@ class DataViewer:
                                 if not tim_data:
                                     continue
                                 
-                                nome = tim_data['nome'].strip()
-                                cognome = tim_data['cognome'].strip()
                                 # Formato: "COGNOME NOME"
-                                if cognome and nome:
-                                    nominativo = f"{cognome.upper()} {nome.upper()}"
-                                elif cognome:
-                                    nominativo = cognome.upper()
-                                elif nome:
-                                    nominativo = nome.upper()
-                                else:
-                                    nominativo = ""
+                                nominativo = format_nominativo(tim_data['nome'], tim_data['cognome'])
                                 durata_totale = float(tim_data['durata'])
                                 
                                 # Calcola totale colli
                                 totale_colli_globale = sum(float(r[3] or 0) for r in records_list)
                                 
                                 # Proporziona per ogni negozio
-                                for codice_orig, tipo_att, tipo_negozio, colli in records_list:
+                                for _, tipo_att, tipo_negozio, colli in records_list:
                                     if totale_colli_globale > 0:
                                         ore_prop = round((durata_totale * float(colli or 0)) / totale_colli_globale / 60.0, 2)
                                     else:
                                         ore_prop = 0.0
                                     
-                                    updates_batch.append((nominativo, ore_prop, codice_orig, tipo_att, data_str, tipo_negozio))
+                                    updates_batch.append((nominativo, ore_prop, codice_upper, tipo_att, data_str, tipo_negozio))
                                 
                                 if idx % 100 == 0:
                                     percent = int((idx + 1) / len(colli_map) * 100)
@@ -1220,8 +1378,9 @@ class DataViewer:
                             update_query = """
                                 UPDATE dati_produzione
                                 SET nome_preparatore = %s,
-                                    ore_tim = %s
-                                WHERE LOWER(codice_preparatore) = LOWER(%s)
+                                    ore_tim = %s,
+                                    updated_at = updated_at
+                                WHERE codice_norm = %s
                                   AND tipo_attivita = %s
                                   AND data = %s
                                   AND tipo = %s
@@ -1230,156 +1389,29 @@ class DataViewer:
                             app_cursor.executemany(update_query, updates_batch)
                             aggiornati = app_cursor.rowcount
                             
-                            # GENERA ANOMALIE X/XX per TUTTE le attività dopo il sync
-                            print(f"\n🔍 Controllo anomalie X/XX per tutte le attività...")
-                            
-                            # Query per raggruppare per data+codice+tipo_attivita e sommare ore
-                            # ESCLUDE i record con ore_tim = 0 (che generano PRODUZIONE_SENZA_ORE)
-                            check_query = """
-                                SELECT data, 
-                                       codice_preparatore, 
-                                       tipo_attivita,
-                                       SUM(CAST(ore_tim AS DECIMAL(10,2))) as ore_tim_totali, 
-                                       SUM(CAST(ore_gestionale AS DECIMAL(10,2))) as ore_gestionale_totali,
-                                       GROUP_CONCAT(DISTINCT tipo ORDER BY tipo SEPARATOR ', ') as tipi
-                                FROM dati_produzione
-                                WHERE ore_tim IS NOT NULL
-                                  AND ore_tim > 0
-                                  AND ore_gestionale IS NOT NULL
-                                GROUP BY data, codice_preparatore, tipo_attivita
-                                HAVING ABS((ore_gestionale_totali - ore_tim_totali) * 60) >= 60
-                            """
-                            
-                            app_cursor.execute(check_query)
-                            records_con_diff = app_cursor.fetchall()
-                            
-                            print(f"  Trovati {len(records_con_diff)} giorni con differenza >= 60 min")
-                            
-                            for row in records_con_diff:
-                                # Row è un dizionario con dati aggregati
-                                data = row['data']
-                                codice = row['codice_preparatore']
-                                tipo_attivita = row['tipo_attivita']
-                                tipi = row['tipi']  # Lista dei tipi (ST, AP, CM)
-                                ore_tim_totali = row['ore_tim_totali']
-                                ore_gestionale_totali = row['ore_gestionale_totali']
-                                
-                                # Recupera nome e cognome da durate_map (da TIM)
-                                data_str = data.strftime('%Y-%m-%d') if hasattr(data, 'strftime') else str(data)
-                                durata_info = durate_map.get((codice.upper(), tipo_attivita, data_str))
-                                
-                                nome_formattato = None
-                                if durata_info:
-                                    nome_tim = durata_info.get("nome", "").strip()
-                                    cognome_tim = durata_info.get("cognome", "").strip()
-                                    if cognome_tim and nome_tim:
-                                        nome_formattato = f"{cognome_tim.upper()} {nome_tim.upper()}"
-                                    elif cognome_tim:
-                                        nome_formattato = cognome_tim.upper()
-                                    elif nome_tim:
-                                        nome_formattato = nome_tim.upper()
-                                
-                                # Converti Decimal in float
-                                ore_tim_val = float(ore_tim_totali) if ore_tim_totali is not None else 0.0
-                                ore_gestionale_val = float(ore_gestionale_totali) if ore_gestionale_totali is not None else 0.0
-                                differenza_minuti = (ore_gestionale_val - ore_tim_val) * 60
-                                differenza_assoluta = abs(differenza_minuti)
-                                
-                                if differenza_assoluta >= 120:
-                                    # Anomalia XX - differenza > 120 min
-                                    from database import insert_anomalia
-                                    insert_anomalia(
-                                        tipo_anomalia='DIFFERENZA_>120',
-                                        data_rilevamento=data,
-                                        codice_preparatore=codice,
-                                        nome_preparatore=nome_formattato,
-                                        tipo_attivita=tipo_attivita,
-                                        ore_tim=ore_tim_val,
-                                        dettagli=f"Data: {data_str} - Ore TIM: {ore_tim_val:.2f}h, Ore Gestionale: {ore_gestionale_val:.2f}h - Differenza: {differenza_minuti:+.0f} min - Tipi: {tipi}"
-                                    )
-                                    anomalie_x_xx_count += 1
-                                    print(f"  ⚠️ XX: {codice} ({nome_formattato}) {data_str} - {differenza_minuti:+.0f} min (TIM: {ore_tim_val:.2f}h, Gest: {ore_gestionale_val:.2f}h)")
-                                elif differenza_assoluta >= 60:
-                                    # Anomalia X - differenza 60-120 min
-                                    from database import insert_anomalia
-                                    insert_anomalia(
-                                        tipo_anomalia='DIFFERENZA_60_120',
-                                        data_rilevamento=data,
-                                        codice_preparatore=codice,
-                                        nome_preparatore=nome_formattato,
-                                        tipo_attivita=tipo_attivita,
-                                        ore_tim=ore_tim_val,
-                                        dettagli=f"Data: {data_str} - Ore TIM: {ore_tim_val:.2f}h, Ore Gestionale: {ore_gestionale_val:.2f}h - Differenza: {differenza_minuti:+.0f} min - Tipi: {tipi}"
-                                    )
-                                    anomalie_x_xx_count += 1
-                                    print(f"  ⚠️ X: {codice} ({nome_formattato}) {data_str} - {differenza_minuti:+.0f} min (TIM: {ore_tim_val:.2f}h, Gest: {ore_gestionale_val:.2f}h)")
-                            
-                            print(f"✅ Anomalie X/XX generate: {anomalie_x_xx_count}")
-                            
-                            # GENERA ANOMALIE PRODUZIONE_SENZA_ORE (0 ore TIM ma con ore gestionale)
-                            print(f"\n🔍 Controllo anomalie PRODUZIONE_SENZA_ORE...")
-                            
-                            produzione_senza_ore_query = """
-                                SELECT data, 
-                                       codice_preparatore, 
-                                       tipo_attivita,
-                                       SUM(CAST(ore_gestionale AS DECIMAL(10,2))) as ore_gestionale_totali,
-                                       GROUP_CONCAT(DISTINCT tipo ORDER BY tipo SEPARATOR ', ') as tipi
-                                FROM dati_produzione
-                                WHERE (ore_tim IS NULL OR ore_tim = 0)
-                                  AND ore_gestionale > 0
-                                GROUP BY data, codice_preparatore, tipo_attivita
-                            """
-                            
-                            app_cursor.execute(produzione_senza_ore_query)
-                            records_senza_tim = app_cursor.fetchall()
-                            
-                            print(f"  Trovati {len(records_senza_tim)} giorni con produzione senza ore TIM")
-                            
-                            anomalie_senza_ore_count = 0
-                            for row in records_senza_tim:
-                                data = row['data']
-                                codice = row['codice_preparatore']
-                                tipo_attivita = row['tipo_attivita']
-                                tipi = row['tipi']
-                                ore_gestionale_totali = row['ore_gestionale_totali']
-                                
-                                # Recupera nome da durate_map (da TIM)
-                                data_str = data.strftime('%Y-%m-%d') if hasattr(data, 'strftime') else str(data)
-                                durata_info = durate_map.get((codice.upper(), tipo_attivita, data_str))
-                                
-                                # SALTA se il codice non è in TIM (già generato CODICE_NON_ABBINATO)
-                                if not durata_info:
-                                    print(f"  ⏭️ SKIP: {codice} {data_str} - già gestito da CODICE_NON_ABBINATO")
-                                    continue
-                                
-                                nome_formattato = None
-                                nome_tim = durata_info.get("nome", "").strip()
-                                cognome_tim = durata_info.get("cognome", "").strip()
-                                if cognome_tim and nome_tim:
-                                    nome_formattato = f"{cognome_tim.upper()} {nome_tim.upper()}"
-                                elif cognome_tim:
-                                    nome_formattato = cognome_tim.upper()
-                                elif nome_tim:
-                                    nome_formattato = nome_tim.upper()
-                                
-                                # Converti Decimal in float
-                                ore_gestionale_val = float(ore_gestionale_totali) if ore_gestionale_totali is not None else 0.0
-                                
-                                from database import insert_anomalia
-                                insert_anomalia(
-                                    tipo_anomalia='PRODUZIONE_SENZA_ORE',
-                                    data_rilevamento=data,
-                                    codice_preparatore=codice,
-                                    nome_preparatore=nome_formattato,
-                                    tipo_attivita=tipo_attivita,
-                                    ore_tim=0.0,
-                                    dettagli=f"Data: {data_str} - Ore TIM: 0.00h, Ore Gestionale: {ore_gestionale_val:.2f}h - Tipi: {tipi}"
+                            # Anomalie X/XX e PRODUZIONE_SENZA_ORE: una INSERT ... SELECT per regola,
+                            # scritte insieme alle anomalie raccolte sopra nella stessa transazione
+                            print(f"\n🔍 Controllo anomalie X/XX e PRODUZIONE_SENZA_ORE...")
+                            conteggi = write_anomalie_sync(
+                                app_cursor, anomalie_batch, scope_sql, scope_params, TIPO_ATTIVITA_TIM
+                            )
+                            anomalie_x_xx_count = conteggi["DIFFERENZA_60_120"] + conteggi["DIFFERENZA_>120"]
+                            anomalie_senza_ore_count = conteggi["PRODUZIONE_SENZA_ORE"]
+                            print(
+                                f"✅ Anomalie X: {conteggi['DIFFERENZA_60_120']}, XX: {conteggi['DIFFERENZA_>120']}, "
+                                f"PRODUZIONE_SENZA_ORE: {anomalie_senza_ore_count}"
+                            )
+                            print(f"✅ Anomalie scritte in blocco: {conteggi['totale']}")
+
+                            # Lo stato è per giorno intero: con filtri per operatore gli altri
+                            # operatori degli stessi giorni non sono stati riconciliati
+                            if filtro_operatori:
+                                print("ℹ️ Sincronizzazione filtrata per operatore: stato giorni non aggiornato")
+                            else:
+                                giorni_salvati = save_sync_state(
+                                    app_cursor, giorni_da_sincronizzare, sync_start, firme_tim
                                 )
-                                anomalie_senza_ore_count += 1
-                                print(f"  ⚠️ PRODUZIONE_SENZA_ORE: {codice} ({nome_formattato}) {data_str} - Gest: {ore_gestionale_val:.2f}h - Tipi: {tipi}")
-                            
-                            print(f"✅ Anomalie PRODUZIONE_SENZA_ORE generate: {anomalie_senza_ore_count}")
+                                print(f"✅ Stato sincronizzazione aggiornato per {giorni_salvati} giorni")
 
                     app_conn.commit()
                     print(f"✅ Aggiornati {aggiornati} record!")
@@ -1396,6 +1428,7 @@ class DataViewer:
         # Log fine sincronizzazione
         log_final = f"\n{'='*60}\nFINE SINCRONIZZAZIONE\nRecord aggiornati: {aggiornati}\nRecord non trovati: {len(non_trovati_dettaglio)}\nAnomalie X/XX: {anomalie_x_xx_count}\nAnomalie PRODUZIONE_SENZA_ORE: {anomalie_senza_ore_count}\nTotale anomalie generate: {totale_anomalie}\n{'='*60}\n"
         print(log_final)
+        log_pool_stats()
         
         # Scrivi su file
         try:
@@ -1445,7 +1478,9 @@ class DataViewer:
             seconds = int(elapsed_seconds % 60)
             time_str = f"{minutes}m {seconds}s" if minutes > 0 else f"{seconds}s"
 
-            if result.get("no_data"):
+            if result.get("up_to_date"):
+                message = "Nessuna modifica dall'ultima sincronizzazione: dati già allineati con TIM."
+            elif result.get("no_data"):
                 message = "Nessun dato da sincronizzare dal database locale."
             else:
                 message = f"Sincronizzazione completata in {time_str}\n\nRecord aggiornati: {result.get('updated', 0)}"
@@ -2,557 +2,79 @@
 Gestione database: connessioni, creazione tabelle e operazioni CRUD.
 """
 import datetime
+import logging
+import time
 from contextlib import closing
 from typing import Any, Dict, List, Optional, Sequence, Tuple, cast
-import mysql.connector
-from mysql.connector import errorcode
-from config import MYSQL_CONFIG, TABLE_NAME
 
+import pandas as pd
 
-def ensure_table_and_indexes() -> None:
-    """Crea la tabella e l'indice unico se non esistono."""
-    with closing(mysql.connector.connect(**MYSQL_CONFIG)) as conn:
-        with closing(conn.cursor()) as cur:
-            cur.execute(
-                f"""
-                CREATE TABLE IF NOT EXISTS {TABLE_NAME} (
-                    id INT AUTO_INCREMENT PRIMARY KEY,
-                    data DATE NOT NULL,
-                    codice_preparatore VARCHAR(50) NOT NULL,
-                    nome_preparatore VARCHAR(255),
-                    totale_colli INT,
-                    penalita INT DEFAULT 0,
-                    tipo_attivita VARCHAR(50) NOT NULL,
-                    tipo VARCHAR(20),
-                    ore_tim DECIMAL(10,2) DEFAULT 0 COMMENT 'Ore di lavoro da TIM',
-                    ore_gestionale DECIMAL(10,2) DEFAULT 0 COMMENT 'Ore calcolate con sessioni (solo carrellisti)',
-                    UNIQUE KEY uniq_record (data, codice_preparatore, tipo_attivita, tipo)
-                )
-                """
-            )
-            
-            # Migrazione: rinomina tempo -> ore_tim e converti da minuti a ore
-            try:
-                # Verifica se esiste la vecchia colonna 'tempo'
-                cur.execute(
-                    f"""
-                    SELECT COLUMN_NAME FROM INFORMATION_SCHEMA.COLUMNS 
-                    WHERE TABLE_SCHEMA = DATABASE() 
-                    AND TABLE_NAME = '{TABLE_NAME}' 
-                    AND COLUMN_NAME = 'tempo'
-                    """
-                )
-                if cur.fetchone():
-                    # Aggiungi ore_tim
-                    cur.execute(
-                        f"""
-                        ALTER TABLE {TABLE_NAME}
-                        ADD COLUMN ore_tim DECIMAL(10,2) DEFAULT 0 COMMENT 'Ore di lavoro da TIM'
-                        """
-                    )
-                    # Converti tempo (minuti) in ore_tim (ore)
-                    cur.execute(
-                        f"""
-                        UPDATE {TABLE_NAME}
-                        SET ore_tim = tempo / 60.0
-                        WHERE tempo IS NOT NULL
-                        """
-                    )
-                    # Rimuovi la vecchia colonna tempo
-                    cur.execute(
-                        f"""
-                        ALTER TABLE {TABLE_NAME}
-                        DROP COLUMN tempo
-                        """
-                    )
-            except mysql.connector.Error:
-                pass
-            
-            # Aggiungi ore_gestionale se non esiste
-            try:
-                cur.execute(
-                    f"""
-                    ALTER TABLE {TABLE_NAME}
-                    ADD COLUMN ore_gestionale DECIMAL(10,2) DEFAULT 0 COMMENT 'Ore calcolate con sessioni (solo carrellisti)'
-                    """
-                )
-            except mysql.connector.Error:
-                pass
-            
-            # Tabella per le nuove aperture
-            cur.execute(
-                """
-                CREATE TABLE IF NOT EXISTS nuove_aperture (
-                    id INT AUTO_INCREMENT PRIMARY KEY,
-                    data_da DATE NOT NULL,
-                    data_a DATE NOT NULL,
-                    negozio VARCHAR(255) NOT NULL,
-                    data_inserimento TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    UNIQUE KEY uniq_apertura (data_da, data_a, negozio)
-                )
-                """
-            )
-
-            # Tabella fasce premi
-            cur.execute(
-                """
-                CREATE TABLE IF NOT EXISTS fasce_premi (
-                    id INT AUTO_INCREMENT PRIMARY KEY,
-                    tipo_attivita VARCHAR(50) NOT NULL,
-                    valore_riferimento DECIMAL(10,2) NOT NULL,
-                    valore_premio DECIMAL(10,5) NOT NULL,
-                    unita_riferimento VARCHAR(50) NOT NULL,
-                    unita_premio VARCHAR(50) NOT NULL,
-                    note VARCHAR(255),
-                    UNIQUE KEY uniq_fascia (tipo_attivita, valore_riferimento)
-                )
-                """
-            )
-
-            # Popola dati di default se tabella vuota
-            cur.execute("SELECT COUNT(*) FROM fasce_premi")
-            count_row = cur.fetchone()
-            count = count_row[0] if count_row else 0
-            if count == 0:
-                default_rows = [
-                    ("PICKING", 100, 0.00700, "COLLI/h", "€/COL", None),
-                    ("PICKING", 105, 0.00711, "COLLI/h", "€/COL", None),
-                    ("PICKING", 110, 0.00722, "COLLI/h", "€/COL", None),
-                    ("PICKING", 115, 0.00733, "COLLI/h", "€/COL", None),
-                    ("PICKING", 120, 0.00744, "COLLI/h", "€/COL", None),
-                    ("PICKING", 125, 0.00755, "COLLI/h", "€/COL", None),
-                    ("PICKING", 130, 0.00766, "COLLI/h", "€/COL", None),
-                    ("PICKING", 135, 0.00777, "COLLI/h", "€/COL", None),
-                    ("PICKING", 140, 0.00789, "COLLI/h", "€/COL", None),
-                    ("CARRELLISTI", 18, 0.03000, "Mov/h", "€/Plt", None),
-                    ("CARRELLISTI", 20, 0.03630, "Mov/h", "€/Plt", None),
-                    ("CARRELLISTI", 22, 0.04392, "Mov/h", "€/Plt", None),
-                    ("CARRELLISTI", 24, 0.05314, "Mov/h", "€/Plt", None),
-                    ("CARRELLISTI", 26, 0.06430, "Mov/h", "€/Plt", None),
-                    ("RICEVITORI", 18, 2.50, "Plt/h", "€/gg", None),
-                    ("RICEVITORI", 20, 3.60, "Plt/h", "€/gg", None),
-                    ("RICEVITORI", 22, 5.18, "Plt/h", "€/gg", None),
-                    ("RICEVITORI", 24, 7.46, "Plt/h", "€/gg", None),
-                    ("DOPPIA_SPUNTA", 147, 0.00500, "Colli/h", "€/collo", None),
-                    ("DOPPIA_SPUNTA", 160, 0.00525, "Colli/h", "€/collo", None),
-                    ("DOPPIA_SPUNTA", 173, 0.00551, "Colli/h", "€/collo", None),
-                    ("DOPPIA_SPUNTA", 186, 0.00579, "Colli/h", "€/collo", None),
-                    ("DOPPIA_SPUNTA", 199, 0.00608, "Colli/h", "€/collo", None)
-                ]
-                cur.executemany(
-                    """
-                    INSERT INTO fasce_premi
-                    (tipo_attivita, valore_riferimento, valore_premio, unita_riferimento, unita_premio, note)
-                    VALUES (%s, %s, %s, %s, %s, %s)
-                    """,
-                    default_rows
-                )
-
-            # Tabella peso movimenti
-            cur.execute(
-                """
-                CREATE TABLE IF NOT EXISTS peso_movimenti (
-                    id INT AUTO_INCREMENT PRIMARY KEY,
-                    tipo_attivita VARCHAR(50) NOT NULL,
-                    tipo VARCHAR(10) NOT NULL,
-                    peso DECIMAL(10,3) NOT NULL,
-                    note VARCHAR(255),
-                    UNIQUE KEY uniq_tipo (tipo_attivita, tipo)
-                )
-                """
-            )
-
-            # Allinea schema se la tabella esisteva già senza tipo_attivita
-            try:
-                cur.execute(
-                    """
-                    ALTER TABLE peso_movimenti
-                    ADD COLUMN tipo_attivita VARCHAR(50) NOT NULL DEFAULT 'CARRELLISTI'
-                    """
-                )
-            except mysql.connector.Error:
-                pass
-            try:
-                cur.execute(
-                    """
-                    ALTER TABLE peso_movimenti
-                    DROP INDEX uniq_tipo
-                    """
-                )
-            except mysql.connector.Error:
-                pass
-            try:
-                cur.execute(
-                    """
-                    ALTER TABLE peso_movimenti
-                    ADD UNIQUE INDEX uniq_tipo (tipo_attivita, tipo)
-                    """
-                )
-            except mysql.connector.Error:
-                pass
-
-            cur.execute(
-                """
-                UPDATE peso_movimenti
-                SET tipo_attivita = 'CARRELLISTI'
-                WHERE tipo_attivita IS NULL OR tipo_attivita = ''
-                """
-            )
-
-            cur.execute("SELECT COUNT(*) FROM peso_movimenti")
-            peso_count_row = cur.fetchone()
-            peso_count = int(peso_count_row[0]) if peso_count_row else 0  # type: ignore[index]
-            if peso_count == 0:
-                movimento_rows = [
-                    ("CARRELLISTI", "ST", 1.0, None),
-                    ("CARRELLISTI", "SS", 1.0, None),
-                    ("CARRELLISTI", "CM", 1.0, None),
-                    ("CARRELLISTI", "AP", 1.3, None),
-                ]
-                cur.executemany(
-                    """
-                    INSERT INTO peso_movimenti (tipo_attivita, tipo, peso, note)
-                    VALUES (%s, %s, %s, %s)
-                    """,
-                    movimento_rows,
-                )
-
-            # Tabella malus/bonus mensile
-            cur.execute(
-                """
-                CREATE TABLE IF NOT EXISTS malus_bonus (
-                    id INT AUTO_INCREMENT PRIMARY KEY,
-                    anno INT NOT NULL,
-                    mese INT NOT NULL,
-                    importo_rotture DECIMAL(12,2) NOT NULL DEFAULT 0,
-                    importo_differenze DECIMAL(12,2) NOT NULL DEFAULT 0,
-                    soglia_bonus DECIMAL(12,2) NOT NULL DEFAULT 2500,
-                    soglia_rotture DECIMAL(12,2) NOT NULL DEFAULT 2500,
-                    soglia_differenze DECIMAL(12,2) NOT NULL DEFAULT 2500,
-                    attivita_bonus VARCHAR(255),
-                    note VARCHAR(255),
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
-                    UNIQUE KEY uniq_mese (anno, mese)
-                )
-                """
-            )
+from bulk_loader import (
+    BulkLoadStats,
+    create_staging_table,
+    drop_staging_table,
+    insert_values_chunked,
+    load_staging,
+)
+from config import BULK_LOAD_MIN_ROWS, TABLE_NAME
+from db_pool import get_connection
+from migrations import ensure_schema
 
-            # Tabella definizioni report export
-            cur.execute(
-                """
-                CREATE TABLE IF NOT EXISTS report_templates (
-                    id INT AUTO_INCREMENT PRIMARY KEY,
-                    nome VARCHAR(100) NOT NULL,
-                    descrizione VARCHAR(255),
-                    sql_template TEXT NOT NULL,
-                    attivo BOOLEAN NOT NULL DEFAULT TRUE,
-                    attivita VARCHAR(50),
-                    categoria VARCHAR(50),
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
-                    UNIQUE KEY uniq_nome (nome)
-                )
-                """
-            )
+logger = logging.getLogger(__name__)
 
-            cur.execute(
-                """
-                SELECT COLUMN_NAME
-                FROM INFORMATION_SCHEMA.COLUMNS
-                WHERE TABLE_SCHEMA = DATABASE()
-                  AND TABLE_NAME = 'report_templates'
-                  AND COLUMN_NAME = 'attivita'
-                """
-            )
-            has_attivita = cur.fetchone() is not None
-            if not has_attivita:
-                cur.execute(
-                    """
-                    ALTER TABLE report_templates
-                    ADD COLUMN attivita VARCHAR(50) AFTER attivo
-                    """
-                )
-
-            # Tabella anomalie
-            cur.execute(
-                """
-                CREATE TABLE IF NOT EXISTS anomalie (
-                    id INT AUTO_INCREMENT PRIMARY KEY,
-                    tipo_anomalia VARCHAR(50) NOT NULL COMMENT 'CODICE_NON_ABBINATO, ORE_SENZA_PRODUZIONE, PRODUZIONE_SENZA_ORE, DIFFERENZA_60_120, DIFFERENZA_>120',
-                    data_rilevamento DATE NOT NULL,
-                    anno INT NOT NULL COMMENT 'Anno di competenza',
-                    mese INT NOT NULL COMMENT 'Mese di competenza (1-12)',
-                    codice_preparatore VARCHAR(50) NOT NULL,
-                    nome_preparatore VARCHAR(255),
-                    tipo_attivita VARCHAR(50),
-                    ore_tim DECIMAL(10,2) COMMENT 'Ore presenti in TIM (per anomalie tipo 2)',
-                    dettagli TEXT COMMENT 'Descrizione dettagliata anomalia',
-                    stato VARCHAR(20) DEFAULT 'APERTA' COMMENT 'APERTA, VERIFICATA, RISOLTA',
-                    note VARCHAR(255),
-                    data_creazione TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    data_aggiornamento TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
-                    INDEX idx_tipo (tipo_anomalia),
-                    INDEX idx_data (data_rilevamento),
-                    INDEX idx_anno_mese (anno, mese),
-                    INDEX idx_stato (stato),
-                    INDEX idx_codice (codice_preparatore)
-                )
-                """
-            )
-            
-            # Aggiungi colonne anno e mese se la tabella esiste già
-            try:
-                cur.execute(
-                    """
-                    ALTER TABLE anomalie
-                    ADD COLUMN anno INT NOT NULL DEFAULT 0 COMMENT 'Anno di competenza'
-                    """
-                )
-            except mysql.connector.Error:
-                pass
-            
-            try:
-                cur.execute(
-                    """
-                    ALTER TABLE anomalie
-                    ADD COLUMN mese INT NOT NULL DEFAULT 0 COMMENT 'Mese di competenza (1-12)'
-                    """
-                )
-            except mysql.connector.Error:
-                pass
-            
-            # Aggiungi indice per anno/mese se non esiste
-            try:
-                cur.execute(
-                    """
-                    CREATE INDEX idx_anno_mese ON anomalie (anno, mese)
-                    """
-                )
-            except mysql.connector.Error:
-                pass
 
-            # Tabella premi carrellisti
-            cur.execute(
-                """
-                CREATE TABLE IF NOT EXISTS premi_carrellisti (
-                    id INT AUTO_INCREMENT PRIMARY KEY,
-                    anno INT NOT NULL,
-                    mese INT NOT NULL,
-                    codice_preparatore VARCHAR(50) NOT NULL,
-                    nome_preparatore VARCHAR(255),
-                    totale_movimenti DECIMAL(10,2) NOT NULL,
-                    ore_lavorate DECIMAL(10,2) NOT NULL,
-                    movimenti_ora DECIMAL(10,2) NOT NULL,
-                    fascia_raggiunta VARCHAR(50),
-                    premio_base DECIMAL(10,2) NOT NULL DEFAULT 0,
-                    premio_kpi DECIMAL(10,2) NOT NULL DEFAULT 0,
-                    premio_totale DECIMAL(10,2) NOT NULL DEFAULT 0,
-                    bonus_applicato BOOLEAN DEFAULT FALSE,
-                    data_calcolo TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    note VARCHAR(255),
-                    UNIQUE KEY uniq_premio (anno, mese, codice_preparatore),
-                    INDEX idx_anno_mese (anno, mese),
-                    INDEX idx_codice (codice_preparatore)
-                )
-                """
-            )
-            
-            # Tabella premi preparatori
-            cur.execute(
-                """
-                CREATE TABLE IF NOT EXISTS premi_preparatori (
-                    id INT AUTO_INCREMENT PRIMARY KEY,
-                    anno INT NOT NULL,
-                    mese INT NOT NULL,
-                    codice_preparatore VARCHAR(50) NOT NULL,
-                    nome_preparatore VARCHAR(255),
-                    totale_colli DECIMAL(12,0) NOT NULL DEFAULT 0,
-                    ore_lavorate DECIMAL(10,2) NOT NULL DEFAULT 0,
-                    colli_ora DECIMAL(10,2) NOT NULL DEFAULT 0,
-                    fascia_raggiunta VARCHAR(50),
-                    premio_base DECIMAL(10,2) NOT NULL DEFAULT 0,
-                    penalita_totale DECIMAL(10,2) NOT NULL DEFAULT 0,
-                    premio_kpi DECIMAL(10,2) NOT NULL DEFAULT 0,
-                    premio_totale DECIMAL(10,2) NOT NULL DEFAULT 0,
-                    bonus_applicato BOOLEAN DEFAULT FALSE,
-                    data_calcolo TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    note VARCHAR(255),
-                    UNIQUE KEY uniq_premio_preparatori (anno, mese, codice_preparatore),
-                    INDEX idx_preparatori_anno_mese (anno, mese),
-                    INDEX idx_preparatori_codice (codice_preparatore)
-                )
-                """
-            )
-            
-            # Tabella dettaglio sessioni carrellisti con colonne separate per tipo
-            cur.execute(
-                """
-                CREATE TABLE IF NOT EXISTS sessioni_carrellisti (
-                    id INT AUTO_INCREMENT PRIMARY KEY,
-                    data DATE NOT NULL,
-                    codice_preparatore VARCHAR(50) NOT NULL,
-                    numero_riga INT NOT NULL COMMENT 'Progressivo riga nella giornata',
-                    ora_inizio_riga TIME NOT NULL COMMENT 'Ora inizio di questa singola riga',
-                    ora_fine_riga TIME NOT NULL COMMENT 'Ora fine di questa singola riga',
-                    tempo_riga_minuti DECIMAL(10,2) NOT NULL COMMENT 'Durata in minuti di questa singola riga',
-                    gap_minuti DECIMAL(10,2) NULL COMMENT 'Minuti tra FINE riga precedente e INIZIO questa (NULL per prima riga)',
-                    
-                    -- Movimenti per tipo (1 o NULL)
-                    movimenti_st INT NULL COMMENT 'Movimenti ST in questa riga',
-                    movimenti_ss INT NULL COMMENT 'Movimenti SS in questa riga',
-                    movimenti_ap INT NULL COMMENT 'Movimenti AP in questa riga',
-                    movimenti_cm INT NULL COMMENT 'Movimenti CM in questa riga',
-                    
-                    -- Errore (se presente, movimento non conteggiato)
-                    errore TEXT NULL COMMENT 'Descrizione errore se movimento non valido',
-                    
-                    -- Dettagli sessione (solo prima riga della sessione)
-                    numero_sessione INT NOT NULL,
-                    ora_inizio_sessione TIME NULL COMMENT 'Inizio sessione (solo prima riga)',
-                    ora_fine_sessione TIME NULL COMMENT 'Fine sessione (solo prima riga)',
-                    tempo_sessione_ore DECIMAL(10,2) NULL COMMENT 'Durata totale sessione (solo prima riga)',
-                    totale_righe_sessione INT NULL COMMENT 'Numero righe nella sessione (solo prima riga)',
-                    
-                    -- Totali giornalieri per tipo (solo prima riga di ogni tipo)
-                    ore_gestionale_st DECIMAL(10,2) NULL COMMENT 'Ore totali ST nella giornata (solo prima riga ST)',
-                    ore_gestionale_ss DECIMAL(10,2) NULL COMMENT 'Ore totali SS nella giornata (solo prima riga SS)',
-                    ore_gestionale_ap DECIMAL(10,2) NULL COMMENT 'Ore totali AP nella giornata (solo prima riga AP)',
-                    ore_gestionale_cm DECIMAL(10,2) NULL COMMENT 'Ore totali CM nella giornata (solo prima riga CM)',
-                    
-                    data_importazione TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    INDEX idx_data_codice (data, codice_preparatore),
-                    INDEX idx_data (data),
-                    INDEX idx_sessione (data, codice_preparatore, numero_sessione)
-                )
-                """
-            )
-            
-            conn.commit()
-
-            # Allinea schema esistente con la colonna attività bonus
-            _ensure_malus_bonus_schema(cur)
-            _ensure_sessioni_carrellisti_schema(cur)
-
-
-def _ensure_sessioni_carrellisti_schema(cur: Any) -> None:
-    """Garantisce la presenza della colonna errore nella tabella sessioni_carrellisti."""
-    connection = getattr(cur, "connection", None)
-    if connection is None:
-        return
-
-    alterations = [
-        (
-            "movimenti_ss",
-            """
-                ALTER TABLE sessioni_carrellisti
-                ADD COLUMN movimenti_ss INT NULL COMMENT 'Movimenti SS in questa riga'
-                AFTER movimenti_st
-            """
-        ),
-        (
-            "errore",
-            """
-                ALTER TABLE sessioni_carrellisti
-                ADD COLUMN errore TEXT NULL COMMENT 'Descrizione errore se movimento non valido'
-                AFTER movimenti_cm
-            """
-        ),
-        (
-            "ore_gestionale_ss",
-            """
-                ALTER TABLE sessioni_carrellisti
-                ADD COLUMN ore_gestionale_ss DECIMAL(10,2) NULL COMMENT 'Ore totali SS nella giornata (solo prima riga SS)'
-                AFTER ore_gestionale_st
-            """
-        ),
-    ]
-
-    for column_name, alter_sql in alterations:
-        try:
-            cur.execute(
-                """
-                    SELECT COUNT(*)
-                    FROM information_schema.COLUMNS
-                    WHERE TABLE_SCHEMA = DATABASE()
-                      AND TABLE_NAME = 'sessioni_carrellisti'
-                      AND COLUMN_NAME = %s
-                """,
-                (column_name,),
-            )
-            result = cur.fetchone()
-
-            if result and result[0] == 0:
-                cur.execute(alter_sql)
-                connection.commit()
-                print(f"[OK] Colonna '{column_name}' aggiunta a sessioni_carrellisti")
-        except Exception as exc:
-            print(
-                f"[WARN] Errore durante l'aggiornamento schema sessioni_carrellisti (colonna {column_name}): {exc}"
-            )
-
-
-def _ensure_malus_bonus_schema(cur: Any) -> None:
-    """Garantisce la presenza delle colonne opzionali nella tabella malus_bonus."""
-    connection = getattr(cur, "connection", None)
-    alterations = [
-        (
-            "attivita_bonus",
-            """
-            ALTER TABLE malus_bonus
-            ADD COLUMN attivita_bonus VARCHAR(255) NULL
-            """,
-            False,
-        ),
-        (
-            "soglia_rotture",
-            """
-            ALTER TABLE malus_bonus
-            ADD COLUMN soglia_rotture DECIMAL(12,2) NULL
-            """,
-            True,
-        ),
-        (
-            "soglia_differenze",
-            """
-            ALTER TABLE malus_bonus
-            ADD COLUMN soglia_differenze DECIMAL(12,2) NULL
-            """,
-            True,
-        ),
-    ]
-
-    for column, statement, copy_from_legacy in alterations:
-        try:
-            cur.execute(statement)
-            if connection is not None:
-                connection.commit()
-            if copy_from_legacy:
-                cur.execute(
-                    f"UPDATE malus_bonus SET {column} = soglia_bonus WHERE {column} IS NULL"
-                )
-                if connection is not None:
-                    connection.commit()
-        except mysql.connector.Error as exc:
-            errno = getattr(exc, "errno", None)
-            if errno in {errorcode.ER_DUP_FIELDNAME, errorcode.ER_NO_SUCH_TABLE}:
-                if copy_from_legacy and errno != errorcode.ER_NO_SUCH_TABLE:
-                    try:
-                        cur.execute(
-                            f"UPDATE malus_bonus SET {column} = soglia_bonus WHERE {column} IS NULL"
-                        )
-                        if connection is not None:
-                            connection.commit()
-                    except mysql.connector.Error:
-                        pass
-                continue
-            raise
+def ensure_table_and_indexes() -> None:
+    """Allinea lo schema applicando le migrazioni pendenti (una sola volta per processo)."""
+    ensure_schema()
+
+
+_PRODUZIONE_COLUMNS = (
+    "data",
+    "codice_preparatore",
+    "nome_preparatore",
+    "totale_colli",
+    "penalita",
+    "tipo_attivita",
+    "tipo",
+    "ore_tim",
+    "ore_gestionale",
+)
+
+_STAGING_PRODUZIONE = "tmp_staging_produzione"
+_STAGING_PRODUZIONE_DDL = [
+    "data DATE NOT NULL",
+    "codice_preparatore VARCHAR(50) NOT NULL",
+    "nome_preparatore VARCHAR(255)",
+    "totale_colli INT",
+    "penalita INT",
+    "tipo_attivita VARCHAR(50) NOT NULL",
+    "tipo VARCHAR(20)",
+    "ore_tim DECIMAL(10,2)",
+    "ore_gestionale DECIMAL(10,2)",
+]
+
+
+_UPSERT_PRODUZIONE_SQL = f"""
+    INSERT INTO {TABLE_NAME}
+    (data, codice_preparatore, nome_preparatore, totale_colli, penalita, tipo_attivita, tipo, ore_tim, ore_gestionale)
+    VALUES (%s,%s,%s,%s,%s,%s,%s,%s,%s)
+    ON DUPLICATE KEY UPDATE
+        nome_preparatore = VALUES(nome_preparatore),
+        totale_colli     = VALUES(totale_colli),
+        penalita         = VALUES(penalita),
+        tipo_attivita    = VALUES(tipo_attivita),
+        tipo             = VALUES(tipo),
+        ore_tim          = VALUES(ore_tim),
+        ore_gestionale   = VALUES(ore_gestionale)
+"""
 
 
 def insert_batch_data(values: List[Tuple]) -> int:
     """
     Inserisce i dati in batch nel database usando upsert.
     
+    Oltre `BULK_LOAD_MIN_ROWS` righe usa `bulk_upsert_dati_produzione` (tabella di appoggio).
+    
     Args:
         values: Lista di tuple con i dati da inserire (inclusi ore_tim e ore_gestionale)
         
@@ -561,68 +83,267 @@ def insert_batch_data(values: List[Tuple]) -> int:
     """
     if not values:
         return 0
+    if len(values) >= BULK_LOAD_MIN_ROWS:
+        return bulk_upsert_dati_produzione(values).righe
         
-    sql = f"""
-        INSERT INTO {TABLE_NAME}
-        (data, codice_preparatore, nome_preparatore, totale_colli, penalita, tipo_attivita, tipo, ore_tim, ore_gestionale)
-        VALUES (%s,%s,%s,%s,%s,%s,%s,%s,%s)
-        ON DUPLICATE KEY UPDATE
-            nome_preparatore = VALUES(nome_preparatore),
-            totale_colli     = VALUES(totale_colli),
-            penalita         = VALUES(penalita),
-            tipo_attivita    = VALUES(tipo_attivita),
-            tipo             = VALUES(tipo),
-            ore_tim          = VALUES(ore_tim),
-            ore_gestionale   = VALUES(ore_gestionale)
-    """
+    sql = _UPSERT_PRODUZIONE_SQL
 
-    with closing(mysql.connector.connect(**MYSQL_CONFIG)) as conn:
+    with get_connection() as conn:
         with closing(conn.cursor()) as cur:
             try:
+                start = time.perf_counter()
                 cur.executemany(sql, values)
                 conn.commit()
+                elapsed = time.perf_counter() - start
+                logger.info(
+                    "insert_batch_data: %d righe via executemany in %.2fs (%.0f righe/s)",
+                    len(values),
+                    elapsed,
+                    len(values) / elapsed if elapsed > 0 else 0,
+                )
                 return len(values)
             except Exception as e:
-                print("\n[ERROR] Errore durante insert_batch_data:")
-                print(f"   Errore: {e}")
-                print("\n   Tentativo di inserimento riga per riga per trovare il record problematico...")
+                logger.error("Errore durante insert_batch_data: %s", e)
+                logger.info("Tentativo di inserimento riga per riga per trovare il record problematico...")
                 
                 # Prova a inserire riga per riga per trovare il problema
                 for i, val in enumerate(values):
                     try:
-                        cur.execute(sql.replace("VALUES (%s,%s,%s,%s,%s,%s,%s,%s,%s)", "VALUES (%s,%s,%s,%s,%s,%s,%s,%s,%s)"), val)
+                        cur.execute(sql, val)
                         conn.commit()
                     except Exception as row_error:
-                        print(f"\n[FAIL] Errore alla riga {i}:")
-                        print(f"   Valori: {val}")
-                        print(f"   Tipi: {[type(v).__name__ for v in val]}")
-                        print(f"   Errore: {row_error}")
+                        logger.error(
+                            "Errore alla riga %d: %s\n   Valori: %s\n   Tipi: %s",
+                            i,
+                            row_error,
+                            val,
+                            [type(v).__name__ for v in val],
+                        )
                         raise  # Rilancia l'errore originale
                 
                 return len(values)
 
 
-def update_penalita_picking(values: List[Tuple[datetime.date, str, int]]) -> int:
-    """Aggiorna la penalità delle attività PICKING per data e codice preparatore."""
+def _merge_dati_produzione(cur: Any, values: List[Tuple], chunk_size: Optional[int] = None) -> BulkLoadStats:
+    """Carica `values` nella tabella di appoggio e li unisce in dati_produzione, senza commit."""
+    columns = ", ".join(_PRODUZIONE_COLUMNS)
+    updates = ",\n            ".join(
+        f"{col} = VALUES({col})" for col in _PRODUZIONE_COLUMNS if col not in ("data", "codice_preparatore")
+    )
+    create_staging_table(cur, _STAGING_PRODUZIONE, _STAGING_PRODUZIONE_DDL)
+    try:
+        stats = load_staging(cur, _STAGING_PRODUZIONE, _PRODUZIONE_COLUMNS, values, chunk_size)
+        start = time.perf_counter()
+        cur.execute(
+            f"""
+            INSERT INTO {TABLE_NAME} ({columns})
+            SELECT {columns} FROM {_STAGING_PRODUZIONE} ORDER BY seq
+            ON DUPLICATE KEY UPDATE
+                {updates}
+            """
+        )
+        stats.righe_merge = cur.rowcount
+        stats.secondi_merge = time.perf_counter() - start
+    finally:
+        drop_staging_table(cur, _STAGING_PRODUZIONE)
+    return stats
+
+
+def bulk_upsert_dati_produzione(values: List[Tuple], chunk_size: Optional[int] = None) -> BulkLoadStats:
+    """
+    Upsert massivo in dati_produzione tramite tabella temporanea di appoggio.
+
+    Le righe vengono caricate nella tabella di appoggio (LOAD DATA LOCAL INFILE o INSERT
+    multi-riga a blocchi) e unite con un unico INSERT ... SELECT ... ON DUPLICATE KEY
+    UPDATE, in una sola transazione.
 
+    Args:
+        values: Tuple nello stesso formato di `insert_batch_data`
+        chunk_size: Righe per blocco di INSERT (default `BULK_LOAD_CHUNK_SIZE`)
+
+    Returns:
+        BulkLoadStats con metodo di caricamento, tempi e righe/s
+    """
     if not values:
+        return BulkLoadStats()
+
+    with get_connection() as conn:
+        with closing(conn.cursor()) as cur:
+            stats = _merge_dati_produzione(cur, values, chunk_size)
+            conn.commit()
+
+    logger.info("bulk_upsert_dati_produzione: %s", stats.summary())
+    return stats
+
+
+def save_import_carrellisti(values: List[Tuple], sessioni: pd.DataFrame) -> int:
+    """
+    Scrive un import Carrellisti in un'unica transazione sulla stessa connessione:
+    dettaglio sessioni in sessioni_carrellisti e record aggregati in dati_produzione.
+
+    Args:
+        values: Tuple per dati_produzione (da `prepare_dataframe_for_db`)
+        sessioni: Dettaglio sessioni restituito da `parse_carrelisti`
+
+    Returns:
+        Numero di record inseriti/aggiornati in dati_produzione
+    """
+    if not values and sessioni.empty:
         return 0
+    ensure_schema()
+
+    with get_connection() as conn:
+        conn.autocommit = False
+        with closing(conn.cursor()) as cur:
+            if not sessioni.empty:
+                _replace_sessioni_carrellisti(cur, sessioni)
+            if len(values) >= BULK_LOAD_MIN_ROWS:
+                stats = _merge_dati_produzione(cur, values)
+                logger.info("save_import_carrellisti: %s", stats.summary())
+            elif values:
+                cur.executemany(_UPSERT_PRODUZIONE_SQL, values)
+            conn.commit()
+    logger.info("Import carrellisti salvato: %d righe sessioni, %d record produzione", len(sessioni), len(values))
+    return len(values)
 
-    sql = f"""
-        UPDATE {TABLE_NAME}
-        SET penalita = %s
-        WHERE data = %s
-          AND codice_preparatore = %s
-          AND tipo_attivita = %s
+
+_STAGING_PENALITA = "tmp_staging_penalita"
+_STAGING_PENALITA_DDL = [
+    "data DATE NOT NULL",
+    "codice_preparatore VARCHAR(50) NOT NULL",
+    "penalita INT NOT NULL",
+]
+
+
+def update_penalita_picking(values: List[Tuple[datetime.date, str, int]]) -> Tuple[int, int]:
     """
+    Aggiorna la penalità delle attività PICKING per data e codice preparatore.
 
-    params = [(pen, data, codice, "PICKING") for data, codice, pen in values]
+    Le penalità vengono caricate in una tabella temporanea e applicate con un solo
+    UPDATE ... JOIN; per la stessa coppia (data, codice) vale l'ultimo valore.
+    Vengono anche salvate in `penalita_picking`: quelle senza righe PICKING restano in
+    sospeso e sono applicate da `apply_penalita_picking_salvate` all'import dei PICKING.
+
+    Args:
+        values: Tuple (data, codice_preparatore, penalita) da `prepare_penalita_updates`
 
-    with closing(mysql.connector.connect(**MYSQL_CONFIG)) as conn:
+    Returns:
+        (abbinate, non_abbinate): coppie (data, codice) con o senza righe PICKING in dati_produzione
+    """
+    if not values:
+        return 0, 0
+
+    # Ultimo valore per chiave, come con gli UPDATE eseguiti in sequenza
+    rows = list({(data, codice): (data, codice, pen) for data, codice, pen in values}.values())
+
+    with get_connection() as conn:
         with closing(conn.cursor()) as cur:
-            cur.executemany(sql, params)
+            create_staging_table(
+                cur,
+                _STAGING_PENALITA,
+                _STAGING_PENALITA_DDL,
+                index_columns=("data", "codice_preparatore"),
+            )
+            try:
+                stats = load_staging(
+                    cur, _STAGING_PENALITA, ("data", "codice_preparatore", "penalita"), rows
+                )
+                start = time.perf_counter()
+                cur.execute(
+                    f"""
+                    SELECT COUNT(*)
+                    FROM {_STAGING_PENALITA} s
+                    WHERE EXISTS (
+                        SELECT 1 FROM {TABLE_NAME} d
+                        WHERE d.data = s.data
+                          AND d.codice_preparatore = s.codice_preparatore
+                          AND d.tipo_attivita = 'PICKING'
+                    )
+                    """
+                )
+                matched_row = cur.fetchone()
+                abbinate = int(matched_row[0]) if matched_row else 0  # type: ignore[index]
+                cur.execute(
+                    f"""
+                    UPDATE {TABLE_NAME} d
+                    JOIN {_STAGING_PENALITA} s
+                      ON d.data = s.data
+                     AND d.codice_preparatore = s.codice_preparatore
+                    SET d.penalita = s.penalita
+                    WHERE d.tipo_attivita = 'PICKING'
+                    """
+                )
+                stats.righe_merge = cur.rowcount
+                cur.execute(
+                    f"""
+                    INSERT INTO penalita_picking (data, codice_preparatore, penalita, consumata_il)
+                    SELECT s.data, s.codice_preparatore, s.penalita,
+                           IF(EXISTS (
+                               SELECT 1 FROM {TABLE_NAME} d
+                               WHERE d.data = s.data
+                                 AND d.codice_preparatore = s.codice_preparatore
+                                 AND d.tipo_attivita = 'PICKING'
+                           ), NOW(), NULL)
+                    FROM {_STAGING_PENALITA} s
+                    ORDER BY s.seq
+                    ON DUPLICATE KEY UPDATE
+                        penalita = VALUES(penalita),
+                        consumata_il = VALUES(consumata_il)
+                    """
+                )
+                conn.commit()
+                stats.secondi_merge = time.perf_counter() - start
+            finally:
+                drop_staging_table(cur, _STAGING_PENALITA)
+
+    logger.info("update_penalita_picking: %s", stats.summary())
+    return abbinate, len(rows) - abbinate
+
+
+def apply_penalita_picking_salvate(data_da: datetime.date, data_a: datetime.date) -> Tuple[int, int]:
+    """
+    Applica alle righe PICKING del periodo le penalità Doppia Spunta salvate in `penalita_picking`.
+
+    Da chiamare dopo ogni import PICKING: l'import riscrive la penalità a 0, quindi vengono
+    riapplicate tutte le penalità del periodo e quelle in sospeso vengono segnate come consumate.
+
+    Returns:
+        (applicate, consumate): penalità abbinate a righe PICKING e, tra queste, quelle che erano in sospeso
+    """
+    with get_connection() as conn:
+        with closing(conn.cursor()) as cur:
+            cur.execute(
+                f"""
+                SELECT COUNT(*), COALESCE(SUM(p.consumata_il IS NULL), 0)
+                FROM penalita_picking p
+                WHERE p.data >= %s AND p.data <= %s
+                  AND EXISTS (
+                      SELECT 1 FROM {TABLE_NAME} d
+                      WHERE d.data = p.data
+                        AND d.codice_preparatore = p.codice_preparatore
+                        AND d.tipo_attivita = 'PICKING'
+                  )
+                """,
+                (data_da, data_a),
+            )
+            row = cur.fetchone()
+            applicate, consumate = (int(row[0]), int(row[1])) if row else (0, 0)  # type: ignore[index]
+            if applicate:
+                cur.execute(
+                    f"""
+                    UPDATE {TABLE_NAME} d
+                    JOIN penalita_picking p
+                      ON d.data = p.data
+                     AND d.codice_preparatore = p.codice_preparatore
+                    SET d.penalita = p.penalita,
+                        p.consumata_il = COALESCE(p.consumata_il, NOW())
+                    WHERE d.tipo_attivita = 'PICKING'
+                      AND p.data >= %s AND p.data <= %s
+                    """,
+                    (data_da, data_a),
+                )
             conn.commit()
-            return cur.rowcount
+            return applicate, consumate
 
 
 def save_nuove_aperture(data_da: str, data_a: str, negozi: List[str]) -> int:
@@ -641,7 +362,7 @@ def save_nuove_aperture(data_da: str, data_a: str, negozi: List[str]) -> int:
     if not negozi:
         return 0
     
-    with closing(mysql.connector.connect(**MYSQL_CONFIG)) as conn:
+    with get_connection() as conn:
         with closing(conn.cursor()) as cur:
             # Elimina i negozi esistenti per questo periodo
             cur.execute(
@@ -674,7 +395,7 @@ def load_nuove_aperture(data_da: str, data_a: str) -> List[str]:
     Returns:
         Lista dei nomi negozi salvati per il periodo
     """
-    with closing(mysql.connector.connect(**MYSQL_CONFIG)) as conn:
+    with get_connection() as conn:
         with closing(conn.cursor()) as cur:
             cur.execute(
                 """
@@ -691,7 +412,7 @@ def load_nuove_aperture(data_da: str, data_a: str) -> List[str]:
 
 def fetch_fasce_premi(tipo: Optional[str] = None) -> List[Dict[str, Any]]:
     """Recupera le fasce premio, opzionalmente filtrate per tipo attività."""
-    with closing(mysql.connector.connect(**MYSQL_CONFIG)) as conn:
+    with get_connection() as conn:
         with closing(conn.cursor(dictionary=True)) as cur:
             if tipo:
                 cur.execute(
@@ -718,7 +439,7 @@ def fetch_fasce_premi(tipo: Optional[str] = None) -> List[Dict[str, Any]]:
 
 def fetch_pesi_movimenti(tipo_attivita: Optional[str] = None) -> List[Dict[str, Any]]:
     """Restituisce il peso dei movimenti per ogni tipo e attività."""
-    with closing(mysql.connector.connect(**MYSQL_CONFIG)) as conn:
+    with get_connection() as conn:
         with closing(conn.cursor(dictionary=True)) as cur:
             if tipo_attivita:
                 cur.execute(
@@ -751,7 +472,7 @@ def insert_fascia_premio(
     note: Optional[str] = None,
 ) -> int:
     """Inserisce una nuova fascia premio."""
-    with closing(mysql.connector.connect(**MYSQL_CONFIG)) as conn:
+    with get_connection() as conn:
         with closing(conn.cursor()) as cur:
             cur.execute(
                 """
@@ -780,7 +501,7 @@ def insert_peso_movimento(
     note: Optional[str] = None,
 ) -> int:
     """Inserisce un nuovo peso movimento."""
-    with closing(mysql.connector.connect(**MYSQL_CONFIG)) as conn:
+    with get_connection() as conn:
         with closing(conn.cursor()) as cur:
             cur.execute(
                 """
@@ -804,7 +525,7 @@ def update_fascia_premio(
     note: Optional[str] = None,
 ) -> None:
     """Aggiorna una fascia premio esistente."""
-    with closing(mysql.connector.connect(**MYSQL_CONFIG)) as conn:
+    with get_connection() as conn:
         with closing(conn.cursor()) as cur:
             cur.execute(
                 """
@@ -838,7 +559,7 @@ def update_peso_movimento(
     note: Optional[str] = None,
 ) -> None:
     """Aggiorna un peso movimento esistente."""
-    with closing(mysql.connector.connect(**MYSQL_CONFIG)) as conn:
+    with get_connection() as conn:
         with closing(conn.cursor()) as cur:
             cur.execute(
                 """
@@ -856,7 +577,7 @@ def update_peso_movimento(
 
 def delete_fascia_premio(fascia_id: int) -> None:
     """Elimina una fascia premio."""
-    with closing(mysql.connector.connect(**MYSQL_CONFIG)) as conn:
+    with get_connection() as conn:
         with closing(conn.cursor()) as cur:
             cur.execute("DELETE FROM fasce_premi WHERE id = %s", (fascia_id,))
             conn.commit()
@@ -864,7 +585,7 @@ def delete_fascia_premio(fascia_id: int) -> None:
 
 def delete_peso_movimento(peso_id: int) -> None:
     """Elimina un peso movimento."""
-    with closing(mysql.connector.connect(**MYSQL_CONFIG)) as conn:
+    with get_connection() as conn:
         with closing(conn.cursor()) as cur:
             cur.execute("DELETE FROM peso_movimenti WHERE id = %s", (peso_id,))
             conn.commit()
@@ -881,9 +602,9 @@ def upsert_malus_bonus(
     note: Optional[str] = None,
 ) -> None:
     """Inserisce o aggiorna il record malus/bonus per un mese."""
-    with closing(mysql.connector.connect(**MYSQL_CONFIG)) as conn:
+    ensure_schema()
+    with get_connection() as conn:
         with closing(conn.cursor()) as cur:
-            _ensure_malus_bonus_schema(cur)
             legacy_soglia = max(soglia_rotture, soglia_differenze)
             cur.execute(
                 """
@@ -917,9 +638,9 @@ def upsert_malus_bonus(
 
 def fetch_malus_bonus(anno: Optional[int] = None) -> List[Dict[str, Any]]:
     """Recupera i record malus/bonus, opzionalmente filtrati per anno."""
-    with closing(mysql.connector.connect(**MYSQL_CONFIG)) as conn:
+    ensure_schema()
+    with get_connection() as conn:
         with closing(conn.cursor(dictionary=True)) as cur:
-            _ensure_malus_bonus_schema(cur)
             if anno:
                 cur.execute(
                     """
@@ -944,9 +665,9 @@ def fetch_malus_bonus(anno: Optional[int] = None) -> List[Dict[str, Any]]:
 
 def get_malus_bonus(anno: int, mese: int) -> Optional[Dict[str, Any]]:
     """Restituisce il record malus/bonus per anno e mese."""
-    with closing(mysql.connector.connect(**MYSQL_CONFIG)) as conn:
+    ensure_schema()
+    with get_connection() as conn:
         with closing(conn.cursor(dictionary=True)) as cur:
-            _ensure_malus_bonus_schema(cur)
             cur.execute(
                 """
                 SELECT id, anno, mese, importo_rotture, importo_differenze, soglia_bonus, soglia_rotture, soglia_differenze, attivita_bonus, note
@@ -962,9 +683,9 @@ def get_malus_bonus(anno: int, mese: int) -> Optional[Dict[str, Any]]:
 
 def delete_malus_bonus(record_id: int) -> None:
     """Elimina un record malus/bonus."""
-    with closing(mysql.connector.connect(**MYSQL_CONFIG)) as conn:
+    ensure_schema()
+    with get_connection() as conn:
         with closing(conn.cursor()) as cur:
-            _ensure_malus_bonus_schema(cur)
             cur.execute("DELETE FROM malus_bonus WHERE id = %s", (record_id,))
             conn.commit()
 
@@ -983,7 +704,7 @@ def insert_anomalia(
     note: Optional[str] = None,
 ) -> int:
     """Inserisce una nuova anomalia."""
-    with closing(mysql.connector.connect(**MYSQL_CONFIG)) as conn:
+    with get_connection() as conn:
         with closing(conn.cursor()) as cur:
             # Estrae anno e mese dalla data di rilevamento
             anno = data_rilevamento.year
@@ -1004,7 +725,7 @@ def insert_anomalia(
                     mese,
                     codice_preparatore,
                     nome_preparatore,
-                    tipo_attivita,
+                    tipo_attivita or "",
                     ore_tim,
                     dettagli,
                     note,
@@ -1015,6 +736,240 @@ def insert_anomalia(
             return cast(int, last_id) if last_id is not None else 0
 
 
+_ANOMALIE_COLUMNS = (
+    "tipo_anomalia",
+    "data_rilevamento",
+    "anno",
+    "mese",
+    "codice_preparatore",
+    "nome_preparatore",
+    "tipo_attivita",
+    "ore_tim",
+    "dettagli",
+    "note",
+)
+
+
+_ANOMALIE_ON_DUPLICATE = (
+    "nome_preparatore = VALUES(nome_preparatore), ore_tim = VALUES(ore_tim), "
+    "dettagli = VALUES(dettagli), anno = VALUES(anno), mese = VALUES(mese)"
+)
+
+_STAGING_ANOMALIE = "tmp_staging_anomalie"
+_STAGING_ANOMALIE_DDL = [
+    "tipo_anomalia VARCHAR(50) NOT NULL",
+    "data_rilevamento DATE NOT NULL",
+    "anno INT NOT NULL",
+    "mese INT NOT NULL",
+    "codice_preparatore VARCHAR(50) NOT NULL",
+    "nome_preparatore VARCHAR(255)",
+    "tipo_attivita VARCHAR(50) NOT NULL DEFAULT ''",
+    "ore_tim DECIMAL(10,2)",
+    "dettagli TEXT",
+    "note VARCHAR(255)",
+]
+
+
+def _anomalie_rows(anomalie: List[Dict[str, Any]]) -> List[Tuple[Any, ...]]:
+    """Righe per la tabella anomalie, una per chiave univoca (vale l'ultima della lista)."""
+    per_chiave: Dict[Tuple[Any, ...], Tuple[Any, ...]] = {}
+    for a in anomalie:
+        data_rilevamento = a["data_rilevamento"]
+        tipo_attivita = a.get("tipo_attivita") or ""
+        chiave = (a["tipo_anomalia"], data_rilevamento, a["codice_preparatore"], tipo_attivita)
+        per_chiave[chiave] = (
+            a["tipo_anomalia"],
+            data_rilevamento,
+            data_rilevamento.year,
+            data_rilevamento.month,
+            a["codice_preparatore"],
+            a.get("nome_preparatore"),
+            tipo_attivita,
+            a.get("ore_tim"),
+            a.get("dettagli"),
+            a.get("note"),
+        )
+    return list(per_chiave.values())
+
+
+def upsert_anomalie(anomalie: List[Dict[str, Any]]) -> int:
+    """
+    Scrive in blocco le anomalie rilevate, senza duplicarle a ogni sincronizzazione.
+
+    Chiave: (tipo_anomalia, data_rilevamento, codice_preparatore, tipo_attivita); per la
+    stessa chiave vale l'ultima anomalia della lista. Le righe già presenti aggiornano
+    nome, ore e dettagli ma conservano stato e note di chi le sta verificando.
+
+    Args:
+        anomalie: Dizionari con gli stessi campi di `insert_anomalia`
+
+    Returns:
+        Numero di anomalie distinte scritte
+    """
+    if not anomalie:
+        return 0
+
+    rows = _anomalie_rows(anomalie)
+    ensure_schema()
+    with get_connection() as conn:
+        with closing(conn.cursor()) as cur:
+            insert_values_chunked(
+                cur, "anomalie", _ANOMALIE_COLUMNS, rows, on_duplicate=_ANOMALIE_ON_DUPLICATE
+            )
+            conn.commit()
+    return len(rows)
+
+
+def _regole_anomalie_ore(
+    scope_sql: str, scope_params: Sequence[Any], tipo_attivita_tim: Dict[str, str]
+) -> List[Tuple[str, str, List[Any]]]:
+    """
+    Regole di confronto ore TIM / ore gestionale come `INSERT ... SELECT` nella tabella di appoggio.
+
+    Ogni regola raggruppa per (data, codice, tipo_attivita) le righe di dati_produzione
+    nel perimetro `scope_sql`; il nominativo "COGNOME NOME" viene dalla copia locale
+    dell'anagrafica TIM (`tim_codici`) valida alla data, con il tipo attività TIM
+    ricavato da `tipo_attivita_tim`.
+
+    Returns:
+        (tipo_anomalia, query, parametri) per ciascuna regola
+    """
+    # Senza corrispondenze il tipo attività TIM coincide con quello locale
+    case_tim = "tipo_attivita"
+    case_params: List[Any] = []
+    if tipo_attivita_tim:
+        case_tim = "CASE tipo_attivita " + " ".join(["WHEN %s THEN %s"] * len(tipo_attivita_tim)) + " ELSE tipo_attivita END"
+        case_params = [v for item in tipo_attivita_tim.items() for v in item]
+    tim_valido = """
+        FROM tim_codici tc
+        WHERE tc.codice_norm = g.codice_norm
+          AND tc.tipo_attivita = g.tipo_tim
+          AND g.data BETWEEN tc.valido_dal AND COALESCE(tc.valido_al, '9999-12-31')
+    """
+    nominativo = f"""(
+        SELECT NULLIF(CONCAT_WS(' ', NULLIF(UPPER(TRIM(tc.cognome)), ''), NULLIF(UPPER(TRIM(tc.nome)), '')), '')
+        {tim_valido}
+        ORDER BY tc.valido_dal DESC
+        LIMIT 1
+    )"""
+    columns = ", ".join(_ANOMALIE_COLUMNS)
+
+    def differenza(tipo_anomalia: str, condizione: str) -> Tuple[str, str, List[Any]]:
+        query = f"""
+            INSERT INTO {_STAGING_ANOMALIE} ({columns})
+            SELECT %s, g.data, YEAR(g.data), MONTH(g.data), g.codice_preparatore, {nominativo},
+                   g.tipo_attivita, g.ore_tim_totali,
+                   CONCAT('Data: ', CAST(g.data AS CHAR),
+                          ' - Ore TIM: ', g.ore_tim_totali, 'h, Ore Gestionale: ', g.ore_gestionale_totali,
+                          'h - Differenza: ', IF(g.differenza >= 0, '+', ''), ROUND(g.differenza),
+                          ' min - Tipi: ', COALESCE(g.tipi, '')),
+                   NULL
+            FROM (
+                SELECT data,
+                       codice_preparatore,
+                       MIN(codice_norm) AS codice_norm,
+                       tipo_attivita,
+                       {case_tim} AS tipo_tim,
+                       SUM(CAST(ore_tim AS DECIMAL(10,2))) AS ore_tim_totali,
+                       SUM(CAST(ore_gestionale AS DECIMAL(10,2))) AS ore_gestionale_totali,
+                       (SUM(CAST(ore_gestionale AS DECIMAL(10,2))) - SUM(CAST(ore_tim AS DECIMAL(10,2)))) * 60 AS differenza,
+                       GROUP_CONCAT(DISTINCT tipo ORDER BY tipo SEPARATOR ', ') AS tipi
+                FROM {TABLE_NAME}
+                WHERE {scope_sql}
+                  AND ore_tim IS NOT NULL
+                  AND ore_tim > 0
+                  AND ore_gestionale IS NOT NULL
+                GROUP BY data, codice_preparatore, tipo_attivita
+                HAVING {condizione}
+            ) g
+        """
+        return tipo_anomalia, query, [tipo_anomalia, *case_params, *scope_params]
+
+    # Produzione con ore gestionale ma senza ore TIM; i codici assenti in TIM sono già
+    # segnalati come CODICE_NON_ABBINATO
+    senza_ore = f"""
+        INSERT INTO {_STAGING_ANOMALIE} ({columns})
+        SELECT 'PRODUZIONE_SENZA_ORE', g.data, YEAR(g.data), MONTH(g.data), g.codice_preparatore,
+               {nominativo}, g.tipo_attivita, 0,
+               CONCAT('Data: ', CAST(g.data AS CHAR),
+                      ' - Ore TIM: 0.00h, Ore Gestionale: ', g.ore_gestionale_totali,
+                      'h - Tipi: ', COALESCE(g.tipi, '')),
+               NULL
+        FROM (
+            SELECT data,
+                   codice_preparatore,
+                   MIN(codice_norm) AS codice_norm,
+                   tipo_attivita,
+                   {case_tim} AS tipo_tim,
+                   SUM(CAST(ore_gestionale AS DECIMAL(10,2))) AS ore_gestionale_totali,
+                   GROUP_CONCAT(DISTINCT tipo ORDER BY tipo SEPARATOR ', ') AS tipi
+            FROM {TABLE_NAME}
+            WHERE {scope_sql}
+              AND (ore_tim IS NULL OR ore_tim = 0)
+              AND ore_gestionale > 0
+            GROUP BY data, codice_preparatore, tipo_attivita
+        ) g
+        WHERE EXISTS (SELECT 1 {tim_valido})
+    """
+    return [
+        differenza("DIFFERENZA_60_120", "ABS(differenza) >= 60 AND ABS(differenza) < 120"),
+        differenza("DIFFERENZA_>120", "ABS(differenza) >= 120"),
+        ("PRODUZIONE_SENZA_ORE", senza_ore, [*case_params, *scope_params]),
+    ]
+
+
+def write_anomalie_sync(
+    cur: Any,
+    anomalie: List[Dict[str, Any]],
+    scope_sql: str,
+    scope_params: Sequence[Any],
+    tipo_attivita_tim: Dict[str, str],
+) -> Dict[str, int]:
+    """
+    Rileva e scrive le anomalie della sincronizzazione TIM nella transazione di `cur`, senza commit.
+
+    Le anomalie calcolate in Python (`anomalie`, es. CODICE_NON_ABBINATO) e quelle delle
+    regole SQL sulle ore (DIFFERENZA_60_120, DIFFERENZA_>120, PRODUZIONE_SENZA_ORE, una
+    istruzione per regola nel perimetro `scope_sql`) passano da una tabella di appoggio e
+    vengono unite in `anomalie` con un solo `INSERT ... SELECT`, con le regole di
+    `upsert_anomalie` (stato e note delle righe esistenti restano invariati).
+
+    Returns:
+        Anomalie rilevate per tipo di regola SQL e anomalie distinte scritte ("totale")
+    """
+    columns = ", ".join(_ANOMALIE_COLUMNS)
+    create_staging_table(cur, _STAGING_ANOMALIE, _STAGING_ANOMALIE_DDL)
+    try:
+        rows = _anomalie_rows(anomalie)
+        insert_values_chunked(cur, _STAGING_ANOMALIE, _ANOMALIE_COLUMNS, rows)
+        conteggi: Dict[str, int] = {}
+        for tipo_anomalia, query, params in _regole_anomalie_ore(scope_sql, scope_params, tipo_attivita_tim):
+            cur.execute(query, params)
+            conteggi[tipo_anomalia] = cur.rowcount
+        # Una chiave presente sia tra le anomalie Python sia in una regola viene scritta una volta
+        cur.execute(
+            f"""
+            SELECT COUNT(DISTINCT tipo_anomalia, data_rilevamento, codice_preparatore, tipo_attivita) AS totale
+            FROM {_STAGING_ANOMALIE}
+            """
+        )
+        totale_row = cur.fetchone()
+        totale = 0
+        if totale_row:
+            totale = int(totale_row["totale"] if isinstance(totale_row, dict) else totale_row[0])
+        cur.execute(
+            f"""
+            INSERT INTO anomalie ({columns})
+            SELECT {columns} FROM {_STAGING_ANOMALIE} ORDER BY seq
+            ON DUPLICATE KEY UPDATE {_ANOMALIE_ON_DUPLICATE}
+            """
+        )
+        conteggi["totale"] = totale
+    finally:
+        drop_staging_table(cur, _STAGING_ANOMALIE)
+    return conteggi
+
+
 def fetch_anomalie(
     tipo_anomalia: Optional[str | List[str]] = None,
     stato: Optional[str] = None,
@@ -1024,7 +979,7 @@ def fetch_anomalie(
     codice_preparatore: Optional[str] = None,
 ) -> List[Dict[str, Any]]:
     """Recupera le anomalie con filtri opzionali. tipo_anomalia può essere una stringa o una lista."""
-    with closing(mysql.connector.connect(**MYSQL_CONFIG)) as conn:
+    with get_connection() as conn:
         with closing(conn.cursor(dictionary=True)) as cur:
             conditions: List[str] = []
             params: List[Any] = []
@@ -1073,7 +1028,7 @@ def fetch_report_templates(
     attivita: Optional[str] = None,
 ) -> List[Dict[str, Any]]:
     """Restituisce la lista dei report configurati per gli export."""
-    with closing(mysql.connector.connect(**MYSQL_CONFIG)) as conn:
+    with get_connection() as conn:
         with closing(conn.cursor(dictionary=True)) as cur:
             base_query = (
                 "SELECT id, nome, descrizione, sql_template, attivo, attivita, categoria, "
@@ -1103,7 +1058,7 @@ def fetch_report_templates(
 
 def execute_custom_query(query: str, params: Sequence[Any]) -> Tuple[List[Dict[str, Any]], List[str]]:
     """Esegue una query arbitraria e restituisce righe e intestazioni."""
-    with closing(mysql.connector.connect(**MYSQL_CONFIG)) as conn:
+    with get_connection() as conn:
         with closing(conn.cursor(dictionary=True)) as cur:
             cur.execute(query, tuple(params))
             rows = cur.fetchall() or []
@@ -1113,7 +1068,7 @@ def execute_custom_query(query: str, params: Sequence[Any]) -> Tuple[List[Dict[s
 
 def update_anomalia_stato(anomalia_id: int, nuovo_stato: str, note: Optional[str] = None) -> None:
     """Aggiorna lo stato di un'anomalia."""
-    with closing(mysql.connector.connect(**MYSQL_CONFIG)) as conn:
+    with get_connection() as conn:
         with closing(conn.cursor()) as cur:
             if note:
                 cur.execute(
@@ -1140,7 +1095,7 @@ def update_anomalia_stato(anomalia_id: int, nuovo_stato: str, note: Optional[str
 
 def save_premi_carrellisti(anno: int, mese: int, premi: List[Dict[str, Any]]) -> None:
     """Salva i premi carrellisti per un dato mese. Se esistono già, li sovrascrive."""
-    with closing(mysql.connector.connect(**MYSQL_CONFIG)) as conn:
+    with get_connection() as conn:
         with closing(conn.cursor()) as cur:
             # Prima elimina i premi esistenti per quel mese
             cur.execute(
@@ -1183,7 +1138,7 @@ def fetch_premi_carrellisti(
     codice_preparatore: Optional[str] = None
 ) -> List[Dict[str, Any]]:
     """Recupera i premi carrellisti filtrati per anno/mese/codice."""
-    with closing(mysql.connector.connect(**MYSQL_CONFIG)) as conn:
+    with get_connection() as conn:
         with closing(conn.cursor(dictionary=True)) as cur:
             conditions = []
             params: List[Any] = []
@@ -1215,7 +1170,7 @@ def fetch_premi_carrellisti(
 
 def delete_premi_carrellisti(anno: int, mese: int) -> None:
     """Elimina i premi carrellisti per un dato mese."""
-    with closing(mysql.connector.connect(**MYSQL_CONFIG)) as conn:
+    with get_connection() as conn:
         with closing(conn.cursor()) as cur:
             cur.execute(
                 "DELETE FROM premi_carrellisti WHERE anno = %s AND mese = %s",
@@ -1226,7 +1181,7 @@ def delete_premi_carrellisti(anno: int, mese: int) -> None:
 
 def save_premi_preparatori(anno: int, mese: int, premi: List[Dict[str, Any]]) -> None:
     """Salva i premi preparatori per un mese specifico sovrascrivendo quelli esistenti."""
-    with closing(mysql.connector.connect(**MYSQL_CONFIG)) as conn:
+    with get_connection() as conn:
         with closing(conn.cursor()) as cur:
             cur.execute(
                 "DELETE FROM premi_preparatori WHERE anno = %s AND mese = %s",
@@ -1270,7 +1225,7 @@ def fetch_premi_preparatori(
     codice_preparatore: Optional[str] = None,
 ) -> List[Dict[str, Any]]:
     """Restituisce i premi preparatori filtrati per anno/mese/codice."""
-    with closing(mysql.connector.connect(**MYSQL_CONFIG)) as conn:
+    with get_connection() as conn:
         with closing(conn.cursor(dictionary=True)) as cur:
             conditions: List[str] = []
             params: List[Any] = []
@@ -1304,7 +1259,7 @@ def fetch_premi_preparatori(
 
 def delete_premi_preparatori(anno: int, mese: int) -> None:
     """Elimina i premi preparatori per un determinato mese."""
-    with closing(mysql.connector.connect(**MYSQL_CONFIG)) as conn:
+    with get_connection() as conn:
         with closing(conn.cursor()) as cur:
             cur.execute(
                 "DELETE FROM premi_preparatori WHERE anno = %s AND mese = %s",
@@ -1315,7 +1270,7 @@ def delete_premi_preparatori(anno: int, mese: int) -> None:
 
 def delete_anomalia(anomalia_id: int) -> None:
     """Elimina un'anomalia."""
-    with closing(mysql.connector.connect(**MYSQL_CONFIG)) as conn:
+    with get_connection() as conn:
         with closing(conn.cursor()) as cur:
             cur.execute("DELETE FROM anomalie WHERE id = %s", (anomalia_id,))
             conn.commit()
@@ -1323,7 +1278,7 @@ def delete_anomalia(anomalia_id: int) -> None:
 
 def clear_anomalie_by_date(data_rilevamento: datetime.date, tipo_anomalia: Optional[str] = None) -> int:
     """Elimina anomalie per una data specifica (utile prima di rigenerare)."""
-    with closing(mysql.connector.connect(**MYSQL_CONFIG)) as conn:
+    with get_connection() as conn:
         with closing(conn.cursor()) as cur:
             if tipo_anomalia:
                 cur.execute(
@@ -1339,93 +1294,109 @@ def clear_anomalie_by_date(data_rilevamento: datetime.date, tipo_anomalia: Optio
             return cur.rowcount
 
 
-def save_sessioni_carrellisti(sessioni: List[Dict[str, Any]]) -> None:
+_SESSIONI_COLUMNS = (
+    "data",
+    "codice_preparatore",
+    "numero_riga",
+    "ora_inizio_riga",
+    "ora_fine_riga",
+    "tempo_riga_minuti",
+    "gap_minuti",
+    "movimenti_st",
+    "movimenti_ss",
+    "movimenti_ap",
+    "movimenti_cm",
+    "errore",
+    "numero_sessione",
+    "ora_inizio_sessione",
+    "ora_fine_sessione",
+    "tempo_sessione_ore",
+    "totale_righe_sessione",
+    "ore_gestionale_st",
+    "ore_gestionale_ss",
+    "ore_gestionale_ap",
+    "ore_gestionale_cm",
+)
+
+_STAGING_SESSIONI_CHIAVI = "tmp_sessioni_chiavi"
+
+
+def _frame_rows(frame: pd.DataFrame, columns: Sequence[str]) -> List[Tuple[Any, ...]]:
+    """Tuple di valori Python delle colonne indicate, con None al posto di NaN/NA."""
+    values = [
+        frame[col].astype(object).where(frame[col].notna(), None).tolist() for col in columns
+    ]
+    return list(zip(*values))
+
+
+def _replace_sessioni_carrellisti(cur: Any, sessioni: pd.DataFrame, chunk_size: Optional[int] = None) -> int:
+    """
+    Sostituisce le sessioni delle coppie (data, codice) presenti in `sessioni`, senza commit.
+
+    Le chiavi vengono caricate in una tabella temporanea ed eliminate con un solo
+    DELETE ... JOIN; le nuove righe sono inserite a blocchi con INSERT multi-riga.
+
+    Returns:
+        Numero di righe inserite
+    """
+    date_codici = _frame_rows(
+        sessioni[["data", "codice_preparatore"]].drop_duplicates(), ("data", "codice_preparatore")
+    )
+    logger.info("Eliminazione sessioni esistenti per %d combinazioni data/codice...", len(date_codici))
+    create_staging_table(
+        cur,
+        _STAGING_SESSIONI_CHIAVI,
+        ["data DATE NOT NULL", "codice_preparatore VARCHAR(50) NOT NULL"],
+        index_columns=("data", "codice_preparatore"),
+    )
+    try:
+        load_staging(cur, _STAGING_SESSIONI_CHIAVI, ("data", "codice_preparatore"), date_codici, chunk_size)
+        cur.execute(
+            f"""
+            DELETE sc FROM sessioni_carrellisti sc
+            JOIN {_STAGING_SESSIONI_CHIAVI} k
+              ON sc.data = k.data
+             AND sc.codice_preparatore = k.codice_preparatore
+            """
+        )
+        logger.info("Eliminate %d righe esistenti", cur.rowcount)
+    finally:
+        drop_staging_table(cur, _STAGING_SESSIONI_CHIAVI)
+
+    logger.info("Preparazione insert di %d righe...", len(sessioni))
+    rows = _frame_rows(sessioni, _SESSIONI_COLUMNS)
+    insert_values_chunked(cur, "sessioni_carrellisti", _SESSIONI_COLUMNS, rows, chunk_size)
+    logger.info("Righe inserite: %d", len(rows))
+    return len(rows)
+
+
+def save_sessioni_carrellisti(sessioni: pd.DataFrame, chunk_size: Optional[int] = None) -> None:
     """Salva i dettagli delle sessioni carrellisti nel database con colonne separate per tipo.
-    Include gap_minuti che indica i minuti tra la FINE della riga precedente e l'INIZIO di questa."""
-    if not sessioni:
-        print("[WARN] save_sessioni_carrellisti: nessuna sessione da salvare")
+    Include gap_minuti che indica i minuti tra la FINE della riga precedente e l'INIZIO di questa.
+    Eliminazione delle sessioni precedenti e inserimento avvengono in un'unica transazione."""
+    if sessioni.empty:
+        logger.warning("save_sessioni_carrellisti: nessuna sessione da salvare")
         return
     
-    print(f"[INFO] save_sessioni_carrellisti: ricevute {len(sessioni)} sessioni")
+    logger.info("save_sessioni_carrellisti: ricevute %d sessioni", len(sessioni))
     
+    # Allinea lo schema nel caso l'istanza non abbia ancora le nuove colonne SS
+    ensure_schema()
+
     try:
-        with closing(mysql.connector.connect(**MYSQL_CONFIG)) as conn:
+        with get_connection() as conn:
             # Disabilita autocommit per gestire transazione manuale
             conn.autocommit = False
             
             with closing(conn.cursor()) as cur:
-                # Allinea lo schema nel caso l'istanza non abbia ancora le nuove colonne SS
-                _ensure_sessioni_carrellisti_schema(cur)
-
-                # Prima elimina le sessioni esistenti per le stesse date/codici
-                date_codici = set((s['data'], s['codice_preparatore']) for s in sessioni)
-                print(f"[INFO] Eliminazione sessioni esistenti per {len(date_codici)} combinazioni data/codice...")
-                deleted_count = 0
-                for data, codice in date_codici:
-                    cur.execute(
-                        "DELETE FROM sessioni_carrellisti WHERE data = %s AND codice_preparatore = %s",
-                        (data, codice)
-                    )
-                    deleted_count += cur.rowcount
-                print(f"  [INFO] Eliminate {deleted_count} righe esistenti")
-
-                print(f"[INFO] Preparazione insert di {len(sessioni)} righe...")
-                
-                # Inserisci le nuove righe con colonne separate per tipo
-                cur.executemany(
-                """
-                INSERT INTO sessioni_carrellisti 
-                (data, codice_preparatore, numero_riga, ora_inizio_riga, ora_fine_riga, tempo_riga_minuti, gap_minuti,
-                 movimenti_st, movimenti_ss, movimenti_ap, movimenti_cm, errore,
-                 numero_sessione, ora_inizio_sessione, ora_fine_sessione, tempo_sessione_ore,
-                 totale_righe_sessione,
-                 ore_gestionale_st, ore_gestionale_ss, ore_gestionale_ap, ore_gestionale_cm)
-                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-                """,
-                [
-                    (
-                        s['data'],
-                        s['codice_preparatore'],
-                        s['numero_riga'],
-                        s['ora_inizio_riga'],
-                        s['ora_fine_riga'],
-                        s['tempo_riga_minuti'],
-                        s['gap_minuti'],
-                        s.get('movimenti_st'),
-                        s.get('movimenti_ss'),
-                        s.get('movimenti_ap'),
-                        s.get('movimenti_cm'),
-                        s.get('errore'),
-                        s['numero_sessione'],
-                        s['ora_inizio_sessione'],
-                        s['ora_fine_sessione'],
-                        s['tempo_sessione_ore'],
-                        s['totale_righe_sessione'],
-                        s.get('ore_gestionale_st'),
-                        s.get('ore_gestionale_ss'),
-                        s.get('ore_gestionale_ap'),
-                        s.get('ore_gestionale_cm')
-                    )
-                    for s in sessioni
-                ]
-                )
-                rows_affected = cur.rowcount
-                print(f"[INFO] Righe inserite: {rows_affected}")
+                rows_affected = _replace_sessioni_carrellisti(cur, sessioni, chunk_size)
                 
                 # Commit solo se tutto è andato bene
                 conn.commit()
-                print(f"[OK] Salvate {rows_affected} righe in sessioni_carrellisti (transazione completata)")
-    except Exception as e:
-        import traceback
-        print(f"[ERROR] Errore in save_sessioni_carrellisti: {e}")
-        print(traceback.format_exc())
-        # Rollback in caso di errore per ripristinare i dati eliminati
-        try:
-            if 'conn' in locals():
-                conn.rollback()
-                print("[INFO] Rollback eseguito - dati precedenti ripristinati")
-        except:
-            pass
+                logger.info("Salvate %d righe in sessioni_carrellisti (transazione completata)", rows_affected)
+    except Exception:
+        # Il pool annulla la transazione aperta al rilascio: i dati eliminati vengono ripristinati
+        logger.exception("Errore in save_sessioni_carrellisti: rollback, dati precedenti ripristinati")
         raise
 
 
@@ -1435,7 +1406,7 @@ def fetch_sessioni_carrellisti(
     codice_preparatore: Optional[str] = None
 ) -> List[Dict[str, Any]]:
     """Recupera i dettagli delle sessioni carrellisti, includendo colonne per tipo."""
-    with closing(mysql.connector.connect(**MYSQL_CONFIG)) as conn:
+    with get_connection() as conn:
         with closing(conn.cursor(dictionary=True)) as cur:
             conditions = []
             params = []
@@ -1502,7 +1473,7 @@ def fetch_sessioni_carrellisti(
 
 def delete_sessioni_carrellisti(data: datetime.date, codice_preparatore: Optional[str] = None) -> None:
     """Elimina le sessioni carrellisti per una data (e opzionalmente un codice)."""
-    with closing(mysql.connector.connect(**MYSQL_CONFIG)) as conn:
+    with get_connection() as conn:
         with closing(conn.cursor()) as cur:
             if codice_preparatore:
                 cur.execute(
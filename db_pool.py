@@ -0,0 +1,162 @@
+"""
+Pool di connessioni MySQL condiviso da database.py e dalle viste.
+
+Ogni `with get_connection() as conn:` prende in prestito una connessione già aperta
+(verificandola se è rimasta inattiva) e la restituisce al pool all'uscita, invece di
+aprire e chiudere una connessione TCP per ogni operazione. All'uscita l'eventuale
+transazione aperta viene annullata, così la connessione torna al pool pulita.
+"""
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import mysql.connector
+
+from config import MYSQL_CONFIG, MYSQL_CONFIG_MAIN, MYSQL_POOL_CHECK_AFTER_SECONDS, MYSQL_POOL_SIZE
+
+logger = logging.getLogger(__name__)
+
+
+class ConnectionPool:
+    """Pool thread-safe di connessioni verso un database, con contatori di utilizzo."""
+
+    def __init__(
+        self,
+        config: Dict[str, Any],
+        size: int = MYSQL_POOL_SIZE,
+        name: str = "app",
+        check_after_seconds: float = MYSQL_POOL_CHECK_AFTER_SECONDS,
+    ):
+        self.config = dict(config)
+        self.size = max(1, size)
+        self.name = name
+        self.check_after_seconds = check_after_seconds
+        self._autocommit = bool(self.config.get("autocommit", False))
+        self._idle: List[Tuple[Any, float]] = []
+        self._lock = threading.Lock()
+        self.stats = {"opened": 0, "reused": 0, "discarded": 0}
+
+    def _open(self):
+        conn = mysql.connector.connect(**self.config)
+        with self._lock:
+            self.stats["opened"] += 1
+        return conn
+
+    def _discard(self, conn) -> None:
+        with self._lock:
+            self.stats["discarded"] += 1
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def _is_healthy(self, conn, idle_since: float) -> bool:
+        """Verifica la connessione solo se è rimasta inattiva oltre la soglia."""
+        if time.monotonic() - idle_since < self.check_after_seconds:
+            return True
+        try:
+            conn.ping(reconnect=False)
+            return True
+        except Exception:
+            return False
+
+    def acquire(self):
+        """Restituisce una connessione sana: una inattiva del pool oppure una nuova."""
+        while True:
+            with self._lock:
+                if not self._idle:
+                    break
+                conn, idle_since = self._idle.pop()
+            if self._is_healthy(conn, idle_since):
+                with self._lock:
+                    self.stats["reused"] += 1
+                return conn
+            logger.info("Pool %s: connessione non più valida, scartata", self.name)
+            self._discard(conn)
+        return self._open()
+
+    def release(self, conn) -> None:
+        """Riporta la connessione al pool annullando la transazione aperta; chiude quelle in eccesso."""
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+            # Alcune funzioni cambiano l'autocommit: ripristina quello della configurazione
+            if conn.autocommit != self._autocommit:
+                conn.autocommit = self._autocommit
+        except Exception as e:
+            logger.info("Pool %s: connessione non riutilizzabile (%s), scartata", self.name, e)
+            self._discard(conn)
+            return
+
+        with self._lock:
+            if len(self._idle) < self.size:
+                self._idle.append((conn, time.monotonic()))
+                return
+        conn.close()
+
+    @contextmanager
+    def connection(self) -> Iterator[Any]:
+        conn = self.acquire()
+        try:
+            yield conn
+        finally:
+            self.release(conn)
+
+    def close_all(self) -> None:
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn, _ in idle:
+            try:
+                conn.close()
+            except Exception:
+                pass
+
+
+_pools: Dict[str, ConnectionPool] = {}
+_pools_lock = threading.Lock()
+
+
+def _get_pool(name: str, config: Dict[str, Any]) -> ConnectionPool:
+    with _pools_lock:
+        pool = _pools.get(name)
+        if pool is None:
+            pool = _pools[name] = ConnectionPool(config, name=name)
+        return pool
+
+
+def get_connection():
+    """Connessione in prestito al database dell'applicazione (MYSQL_CONFIG), da usare con `with`."""
+    return _get_pool("app", MYSQL_CONFIG).connection()
+
+
+def get_tim_connection():
+    """Connessione in prestito al database TIM (MYSQL_CONFIG_MAIN), da usare con `with`."""
+    return _get_pool("tim", MYSQL_CONFIG_MAIN).connection()
+
+
+def pool_stats() -> Dict[str, Dict[str, int]]:
+    """Contatori per pool: connessioni aperte, riutilizzate e scartate."""
+    with _pools_lock:
+        return {name: dict(pool.stats) for name, pool in _pools.items()}
+
+
+def log_pool_stats(level: int = logging.INFO) -> None:
+    for name, stats in pool_stats().items():
+        logger.log(
+            level,
+            "Pool %s: aperte=%d, riutilizzate=%d, scartate=%d",
+            name,
+            stats["opened"],
+            stats["reused"],
+            stats["discarded"],
+        )
+
+
+def close_all_pools(pools: Optional[List[str]] = None) -> None:
+    """Chiude le connessioni inattive (tutti i pool o quelli indicati)."""
+    with _pools_lock:
+        selected = [p for n, p in _pools.items() if pools is None or n in pools]
+    for pool in selected:
+        pool.close_all()
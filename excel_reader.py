@@ -0,0 +1,170 @@
+"""
+Lettura unica dei file Excel: il foglio viene caricato una volta in una griglia grezza
+e da questa si ricavano header e DataFrame per tutti i parser.
+"""
+import logging
+import math
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+import pandas as pd
+from openpyxl.cell.cell import ERROR_CODES
+
+logger = logging.getLogger(__name__)
+
+
+def _convert_value(value: Any) -> Any:
+    """Converte un valore di cella con le stesse regole di `pd.read_excel` (engine openpyxl)."""
+    if value is None:
+        return ""
+    if isinstance(value, str) and value in ERROR_CODES:
+        return math.nan
+    if isinstance(value, float):
+        if math.isnan(value):
+            return value
+        as_int = int(value)
+        return as_int if as_int == value else value
+    return value
+
+
+def _is_blank(value: Any) -> bool:
+    """True se il valore corrisponde a una cella vuota (equivalente a NaN in pandas)."""
+    if value is None or value == "":
+        return True
+    return isinstance(value, float) and math.isnan(value)
+
+
+@dataclass
+class SheetGrid:
+    """Contenuto grezzo del primo foglio di un file Excel, letto una sola volta."""
+
+    file_path: str
+    rows: List[List[Any]]
+    timings: Dict[str, float] = field(default_factory=dict)
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        """Misura la durata di una fase di elaborazione e la accumula in `timings`."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timings[name] = self.timings.get(name, 0.0) + time.perf_counter() - start
+
+    @property
+    def width(self) -> int:
+        return len(self.rows[0]) if self.rows else 0
+
+    def row_text(self, idx: int) -> str:
+        """Testo minuscolo della riga, con le celle vuote escluse (per la ricerca dell'header)."""
+        if idx >= len(self.rows):
+            return ""
+        return " ".join(str(v).lower() for v in self.rows[idx] if not _is_blank(v))
+
+    def find_header_row(self, predicate: Callable[[str], bool], max_rows: int) -> Optional[int]:
+        """Restituisce la prima riga (entro `max_rows`) il cui testo soddisfa `predicate`."""
+        with self.phase("header"):
+            for idx in range(min(max_rows, len(self.rows))):
+                if predicate(self.row_text(idx)):
+                    return idx
+        return None
+
+    def unnamed_count(self, header_row: int) -> int:
+        """Numero di colonne che pandas chiamerebbe `Unnamed: n` usando `header_row`."""
+        if header_row >= len(self.rows):
+            return self.width
+        return sum(
+            1 for v in self.rows[header_row]
+            if _is_blank(v) or str(v).startswith("Unnamed")
+        )
+
+    def has_data_after(self, header_row: int) -> bool:
+        """True se esistono righe dati dopo la riga di header indicata."""
+        return header_row + 1 < len(self.rows)
+
+    def to_frame(self, header: Optional[int] = 0) -> pd.DataFrame:
+        """Costruisce il DataFrame come farebbe `pd.read_excel(..., header=header)`."""
+        with self.phase("dataframe"):
+            return rows_to_frame(self.rows, header)
+
+    def log_timings(self) -> None:
+        """Registra nel log i tempi delle singole fasi."""
+        if not self.timings:
+            return
+        detail = ", ".join(f"{name}={secs:.2f}s" for name, secs in self.timings.items())
+        logger.info("Tempi lettura %s: %s (righe=%d)", self.file_path, detail, len(self.rows))
+
+
+def iter_sheet_rows(file_path: str) -> Iterator[List[Any]]:
+    """
+    Scorre le righe del primo foglio in modalità `read_only`, senza caricarlo in memoria.
+
+    Ogni riga è già convertita con le regole di `pd.read_excel` e priva delle celle vuote
+    finali; il workbook viene chiuso al termine dell'iterazione.
+    """
+    from openpyxl import load_workbook
+
+    workbook = load_workbook(file_path, read_only=True, data_only=True, keep_links=False)
+    try:
+        sheet = workbook.worksheets[0]
+        sheet.reset_dimensions()
+        for values in sheet.iter_rows(values_only=True):
+            converted = [_convert_value(v) for v in values]
+            while converted and converted[-1] == "":
+                converted.pop()
+            yield converted
+    finally:
+        workbook.close()
+
+
+def rows_to_frame(rows: List[List[Any]], header: Optional[int] = 0) -> pd.DataFrame:
+    """Costruisce un DataFrame da righe grezze come farebbe `pd.read_excel(..., header=header)`."""
+    from pandas.io.parsers import TextParser
+
+    if not rows or (header is not None and header >= len(rows)):
+        return pd.DataFrame()
+    width = max(len(r) for r in rows)
+    data = [list(r) + [""] * (width - len(r)) for r in rows]
+    return TextParser(data, header=header, skip_blank_lines=False).read()
+
+
+def read_sheet_grid(file_path: str, max_rows: Optional[int] = None) -> SheetGrid:
+    """
+    Legge il primo foglio del file una sola volta e lo restituisce come griglia grezza.
+
+    Le celle vengono convertite con le stesse regole di `pd.read_excel` (celle vuote → "",
+    numeri interi → int); le righe finali vuote vengono scartate e quelle più corte
+    vengono allineate alla larghezza massima.
+
+    Args:
+        file_path: Percorso del file Excel
+        max_rows: Se indicato, legge solo le prime `max_rows` righe
+
+    Returns:
+        SheetGrid con le righe e il tempo impiegato per la lettura
+    """
+    grid = SheetGrid(file_path=file_path, rows=[])
+    with grid.phase("lettura"):
+        rows: List[List[Any]] = []
+        last_row_with_data = -1
+        row_iter = iter_sheet_rows(file_path)
+        try:
+            for row_number, converted in enumerate(row_iter):
+                if converted:
+                    last_row_with_data = row_number
+                rows.append(converted)
+                if max_rows is not None and len(rows) >= max_rows:
+                    break
+        finally:
+            row_iter.close()
+
+        rows = rows[: last_row_with_data + 1]
+        if rows:
+            max_width = max(len(r) for r in rows)
+            for r in rows:
+                if len(r) < max_width:
+                    r.extend([""] * (max_width - len(r)))
+        grid.rows = rows
+    return grid
@@ -12,6 +12,13 @@ import datetime
 from config import WINDOW_CONFIG, FONTS, COLORS
 from ui_components import create_button
 from import_service import ImportService
+from report_fingerprint import (
+    TIPO_AUTOMATICO,
+    TIPO_CARRELLISTI,
+    TIPO_DOPPIA_SPUNTA,
+    TIPO_PREPARATORI,
+    TIPO_RICEVITORI,
+)
 from data_viewer import DataViewer
 
 
@@ -159,10 +166,11 @@ class ImportGUI:
         ).pack(pady=(15, 10), padx=20, anchor="w")
 
         opzioni = [
-            "Preparatori (PICKING)",
-            "Carrellisti (CARRELLO)",
-            "Ricevitori (RICEVITORI)",
-            "Doppia Spunta",
+            TIPO_AUTOMATICO,
+            TIPO_PREPARATORI,
+            TIPO_CARRELLISTI,
+            TIPO_RICEVITORI,
+            TIPO_DOPPIA_SPUNTA,
         ]
         self.tipo_var = StringVar(value=opzioni[0])
         
@@ -184,6 +192,14 @@ class ImportGUI:
             variant="primary",
             width=24,
         ).pack(side="left", padx=5, pady=10)
+
+        create_button(
+            buttons_container,
+            text="📂 Importa cartella...",
+            command=self._import_folder,
+            variant="secondary",
+            width=24,
+        ).pack(side="left", padx=5, pady=10)
         
 
         # Progress bar e status
@@ -235,6 +251,19 @@ class ImportGUI:
             root=self.root
         )
     
+    def _import_folder(self):
+        """Importa in un'unica operazione tutti i file riconosciuti di una cartella mensile."""
+        folder = filedialog.askdirectory(title="Seleziona la cartella con i file del mese")
+        if not folder:
+            return
+
+        self.import_service.import_folder(
+            folder=folder,
+            progress_var=self.progress_var,
+            status_label=self.status_label,
+            root=self.root,
+        )
+    
     def _open_data_viewer(self):
         """Apre la finestra di visualizzazione dati."""
         try:
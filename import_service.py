@@ -2,27 +2,36 @@
 Servizio principale per l'importazione dei dati Excel nel database.
 """
 from pathlib import Path
-from typing import Optional
+from typing import Callable, List, Optional
 import datetime
+import logging
 import time
 import tkinter as tk
 from tkinter import messagebox, IntVar
 from tkinter import ttk
 
-from database import ensure_table_and_indexes, insert_batch_data, update_penalita_picking
-from parsers import (
-    parse_preparatori,
-    parse_carrelisti,
-    parse_ricevitori,
-    parse_doppia_spunta,
-    DoppiaSpuntaResult,
+from database import (
+    apply_penalita_picking_salvate,
+    ensure_table_and_indexes,
+    insert_batch_data,
+    save_import_carrellisti,
+    update_penalita_picking,
 )
-from utils import prepare_dataframe_for_db
+from batch_import import BatchFileResult, find_batch_files, parse_by_tipo, parse_files_parallel
+from parse_cache import ParseCache
+from parsers import DoppiaSpuntaResult
+from report_fingerprint import TIPO_AUTOMATICO, detect_report_type
+from utils import prepare_dataframe_for_db, prepare_penalita_updates
+
+logger = logging.getLogger(__name__)
 
 
 class ImportService:
     """Servizio che gestisce la logica di importazione dei dati."""
 
+    def __init__(self, parse_cache: Optional[ParseCache] = None):
+        self.parse_cache = parse_cache or ParseCache()
+
     def import_excel(
         self,
         file_path: str,
@@ -37,7 +46,7 @@ class ImportService:
         
         Args:
             file_path: Percorso del file Excel
-            tipo: Tipo di attività (Preparatori/Carrellisti/Ricevitori)
+            tipo: Tipo di attività (Preparatori/Carrellisti/Ricevitori) o `TIPO_AUTOMATICO`
             data_rif: Data di riferimento (opzionale, richiesta per Carrellisti)
             progress_var: Variabile per la progress bar
             status_label: Label per messaggi di stato
@@ -53,57 +62,34 @@ class ImportService:
                 messagebox.showwarning("Attenzione", "Seleziona un file Excel valido.")
                 return
 
+            tipo = self._resolve_tipo(file_path, tipo)
+            if tipo is None:
+                status_label.config(text="Importazione annullata.")
+                return
+
             # Parsing file
             elapsed = time.time() - start_time
             self._update_status(f"Lettura file... ({elapsed:.1f}s)", 10, progress_var, status_label, root)
             parse_output = self._parse_file(file_path, tipo, data_rif)
-            penalita_picking_df = None
-
-            if isinstance(parse_output, DoppiaSpuntaResult):
-                penalita_picking_df = parse_output.penalita_picking
-                df_grouped = parse_output.records
-            else:
-                df_grouped = parse_output
 
+            df_grouped, _ = self._split_output(parse_output)
             if df_grouped.empty:
                 self._show_no_data_warning(status_label)
                 return
 
-            # Preparazione dati
-            values = prepare_dataframe_for_db(df_grouped)
-
             # Inserimento in database
             elapsed = time.time() - start_time
             self._update_status(f"Scrittura su database... ({elapsed:.1f}s)", 60, progress_var, status_label, root)
-            records_count = insert_batch_data(values)
-
-            # Aggiornamento penalità per attività PICKING
-            if penalita_picking_df is not None and not penalita_picking_df.empty:
-                elapsed = time.time() - start_time
-                self._update_status(
-                    f"Aggiornamento penalità PICKING... ({elapsed:.1f}s)",
+            records_count = self._write_output(
+                parse_output,
+                on_penalita=lambda: self._update_status(
+                    f"Aggiornamento penalità PICKING... ({time.time() - start_time:.1f}s)",
                     80,
                     progress_var,
                     status_label,
                     root,
-                )
-                update_values = [
-                    (
-                        row["data"],
-                        str(row["codice_preparatore"]),
-                        int(row["penalita"]),
-                    )
-                    for _, row in penalita_picking_df.iterrows()
-                ]
-                updated = update_penalita_picking(update_values)
-                if updated < len(update_values):
-                    print(
-                        f"⚠️ Penalità PICKING aggiornate parzialmente: {updated}/{len(update_values)}"
-                    )
-                else:
-                    print(
-                        f"✓ Penalità PICKING aggiornate: {updated}/{len(update_values)}"
-                    )
+                ),
+            )
 
             # Completamento
             elapsed_total = time.time() - start_time
@@ -123,25 +109,205 @@ class ImportService:
         file_path = (file_path or "").strip()
         return bool(file_path and Path(file_path).exists())
 
+    def _resolve_tipo(self, file_path: str, tipo: str) -> Optional[str]:
+        """
+        Verifica il tipo di report sulle intestazioni del file prima del parsing completo.
+
+        Con `TIPO_AUTOMATICO` usa il tipo riconosciuto; se il tipo scelto è diverso da
+        quello riconosciuto con buona confidenza chiede conferma all'utente.
+
+        Returns:
+            Tipo da usare, None se non determinabile o se l'utente annulla
+        """
+        try:
+            fingerprint = detect_report_type(file_path)
+        except Exception as e:
+            if tipo == TIPO_AUTOMATICO:
+                raise
+            logger.warning("Riconoscimento tipo report non riuscito: %s", e)
+            return tipo
+
+        if tipo == TIPO_AUTOMATICO:
+            if not fingerprint.is_confident:
+                messagebox.showwarning(
+                    "Attenzione",
+                    "Tipo di report non riconosciuto con sicurezza.\n"
+                    "Seleziona manualmente il tipo file/attività.",
+                )
+                return None
+            logger.info("Tipo report riconosciuto: %s (confidenza %.0f%%)", fingerprint.tipo, fingerprint.confidence * 100)
+            return fingerprint.tipo
+
+        if fingerprint.is_confident and fingerprint.tipo != tipo:
+            use_detected = messagebox.askyesnocancel(
+                "Tipo report",
+                f"Il file sembra un report \"{fingerprint.tipo}\" "
+                f"(confidenza {fingerprint.confidence:.0%}), ma è stato scelto \"{tipo}\".\n\n"
+                f"Sì = importa come \"{fingerprint.tipo}\"\n"
+                f"No = importa come \"{tipo}\"",
+            )
+            if use_detected is None:
+                return None
+            return fingerprint.tipo if use_detected else tipo
+        return tipo
+
     def _parse_file(self, file_path: str, tipo: str, data_rif: Optional[datetime.date]):
         """
         Seleziona e applica il parser appropriato basato sul tipo di attività.
+        Se lo stesso file è già stato parsato, il risultato viene letto dalla cache.
+        
+        Returns:
+            DataFrame pandas con i dati parsati, DoppiaSpuntaResult oppure, per i Carrellisti,
+            (DataFrame, dettaglio sessioni)
+        """
+        return parse_by_tipo(file_path, tipo, data_rif, self.parse_cache)
+
+    def _split_output(self, parse_output):
+        """Restituisce (DataFrame da inserire, penalità PICKING o None) dall'output del parser."""
+        if isinstance(parse_output, DoppiaSpuntaResult):
+            return parse_output.records, parse_output.penalita_picking
+        if isinstance(parse_output, tuple):
+            return parse_output[0], None
+        return parse_output, None
+
+    def _write_output(self, parse_output, on_penalita: Optional[Callable[[], None]] = None) -> int:
+        """
+        Scrive su DB l'output di un parser: sessioni Carrellisti, record di produzione
+        e aggiornamento penalità PICKING della Doppia Spunta.
+        
+        Args:
+            parse_output: Output di `_parse_file`
+            on_penalita: Callback chiamata prima dell'aggiornamento penalità (per la UI)
         
         Returns:
-            DataFrame pandas con i dati parsati oppure DoppiaSpuntaResult
+            Numero di record inseriti/aggiornati in dati_produzione
         """
-        if "Preparatori" in tipo:
-            return parse_preparatori(file_path)
-        elif "Carrellisti" in tipo:
-            # I Carrellisti ora hanno la colonna Data nel file, quindi data_rif è opzionale
-            # Se non fornita, verrà usata quella dal file
-            if not data_rif:
-                data_rif = datetime.date.today()  # Fallback, ma il parser userà la data dal file
-            return parse_carrelisti(file_path, data_rif)
-        elif "Doppia" in tipo:
-            return parse_doppia_spunta(file_path)
-        else:
-            return parse_ricevitori(file_path)
+        df_grouped, penalita_picking_df = self._split_output(parse_output)
+
+        records_count = 0
+        if isinstance(parse_output, tuple):
+            # Carrellisti: sessioni e record aggregati nella stessa transazione
+            values = prepare_dataframe_for_db(df_grouped)
+            records_count = save_import_carrellisti(values, parse_output[1])
+        elif not df_grouped.empty:
+            values = prepare_dataframe_for_db(df_grouped)
+            records_count = insert_batch_data(values)
+            self._apply_saved_penalita(df_grouped)
+
+        # Aggiornamento penalità per attività PICKING
+        if penalita_picking_df is not None and not penalita_picking_df.empty:
+            if on_penalita:
+                on_penalita()
+            update_values = prepare_penalita_updates(penalita_picking_df)
+            abbinate, non_abbinate = update_penalita_picking(update_values)
+            totale = abbinate + non_abbinate
+            if non_abbinate:
+                logger.warning(
+                    "Penalità PICKING aggiornate parzialmente: %d/%d (%d senza righe PICKING corrispondenti)",
+                    abbinate,
+                    totale,
+                    non_abbinate,
+                )
+            else:
+                logger.info("Penalità PICKING aggiornate: %d/%d", abbinate, totale)
+
+        return records_count
+
+    def _apply_saved_penalita(self, df_grouped) -> None:
+        """Dopo un import PICKING riapplica le penalità Doppia Spunta salvate per le stesse date."""
+        date_picking = df_grouped.loc[df_grouped["tipo_attivita"] == "PICKING", "data"]
+        if date_picking.empty:
+            return
+        applicate, consumate = apply_penalita_picking_salvate(date_picking.min(), date_picking.max())
+        if applicate:
+            logger.info("Penalità Doppia Spunta applicate ai PICKING: %d (di cui %d in sospeso)", applicate, consumate)
+
+    def import_folder(
+        self,
+        folder: str,
+        progress_var: IntVar,
+        status_label: ttk.Label,
+        root: tk.Tk,
+        max_workers: Optional[int] = None,
+        data_rif: Optional[datetime.date] = None,
+    ) -> List[BatchFileResult]:
+        """
+        Importa tutti i file riconosciuti di una cartella (es. DaImportare/agosto).
+
+        Il parsing avviene in parallelo in un pool di processi; la scrittura su DB segue
+        `BATCH_WRITE_ORDER`, così le righe PICKING esistono prima dell'aggiornamento
+        penalità della Doppia Spunta. `data_rif` è la data di riferimento dei Carrellisti
+        senza colonna Data, come in `import_excel`.
+
+        Returns:
+            Esito per file con tempi di parsing/scrittura e righe al secondo
+        """
+        start_time = time.time()
+        results: List[BatchFileResult] = []
+        try:
+            self._reset_ui(progress_var, status_label, root)
+
+            files = find_batch_files(folder)
+            if not files:
+                messagebox.showwarning("Attenzione", "Nessun file riconosciuto nella cartella selezionata.")
+                return results
+
+            ensure_table_and_indexes()
+
+            parsed_count = 0
+
+            def _on_parsed(result: BatchFileResult):
+                nonlocal parsed_count
+                parsed_count += 1
+                elapsed = time.time() - start_time
+                self._update_status(
+                    f"Lettura file {parsed_count}/{len(files)}... ({elapsed:.1f}s)",
+                    int(10 + 40 * parsed_count / len(files)),
+                    progress_var,
+                    status_label,
+                    root,
+                )
+
+            self._update_status(f"Lettura di {len(files)} file in parallelo...", 10, progress_var, status_label, root)
+            results = parse_files_parallel(
+                files, data_rif=data_rif, max_workers=max_workers, on_parsed=_on_parsed
+            )
+
+            for idx, result in enumerate(results, 1):
+                if result.error:
+                    continue
+                elapsed = time.time() - start_time
+                self._update_status(
+                    f"Scrittura {result.tipo} ({idx}/{len(results)})... ({elapsed:.1f}s)",
+                    int(50 + 50 * idx / len(results)),
+                    progress_var,
+                    status_label,
+                    root,
+                )
+                write_start = time.perf_counter()
+                try:
+                    result.records_scritti = self._write_output(result.output)
+                except Exception as e:
+                    logger.exception("Errore nella scrittura di %s", result.file_path)
+                    result.error = str(e)
+                result.write_seconds = time.perf_counter() - write_start
+                # L'output non serve più: libera la memoria prima del file successivo
+                result.output = None
+
+            elapsed_total = time.time() - start_time
+            report = "\n".join(r.summary() for r in results)
+            logger.info("Import cartella %s completato in %.1fs\n%s", folder, elapsed_total, report)
+            progress_var.set(100)
+            status_label.config(text=f"Importazione cartella completata ✅ ({elapsed_total:.1f}s)")
+            messagebox.showinfo(
+                "Importazione cartella",
+                f"{report}\n\nTempo totale: {elapsed_total:.1f}s",
+            )
+
+        except Exception as e:
+            self._show_error(str(e), status_label)
+
+        return results
 
     def _update_status(
         self, 
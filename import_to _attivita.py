@@ -2,6 +2,8 @@ import mysql.connector
 from difflib import SequenceMatcher
 import csv
 
+from tim_registry import get_tim_registry
+
 # Parametri MySQL
 MYSQL_CONFIG_IMPORT = {
     "host": "172.16.202.141",
@@ -49,6 +51,10 @@ def update_attivita():
         print(f"⚠️ Nessun dato trovato in log_preparatori per la data {DATA_TARGET}")
         return
     
+    # Codice -> utente dall'anagrafica codici TIM locale (nessuna query per riga)
+    registry = get_tim_registry()
+    tipo_picking = registry.tipo_descrizione(PICKING_ID)
+
     conn = mysql.connector.connect(**MYSQL_CONFIG_MAIN)
     cursor = conn.cursor(dictionary=True)
 
@@ -65,35 +71,19 @@ def update_attivita():
         sim_percent = 0
         attivita_info = []
 
-        # 1️⃣ Trovo utente_id dal codice gestionale valido per la data
-        sql_codice = """
-            SELECT utente_id
-            FROM codicegestionale
-            WHERE codice = %s
-              AND tipo_attivita_id = %s
-              AND valido_dal <= %s
-              AND (valido_al IS NULL OR valido_al >= %s)
-            LIMIT 1
-        """
-        cursor.execute(sql_codice, (codice_preparatore, PICKING_ID, data, data))
-        codice_row = cursor.fetchone()
+        # 1️⃣ Trovo l'utente dal codice gestionale valido per la data
+        codice_tim = registry.resolve(codice_preparatore, tipo_picking, data) if tipo_picking else None
 
-        if not codice_row:
+        if not codice_tim:
             esito = "Nessun mapping trovato"
             print(f"❌ {esito} per [Excel: {nome_preparatore_excel}] (Codice: {codice_preparatore}) in data {data}")
             report_rows.append([data, codice_preparatore, nome_preparatore_excel, "-", "-", "-", "-", "-", esito])
             continue
 
-        utente_id = codice_row["utente_id"]
+        utente_id = codice_tim.utente_id
 
-        # 2️⃣ Recupero dati anagrafici dell'utente
-        sql_utente = "SELECT cognome, nome FROM utente WHERE id = %s"
-        cursor.execute(sql_utente, (utente_id,))
-        utente_row = cursor.fetchone()
-        if utente_row:
-            nominativo_db = f"{utente_row['cognome']} {utente_row['nome']}"
-        else:
-            nominativo_db = "(utente non trovato in tabella utente)"
+        # 2️⃣ Dati anagrafici dell'utente (già presenti nell'anagrafica codici)
+        nominativo_db = f"{codice_tim.cognome} {codice_tim.nome}"
 
         # 🔎 Confronto nomi
         sim_score = similarity(nome_preparatore_excel, nominativo_db)
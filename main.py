@@ -1,7 +1,14 @@
 """
 Script principale di avvio dell'applicazione.
 """
+import logging
+import multiprocessing
+
 from main_menu import main
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    # Necessario per il pool di processi dell'import cartella nell'eseguibile PyInstaller
+    multiprocessing.freeze_support()
+    # I messaggi di import e scrittura su DB passano dal logger dei moduli: mostrati in console
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    main()
@@ -0,0 +1,679 @@
+"""
+Migrazioni versionate dello schema del database.
+
+La tabella `schema_version` registra le migrazioni già applicate. All'avvio basta
+leggere la versione corrente: vengono eseguite solo le migrazioni successive, in
+ordine, e `ensure_schema()` lo fa una sola volta per processo.
+
+Le istruzioni DDL di MySQL eseguono un commit implicito, quindi ogni migrazione
+verifica lo stato reale (INFORMATION_SCHEMA) prima di modificare lo schema: se
+viene interrotta a metà può essere rieseguita senza errori.
+
+Per modificare lo schema aggiungere una nuova `Migration` in fondo a `MIGRATIONS`
+con il numero successivo; le migrazioni già rilasciate non vanno modificate.
+"""
+import logging
+import threading
+from contextlib import closing
+from dataclasses import dataclass
+from typing import Any, Callable, List
+
+import mysql.connector
+from mysql.connector import errorcode
+
+from config import TABLE_NAME
+from db_pool import get_connection
+
+logger = logging.getLogger(__name__)
+
+SCHEMA_VERSION_TABLE = "schema_version"
+# Lock MySQL che impedisce a due istanze dell'applicazione di migrare insieme
+_MIGRATION_LOCK_NAME = "app_premi_schema_migration"
+_MIGRATION_LOCK_TIMEOUT = 60
+
+
+@dataclass(frozen=True)
+class Migration:
+    """Passo di migrazione: `apply` riceve il cursore e non esegue il commit."""
+
+    version: int
+    description: str
+    apply: Callable[[Any], None]
+
+
+# ============== HELPER SCHEMA ==============
+
+def _column_exists(cur: Any, table: str, column: str) -> bool:
+    cur.execute(
+        """
+        SELECT COUNT(*) FROM INFORMATION_SCHEMA.COLUMNS
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND COLUMN_NAME = %s
+        """,
+        (table, column),
+    )
+    row = cur.fetchone()
+    return bool(row and row[0])
+
+
+def _index_columns(cur: Any, table: str, index: str) -> List[str]:
+    """Colonne dell'indice nell'ordine di definizione (lista vuota se l'indice non esiste)."""
+    cur.execute(
+        """
+        SELECT COLUMN_NAME FROM INFORMATION_SCHEMA.STATISTICS
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND INDEX_NAME = %s
+        ORDER BY SEQ_IN_INDEX
+        """,
+        (table, index),
+    )
+    return [row[0] for row in cur.fetchall()]
+
+
+def _add_column_if_missing(cur: Any, table: str, column: str, definition: str) -> bool:
+    if _column_exists(cur, table, column):
+        return False
+    cur.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+    logger.info("Colonna %s aggiunta a %s", column, table)
+    return True
+
+
+# ============== MIGRAZIONI ==============
+
+def _m001_tabelle_base(cur: Any) -> None:
+    """Tabelle dell'applicazione nella forma attuale (le tabelle esistenti restano invariate)."""
+    cur.execute(
+        f"""
+        CREATE TABLE IF NOT EXISTS {TABLE_NAME} (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            data DATE NOT NULL,
+            codice_preparatore VARCHAR(50) NOT NULL,
+            nome_preparatore VARCHAR(255),
+            totale_colli INT,
+            penalita INT DEFAULT 0,
+            tipo_attivita VARCHAR(50) NOT NULL,
+            tipo VARCHAR(20),
+            ore_tim DECIMAL(10,2) DEFAULT 0 COMMENT 'Ore di lavoro da TIM',
+            ore_gestionale DECIMAL(10,2) DEFAULT 0 COMMENT 'Ore calcolate con sessioni (solo carrellisti)',
+            UNIQUE KEY uniq_record (data, codice_preparatore, tipo_attivita, tipo)
+        )
+        """
+    )
+
+    cur.execute(
+        """
+        CREATE TABLE IF NOT EXISTS nuove_aperture (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            data_da DATE NOT NULL,
+            data_a DATE NOT NULL,
+            negozio VARCHAR(255) NOT NULL,
+            data_inserimento TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            UNIQUE KEY uniq_apertura (data_da, data_a, negozio)
+        )
+        """
+    )
+
+    cur.execute(
+        """
+        CREATE TABLE IF NOT EXISTS fasce_premi (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            tipo_attivita VARCHAR(50) NOT NULL,
+            valore_riferimento DECIMAL(10,2) NOT NULL,
+            valore_premio DECIMAL(10,5) NOT NULL,
+            unita_riferimento VARCHAR(50) NOT NULL,
+            unita_premio VARCHAR(50) NOT NULL,
+            note VARCHAR(255),
+            UNIQUE KEY uniq_fascia (tipo_attivita, valore_riferimento)
+        )
+        """
+    )
+
+    cur.execute(
+        """
+        CREATE TABLE IF NOT EXISTS peso_movimenti (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            tipo_attivita VARCHAR(50) NOT NULL,
+            tipo VARCHAR(10) NOT NULL,
+            peso DECIMAL(10,3) NOT NULL,
+            note VARCHAR(255),
+            UNIQUE KEY uniq_tipo (tipo_attivita, tipo)
+        )
+        """
+    )
+
+    cur.execute(
+        """
+        CREATE TABLE IF NOT EXISTS malus_bonus (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            anno INT NOT NULL,
+            mese INT NOT NULL,
+            importo_rotture DECIMAL(12,2) NOT NULL DEFAULT 0,
+            importo_differenze DECIMAL(12,2) NOT NULL DEFAULT 0,
+            soglia_bonus DECIMAL(12,2) NOT NULL DEFAULT 2500,
+            soglia_rotture DECIMAL(12,2) NOT NULL DEFAULT 2500,
+            soglia_differenze DECIMAL(12,2) NOT NULL DEFAULT 2500,
+            attivita_bonus VARCHAR(255),
+            note VARCHAR(255),
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+            UNIQUE KEY uniq_mese (anno, mese)
+        )
+        """
+    )
+
+    cur.execute(
+        """
+        CREATE TABLE IF NOT EXISTS report_templates (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            nome VARCHAR(100) NOT NULL,
+            descrizione VARCHAR(255),
+            sql_template TEXT NOT NULL,
+            attivo BOOLEAN NOT NULL DEFAULT TRUE,
+            attivita VARCHAR(50),
+            categoria VARCHAR(50),
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+            UNIQUE KEY uniq_nome (nome)
+        )
+        """
+    )
+
+    cur.execute(
+        """
+        CREATE TABLE IF NOT EXISTS anomalie (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            tipo_anomalia VARCHAR(50) NOT NULL COMMENT 'CODICE_NON_ABBINATO, ORE_SENZA_PRODUZIONE, PRODUZIONE_SENZA_ORE, DIFFERENZA_60_120, DIFFERENZA_>120',
+            data_rilevamento DATE NOT NULL,
+            anno INT NOT NULL COMMENT 'Anno di competenza',
+            mese INT NOT NULL COMMENT 'Mese di competenza (1-12)',
+            codice_preparatore VARCHAR(50) NOT NULL,
+            nome_preparatore VARCHAR(255),
+            tipo_attivita VARCHAR(50),
+            ore_tim DECIMAL(10,2) COMMENT 'Ore presenti in TIM (per anomalie tipo 2)',
+            dettagli TEXT COMMENT 'Descrizione dettagliata anomalia',
+            stato VARCHAR(20) DEFAULT 'APERTA' COMMENT 'APERTA, VERIFICATA, RISOLTA',
+            note VARCHAR(255),
+            data_creazione TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            data_aggiornamento TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+            INDEX idx_tipo (tipo_anomalia),
+            INDEX idx_data (data_rilevamento),
+            INDEX idx_anno_mese (anno, mese),
+            INDEX idx_stato (stato),
+            INDEX idx_codice (codice_preparatore)
+        )
+        """
+    )
+
+    cur.execute(
+        """
+        CREATE TABLE IF NOT EXISTS premi_carrellisti (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            anno INT NOT NULL,
+            mese INT NOT NULL,
+            codice_preparatore VARCHAR(50) NOT NULL,
+            nome_preparatore VARCHAR(255),
+            totale_movimenti DECIMAL(10,2) NOT NULL,
+            ore_lavorate DECIMAL(10,2) NOT NULL,
+            movimenti_ora DECIMAL(10,2) NOT NULL,
+            fascia_raggiunta VARCHAR(50),
+            premio_base DECIMAL(10,2) NOT NULL DEFAULT 0,
+            premio_kpi DECIMAL(10,2) NOT NULL DEFAULT 0,
+            premio_totale DECIMAL(10,2) NOT NULL DEFAULT 0,
+            bonus_applicato BOOLEAN DEFAULT FALSE,
+            data_calcolo TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            note VARCHAR(255),
+            UNIQUE KEY uniq_premio (anno, mese, codice_preparatore),
+            INDEX idx_anno_mese (anno, mese),
+            INDEX idx_codice (codice_preparatore)
+        )
+        """
+    )
+
+    cur.execute(
+        """
+        CREATE TABLE IF NOT EXISTS premi_preparatori (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            anno INT NOT NULL,
+            mese INT NOT NULL,
+            codice_preparatore VARCHAR(50) NOT NULL,
+            nome_preparatore VARCHAR(255),
+            totale_colli DECIMAL(12,0) NOT NULL DEFAULT 0,
+            ore_lavorate DECIMAL(10,2) NOT NULL DEFAULT 0,
+            colli_ora DECIMAL(10,2) NOT NULL DEFAULT 0,
+            fascia_raggiunta VARCHAR(50),
+            premio_base DECIMAL(10,2) NOT NULL DEFAULT 0,
+            penalita_totale DECIMAL(10,2) NOT NULL DEFAULT 0,
+            premio_kpi DECIMAL(10,2) NOT NULL DEFAULT 0,
+            premio_totale DECIMAL(10,2) NOT NULL DEFAULT 0,
+            bonus_applicato BOOLEAN DEFAULT FALSE,
+            data_calcolo TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            note VARCHAR(255),
+            UNIQUE KEY uniq_premio_preparatori (anno, mese, codice_preparatore),
+            INDEX idx_preparatori_anno_mese (anno, mese),
+            INDEX idx_preparatori_codice (codice_preparatore)
+        )
+        """
+    )
+
+    cur.execute(
+        """
+        CREATE TABLE IF NOT EXISTS sessioni_carrellisti (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            data DATE NOT NULL,
+            codice_preparatore VARCHAR(50) NOT NULL,
+            numero_riga INT NOT NULL COMMENT 'Progressivo riga nella giornata',
+            ora_inizio_riga TIME NOT NULL COMMENT 'Ora inizio di questa singola riga',
+            ora_fine_riga TIME NOT NULL COMMENT 'Ora fine di questa singola riga',
+            tempo_riga_minuti DECIMAL(10,2) NOT NULL COMMENT 'Durata in minuti di questa singola riga',
+            gap_minuti DECIMAL(10,2) NULL COMMENT 'Minuti tra FINE riga precedente e INIZIO questa (NULL per prima riga)',
+
+            -- Movimenti per tipo (1 o NULL)
+            movimenti_st INT NULL COMMENT 'Movimenti ST in questa riga',
+            movimenti_ss INT NULL COMMENT 'Movimenti SS in questa riga',
+            movimenti_ap INT NULL COMMENT 'Movimenti AP in questa riga',
+            movimenti_cm INT NULL COMMENT 'Movimenti CM in questa riga',
+
+            -- Errore (se presente, movimento non conteggiato)
+            errore TEXT NULL COMMENT 'Descrizione errore se movimento non valido',
+
+            -- Dettagli sessione (solo prima riga della sessione)
+            numero_sessione INT NOT NULL,
+            ora_inizio_sessione TIME NULL COMMENT 'Inizio sessione (solo prima riga)',
+            ora_fine_sessione TIME NULL COMMENT 'Fine sessione (solo prima riga)',
+            tempo_sessione_ore DECIMAL(10,2) NULL COMMENT 'Durata totale sessione (solo prima riga)',
+            totale_righe_sessione INT NULL COMMENT 'Numero righe nella sessione (solo prima riga)',
+
+            -- Totali giornalieri per tipo (solo prima riga di ogni tipo)
+            ore_gestionale_st DECIMAL(10,2) NULL COMMENT 'Ore totali ST nella giornata (solo prima riga ST)',
+            ore_gestionale_ss DECIMAL(10,2) NULL COMMENT 'Ore totali SS nella giornata (solo prima riga SS)',
+            ore_gestionale_ap DECIMAL(10,2) NULL COMMENT 'Ore totali AP nella giornata (solo prima riga AP)',
+            ore_gestionale_cm DECIMAL(10,2) NULL COMMENT 'Ore totali CM nella giornata (solo prima riga CM)',
+
+            data_importazione TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            INDEX idx_data_codice (data, codice_preparatore),
+            INDEX idx_data (data),
+            INDEX idx_sessione (data, codice_preparatore, numero_sessione)
+        )
+        """
+    )
+
+
+def _m002_tempo_in_ore_tim(cur: Any) -> None:
+    """Vecchia colonna `tempo` (minuti) convertita in `ore_tim` (ore) e rimossa."""
+    if not _column_exists(cur, TABLE_NAME, "tempo"):
+        return
+    _add_column_if_missing(cur, TABLE_NAME, "ore_tim", "DECIMAL(10,2) DEFAULT 0 COMMENT 'Ore di lavoro da TIM'")
+    cur.execute(f"UPDATE {TABLE_NAME} SET ore_tim = tempo / 60.0 WHERE tempo IS NOT NULL")
+    cur.execute(f"ALTER TABLE {TABLE_NAME} DROP COLUMN tempo")
+    logger.info("Colonna tempo di %s convertita in ore_tim", TABLE_NAME)
+
+
+def _m003_ore_gestionale(cur: Any) -> None:
+    _add_column_if_missing(
+        cur,
+        TABLE_NAME,
+        "ore_gestionale",
+        "DECIMAL(10,2) DEFAULT 0 COMMENT 'Ore calcolate con sessioni (solo carrellisti)'",
+    )
+
+
+def _m004_peso_movimenti_tipo_attivita(cur: Any) -> None:
+    """Colonna tipo_attivita e indice univoco (tipo_attivita, tipo) sulle tabelle create senza."""
+    _add_column_if_missing(cur, "peso_movimenti", "tipo_attivita", "VARCHAR(50) NOT NULL DEFAULT 'CARRELLISTI'")
+    if _index_columns(cur, "peso_movimenti", "uniq_tipo") != ["tipo_attivita", "tipo"]:
+        if _index_columns(cur, "peso_movimenti", "uniq_tipo"):
+            cur.execute("ALTER TABLE peso_movimenti DROP INDEX uniq_tipo")
+        cur.execute("ALTER TABLE peso_movimenti ADD UNIQUE INDEX uniq_tipo (tipo_attivita, tipo)")
+    cur.execute(
+        """
+        UPDATE peso_movimenti
+        SET tipo_attivita = 'CARRELLISTI'
+        WHERE tipo_attivita IS NULL OR tipo_attivita = ''
+        """
+    )
+
+
+def _m005_valori_predefiniti(cur: Any) -> None:
+    """Fasce premi e pesi movimenti predefiniti, solo se le tabelle sono vuote."""
+    cur.execute("SELECT COUNT(*) FROM fasce_premi")
+    count_row = cur.fetchone()
+    if not (count_row and count_row[0]):
+        default_rows = [
+            ("PICKING", 100, 0.00700, "COLLI/h", "€/COL", None),
+            ("PICKING", 105, 0.00711, "COLLI/h", "€/COL", None),
+            ("PICKING", 110, 0.00722, "COLLI/h", "€/COL", None),
+            ("PICKING", 115, 0.00733, "COLLI/h", "€/COL", None),
+            ("PICKING", 120, 0.00744, "COLLI/h", "€/COL", None),
+            ("PICKING", 125, 0.00755, "COLLI/h", "€/COL", None),
+            ("PICKING", 130, 0.00766, "COLLI/h", "€/COL", None),
+            ("PICKING", 135, 0.00777, "COLLI/h", "€/COL", None),
+            ("PICKING", 140, 0.00789, "COLLI/h", "€/COL", None),
+            ("CARRELLISTI", 18, 0.03000, "Mov/h", "€/Plt", None),
+            ("CARRELLISTI", 20, 0.03630, "Mov/h", "€/Plt", None),
+            ("CARRELLISTI", 22, 0.04392, "Mov/h", "€/Plt", None),
+            ("CARRELLISTI", 24, 0.05314, "Mov/h", "€/Plt", None),
+            ("CARRELLISTI", 26, 0.06430, "Mov/h", "€/Plt", None),
+            ("RICEVITORI", 18, 2.50, "Plt/h", "€/gg", None),
+            ("RICEVITORI", 20, 3.60, "Plt/h", "€/gg", None),
+            ("RICEVITORI", 22, 5.18, "Plt/h", "€/gg", None),
+            ("RICEVITORI", 24, 7.46, "Plt/h", "€/gg", None),
+            ("DOPPIA_SPUNTA", 147, 0.00500, "Colli/h", "€/collo", None),
+            ("DOPPIA_SPUNTA", 160, 0.00525, "Colli/h", "€/collo", None),
+            ("DOPPIA_SPUNTA", 173, 0.00551, "Colli/h", "€/collo", None),
+            ("DOPPIA_SPUNTA", 186, 0.00579, "Colli/h", "€/collo", None),
+            ("DOPPIA_SPUNTA", 199, 0.00608, "Colli/h", "€/collo", None),
+        ]
+        cur.executemany(
+            """
+            INSERT INTO fasce_premi
+            (tipo_attivita, valore_riferimento, valore_premio, unita_riferimento, unita_premio, note)
+            VALUES (%s, %s, %s, %s, %s, %s)
+            """,
+            default_rows,
+        )
+
+    cur.execute("SELECT COUNT(*) FROM peso_movimenti")
+    peso_count_row = cur.fetchone()
+    if not (peso_count_row and peso_count_row[0]):
+        movimento_rows = [
+            ("CARRELLISTI", "ST", 1.0, None),
+            ("CARRELLISTI", "SS", 1.0, None),
+            ("CARRELLISTI", "CM", 1.0, None),
+            ("CARRELLISTI", "AP", 1.3, None),
+        ]
+        cur.executemany(
+            """
+            INSERT INTO peso_movimenti (tipo_attivita, tipo, peso, note)
+            VALUES (%s, %s, %s, %s)
+            """,
+            movimento_rows,
+        )
+
+
+def _m006_report_templates_attivita(cur: Any) -> None:
+    _add_column_if_missing(cur, "report_templates", "attivita", "VARCHAR(50) AFTER attivo")
+
+
+def _m007_anomalie_competenza(cur: Any) -> None:
+    """Anno e mese di competenza delle anomalie, con il relativo indice."""
+    _add_column_if_missing(cur, "anomalie", "anno", "INT NOT NULL DEFAULT 0 COMMENT 'Anno di competenza'")
+    _add_column_if_missing(cur, "anomalie", "mese", "INT NOT NULL DEFAULT 0 COMMENT 'Mese di competenza (1-12)'")
+    if not _index_columns(cur, "anomalie", "idx_anno_mese"):
+        cur.execute("CREATE INDEX idx_anno_mese ON anomalie (anno, mese)")
+
+
+def _m008_malus_bonus_soglie(cur: Any) -> None:
+    """Attività bonus e soglie separate rotture/differenze, inizializzate dalla vecchia soglia_bonus."""
+    _add_column_if_missing(cur, "malus_bonus", "attivita_bonus", "VARCHAR(255) NULL")
+    for column in ("soglia_rotture", "soglia_differenze"):
+        _add_column_if_missing(cur, "malus_bonus", column, "DECIMAL(12,2) NULL")
+        cur.execute(f"UPDATE malus_bonus SET {column} = soglia_bonus WHERE {column} IS NULL")
+
+
+def _m009_sessioni_carrellisti_colonne(cur: Any) -> None:
+    """Colonne SS ed errore aggiunte dopo la prima versione di sessioni_carrellisti."""
+    _add_column_if_missing(
+        cur,
+        "sessioni_carrellisti",
+        "movimenti_ss",
+        "INT NULL COMMENT 'Movimenti SS in questa riga' AFTER movimenti_st",
+    )
+    _add_column_if_missing(
+        cur,
+        "sessioni_carrellisti",
+        "errore",
+        "TEXT NULL COMMENT 'Descrizione errore se movimento non valido' AFTER movimenti_cm",
+    )
+    _add_column_if_missing(
+        cur,
+        "sessioni_carrellisti",
+        "ore_gestionale_ss",
+        "DECIMAL(10,2) NULL COMMENT 'Ore totali SS nella giornata (solo prima riga SS)' AFTER ore_gestionale_st",
+    )
+
+
+def _m010_penalita_picking(cur: Any) -> None:
+    """Penalità della Doppia Spunta conservate per essere applicate anche ai PICKING importati dopo."""
+    cur.execute(
+        """
+        CREATE TABLE IF NOT EXISTS penalita_picking (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            data DATE NOT NULL,
+            codice_preparatore VARCHAR(50) NOT NULL,
+            penalita INT NOT NULL DEFAULT 0,
+            consumata_il TIMESTAMP NULL COMMENT 'Prima applicazione a righe PICKING (NULL = in sospeso)',
+            aggiornata_il TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+            UNIQUE KEY uniq_penalita (data, codice_preparatore),
+            INDEX idx_in_sospeso (consumata_il, data)
+        )
+        """
+    )
+
+
+def _m011_anomalie_chiave_univoca(cur: Any) -> None:
+    """
+    Chiave univoca (tipo_anomalia, data_rilevamento, codice_preparatore, tipo_attivita).
+
+    `tipo_attivita` diventa NOT NULL DEFAULT '' (i NULL sono distinti in una chiave univoca
+    e ammetterebbero duplicati). Dei duplicati accumulati dalle sincronizzazioni ripetute
+    resta una riga per chiave: quella già presa in carico (stato diverso da APERTA) o, a
+    parità, la più recente.
+    """
+    if _index_columns(cur, "anomalie", "uniq_anomalia"):
+        return
+    cur.execute("UPDATE anomalie SET tipo_attivita = '' WHERE tipo_attivita IS NULL")
+    cur.execute("ALTER TABLE anomalie MODIFY COLUMN tipo_attivita VARCHAR(50) NOT NULL DEFAULT ''")
+    cur.execute(
+        """
+        DELETE a FROM anomalie a
+        JOIN anomalie b
+          ON a.tipo_anomalia = b.tipo_anomalia
+         AND a.data_rilevamento = b.data_rilevamento
+         AND a.codice_preparatore = b.codice_preparatore
+         AND a.tipo_attivita = b.tipo_attivita
+         AND a.id <> b.id
+        WHERE (COALESCE(b.stato, 'APERTA') <> 'APERTA') > (COALESCE(a.stato, 'APERTA') <> 'APERTA')
+           OR ((COALESCE(b.stato, 'APERTA') <> 'APERTA') = (COALESCE(a.stato, 'APERTA') <> 'APERTA')
+               AND b.id > a.id)
+        """
+    )
+    logger.info("Anomalie duplicate rimosse: %d", cur.rowcount)
+    cur.execute(
+        """
+        ALTER TABLE anomalie
+        ADD UNIQUE KEY uniq_anomalia (tipo_anomalia, data_rilevamento, codice_preparatore, tipo_attivita)
+        """
+    )
+
+
+def _m012_indici_periodo(cur: Any) -> None:
+    """
+    Indice per le query mensili per attività (calcolo premi, sincronizzazione TIM).
+
+    Ordine: uguaglianza su tipo_attivita, intervallo su data, poi le colonne raggruppate
+    e sommate, così le query premi sono risolte dal solo indice.
+    """
+    if not _index_columns(cur, TABLE_NAME, "idx_attivita_data_codice"):
+        cur.execute(
+            f"""
+            CREATE INDEX idx_attivita_data_codice ON {TABLE_NAME} (
+                tipo_attivita, data, codice_preparatore, nome_preparatore, tipo,
+                totale_colli, ore_tim, ore_gestionale, penalita
+            )
+            """
+        )
+
+
+def _m013_codice_normalizzato(cur: Any) -> None:
+    """
+    Codice operatore normalizzato (maiuscolo, senza spazi) come colonna generata e indicizzata.
+
+    Sostituisce i confronti `LOWER(codice_preparatore) = LOWER(%s)`, che non possono usare
+    indici, con un'uguaglianza su `codice_norm`; le righe esistenti non vanno riscritte.
+    """
+    _add_column_if_missing(
+        cur,
+        TABLE_NAME,
+        "codice_norm",
+        "VARCHAR(50) AS (UPPER(TRIM(codice_preparatore))) STORED",
+    )
+    if not _index_columns(cur, TABLE_NAME, "idx_codice_norm"):
+        cur.execute(
+            f"CREATE INDEX idx_codice_norm ON {TABLE_NAME} (codice_norm, tipo_attivita, data, tipo)"
+        )
+
+
+def _m014_sincronizzazione_incrementale(cur: Any) -> None:
+    """
+    Stato della sincronizzazione TIM per giorno e attività, e data di modifica delle righe.
+
+    `updated_at` cambia solo con gli import (la sincronizzazione lo lascia invariato):
+    i giorni con righe modificate dopo `sincronizzato_il` vanno sincronizzati di nuovo.
+    """
+    _add_column_if_missing(
+        cur,
+        TABLE_NAME,
+        "updated_at",
+        "TIMESTAMP(6) NOT NULL DEFAULT CURRENT_TIMESTAMP(6) ON UPDATE CURRENT_TIMESTAMP(6)",
+    )
+    if not _index_columns(cur, TABLE_NAME, "idx_attivita_data_modifica"):
+        cur.execute(
+            f"CREATE INDEX idx_attivita_data_modifica ON {TABLE_NAME} (tipo_attivita, data, updated_at)"
+        )
+    cur.execute(
+        """
+        CREATE TABLE IF NOT EXISTS sync_tim_stato (
+            data DATE NOT NULL,
+            tipo_attivita VARCHAR(50) NOT NULL,
+            sincronizzato_il TIMESTAMP(6) NOT NULL COMMENT 'Inizio della sincronizzazione che ha riconciliato il giorno',
+            firma_tim VARCHAR(255) NULL COMMENT 'Firma delle attività TIM del giorno al momento della sincronizzazione',
+            PRIMARY KEY (data, tipo_attivita)
+        )
+        """
+    )
+
+
+def _m015_tim_codici(cur: Any) -> None:
+    """Copia locale dell'anagrafica codici TIM (codicegestionale + utente), vedi tim_registry.py."""
+    cur.execute(
+        """
+        CREATE TABLE IF NOT EXISTS tim_codici (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            codice_norm VARCHAR(50) NOT NULL,
+            tipo_attivita_id VARCHAR(50) NOT NULL,
+            tipo_attivita VARCHAR(100) NOT NULL COMMENT 'Descrizione del tipo attività in TIM',
+            utente_id VARCHAR(50) NOT NULL,
+            nome VARCHAR(100) NULL,
+            cognome VARCHAR(100) NULL,
+            valido_dal DATE NOT NULL,
+            valido_al DATE NULL,
+            aggiornato_il TIMESTAMP(6) NOT NULL COMMENT 'Ultima copia da TIM',
+            checksum_codici BIGINT NULL COMMENT 'CHECKSUM TABLE codicegestionale al momento della copia',
+            INDEX idx_codice_validita (codice_norm, tipo_attivita, valido_dal)
+        )
+        """
+    )
+
+
+MIGRATIONS: List[Migration] = [
+    Migration(1, "Tabelle di base", _m001_tabelle_base),
+    Migration(2, f"{TABLE_NAME}: tempo (minuti) convertito in ore_tim (ore)", _m002_tempo_in_ore_tim),
+    Migration(3, f"{TABLE_NAME}: colonna ore_gestionale", _m003_ore_gestionale),
+    Migration(4, "peso_movimenti: tipo_attivita e indice univoco", _m004_peso_movimenti_tipo_attivita),
+    Migration(5, "Fasce premi e pesi movimenti predefiniti", _m005_valori_predefiniti),
+    Migration(6, "report_templates: colonna attivita", _m006_report_templates_attivita),
+    Migration(7, "anomalie: anno e mese di competenza", _m007_anomalie_competenza),
+    Migration(8, "malus_bonus: attivita_bonus e soglie rotture/differenze", _m008_malus_bonus_soglie),
+    Migration(9, "sessioni_carrellisti: colonne SS ed errore", _m009_sessioni_carrellisti_colonne),
+    Migration(10, "penalita_picking: penalità Doppia Spunta in attesa dei PICKING", _m010_penalita_picking),
+    Migration(11, "anomalie: chiave univoca e rimozione duplicati", _m011_anomalie_chiave_univoca),
+    Migration(12, f"{TABLE_NAME}: indice (tipo_attivita, data, codice_preparatore, ...)", _m012_indici_periodo),
+    Migration(13, f"{TABLE_NAME}: codice_norm generato e indicizzato", _m013_codice_normalizzato),
+    Migration(14, "sync_tim_stato e updated_at per la sincronizzazione incrementale", _m014_sincronizzazione_incrementale),
+    Migration(15, "tim_codici: copia locale dell'anagrafica codici TIM", _m015_tim_codici),
+]
+
+if any(b.version <= a.version for a, b in zip(MIGRATIONS, MIGRATIONS[1:])):
+    raise ValueError("Le versioni in MIGRATIONS devono essere crescenti")
+
+SCHEMA_VERSION = MIGRATIONS[-1].version
+
+
+# ============== APPLICAZIONE ==============
+
+def get_schema_version(cur: Any) -> int:
+    """Versione corrente dello schema; crea `schema_version` se manca (versione 0)."""
+    try:
+        cur.execute(f"SELECT COALESCE(MAX(version), 0) FROM {SCHEMA_VERSION_TABLE}")
+    except mysql.connector.Error as exc:
+        if getattr(exc, "errno", None) != errorcode.ER_NO_SUCH_TABLE:
+            raise
+        cur.execute(
+            f"""
+            CREATE TABLE IF NOT EXISTS {SCHEMA_VERSION_TABLE} (
+                version INT PRIMARY KEY,
+                descrizione VARCHAR(255) NOT NULL,
+                applicata_il TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+            """
+        )
+        return 0
+    row = cur.fetchone()
+    return int(row[0]) if row else 0
+
+
+def apply_migrations(conn: Any) -> List[int]:
+    """
+    Applica in ordine le migrazioni successive alla versione registrata.
+
+    Args:
+        conn: Connessione al database dell'applicazione
+
+    Returns:
+        Versioni applicate (lista vuota se lo schema era già aggiornato)
+    """
+    applied: List[int] = []
+    with closing(conn.cursor()) as cur:
+        if get_schema_version(cur) >= SCHEMA_VERSION:
+            return applied
+
+        cur.execute("SELECT GET_LOCK(%s, %s)", (_MIGRATION_LOCK_NAME, _MIGRATION_LOCK_TIMEOUT))
+        lock_row = cur.fetchone()
+        if not (lock_row and lock_row[0] == 1):
+            raise RuntimeError("Migrazione dello schema in corso da un'altra istanza: riprovare più tardi")
+        try:
+            # Rilegge la versione: un'altra istanza può aver migrato mentre si attendeva il lock
+            current = get_schema_version(cur)
+            for migration in MIGRATIONS:
+                if migration.version <= current:
+                    continue
+                logger.info("Migrazione schema %d: %s", migration.version, migration.description)
+                migration.apply(cur)
+                cur.execute(
+                    f"INSERT INTO {SCHEMA_VERSION_TABLE} (version, descrizione) VALUES (%s, %s)",
+                    (migration.version, migration.description),
+                )
+                conn.commit()
+                applied.append(migration.version)
+        finally:
+            cur.execute("SELECT RELEASE_LOCK(%s)", (_MIGRATION_LOCK_NAME,))
+            cur.fetchone()
+
+    if applied:
+        logger.info("Schema aggiornato alla versione %d", SCHEMA_VERSION)
+    return applied
+
+
+_schema_ready = False
+_schema_lock = threading.Lock()
+
+
+def ensure_schema() -> None:
+    """Porta lo schema all'ultima versione; dopo la prima chiamata riuscita non accede al DB."""
+    global _schema_ready
+    if _schema_ready:
+        return
+    with _schema_lock:
+        if _schema_ready:
+            return
+        with get_connection() as conn:
+            apply_migrations(conn)
+        _schema_ready = True
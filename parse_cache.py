@@ -0,0 +1,163 @@
+"""
+Cache su disco dei risultati dei parser per i file Excel già importati.
+
+La chiave è composta da SHA-256 del contenuto del file, tipo di parser e `PARSER_VERSION`:
+reimportare lo stesso file (ad esempio dopo una sincronizzazione TIM fallita) evita
+la lettura openpyxl e il calcolo delle sessioni. Ogni voce è un file pickle con i
+DataFrame prodotti dal parser (salvati a blocchi di colonne da pandas), compreso il
+dettaglio sessioni dei carrellisti; le voci meno usate di recente vengono rimosse
+quando la cache supera la dimensione massima.
+"""
+import hashlib
+import logging
+import os
+import pickle
+import tempfile
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional
+
+from config import PARSE_CACHE_DIR, PARSE_CACHE_MAX_MB
+from parsers import PARSER_VERSION, DoppiaSpuntaResult
+
+logger = logging.getLogger(__name__)
+
+_HASH_CHUNK_BYTES = 1024 * 1024
+_ENTRY_SUFFIX = ".pkl"
+
+
+def file_sha256(file_path: str) -> str:
+    """Calcola lo SHA-256 del contenuto del file leggendolo a blocchi."""
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as fh:
+        for chunk in iter(lambda: fh.read(_HASH_CHUNK_BYTES), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _pack(result: Any) -> Dict[str, Any]:
+    """Prepara l'output di un parser per la serializzazione."""
+    if isinstance(result, DoppiaSpuntaResult):
+        return {
+            "kind": "doppia_spunta",
+            "records": result.records,
+            "penalita_picking": result.penalita_picking,
+        }
+    if isinstance(result, tuple):
+        df, sessioni = result
+        return {"kind": "carrellisti", "records": df, "sessioni": sessioni}
+    return {"kind": "frame", "records": result}
+
+
+def _unpack(payload: Dict[str, Any]) -> Any:
+    kind = payload["kind"]
+    if kind == "doppia_spunta":
+        return DoppiaSpuntaResult(records=payload["records"], penalita_picking=payload["penalita_picking"])
+    if kind == "carrellisti":
+        return payload["records"], payload["sessioni"]
+    return payload["records"]
+
+
+class ParseCache:
+    """Cache dei risultati dei parser indicizzata per contenuto del file."""
+
+    def __init__(self, cache_dir: Optional[str] = None, max_bytes: Optional[int] = None):
+        self.cache_dir = Path(cache_dir or PARSE_CACHE_DIR)
+        self.max_bytes = max_bytes if max_bytes is not None else PARSE_CACHE_MAX_MB * 1024 * 1024
+
+    def make_key(self, file_path: str, parser_type: str, extra: str = "") -> str:
+        """Chiave della voce: hash del file + tipo parser + versione parser (+ parametri)."""
+        parts = [file_sha256(file_path), parser_type, f"v{PARSER_VERSION}"]
+        if extra:
+            parts.append(extra)
+        return hashlib.sha256("|".join(parts).encode("utf-8")).hexdigest()
+
+    def _entry_path(self, key: str) -> Path:
+        return self.cache_dir / f"{key}{_ENTRY_SUFFIX}"
+
+    def get(self, key: str) -> Optional[Any]:
+        """Restituisce il risultato salvato per `key`, oppure None se assente o illeggibile."""
+        path = self._entry_path(key)
+        if not path.exists():
+            return None
+        try:
+            with open(path, "rb") as fh:
+                payload = pickle.load(fh)
+            result = _unpack(payload)
+        except Exception as e:
+            logger.warning("Voce di cache non leggibile %s, verrà ricalcolata: %s", path.name, e)
+            path.unlink(missing_ok=True)
+            return None
+        # Aggiorna la data di ultimo accesso per l'eviction LRU
+        os.utime(path, None)
+        return result
+
+    def put(self, key: str, result: Any) -> None:
+        """Salva il risultato in modo atomico e rimuove le voci più vecchie oltre il limite."""
+        if self.max_bytes <= 0:
+            return
+        try:
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+            fd, tmp_name = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+            try:
+                with os.fdopen(fd, "wb") as fh:
+                    pickle.dump(_pack(result), fh, protocol=pickle.HIGHEST_PROTOCOL)
+                os.replace(tmp_name, self._entry_path(key))
+            except BaseException:
+                Path(tmp_name).unlink(missing_ok=True)
+                raise
+        except Exception as e:
+            logger.warning("Impossibile salvare la cache di parsing in %s: %s", self.cache_dir, e)
+            return
+        self._evict()
+
+    def _evict(self) -> None:
+        """Elimina le voci usate meno di recente finché la cache non rientra in `max_bytes`."""
+        entries = []
+        for path in self.cache_dir.glob(f"*{_ENTRY_SUFFIX}"):
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                path.unlink()
+                total -= size
+                logger.info("Cache di parsing: rimossa voce %s (%d byte)", path.name, size)
+            except OSError as e:
+                logger.warning("Impossibile rimuovere %s dalla cache: %s", path, e)
+
+    def get_or_parse(
+        self,
+        file_path: str,
+        parser_type: str,
+        parse_func: Callable[[str], Any],
+        extra: str = "",
+    ) -> Any:
+        """
+        Restituisce il risultato in cache per il file, altrimenti esegue `parse_func` e lo salva.
+
+        Args:
+            file_path: Percorso del file Excel
+            parser_type: Nome del parser (es. "preparatori", "carrellisti")
+            parse_func: Funzione che riceve il percorso e restituisce l'output del parser
+            extra: Parametri aggiuntivi che influenzano il risultato (es. data di riferimento)
+        """
+        try:
+            key = self.make_key(file_path, parser_type, extra)
+        except OSError as e:
+            logger.warning("Impossibile calcolare l'hash di %s, cache ignorata: %s", file_path, e)
+            return parse_func(file_path)
+
+        cached = self.get(key)
+        if cached is not None:
+            logger.info("Cache di parsing: risultato riutilizzato per %s (%s)", file_path, parser_type)
+            return cached
+
+        result = parse_func(file_path)
+        self.put(key, result)
+        return result
@@ -22,14 +22,31 @@ Parser per i diversi tipi di file Excel (Preparatori, Carrellisti, Ricevitori, D
 """
 import datetime
 import logging
+import time
 import numpy as np
 from dataclasses import dataclass
-from typing import List, Optional
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
 import pandas as pd
-from utils import find_column, normalize_string, safe_int_conversion
+from column_profiles import resolve_columns
+from excel_reader import iter_sheet_rows, read_sheet_grid, rows_to_frame
+from utils import (
+    convert_unique,
+    find_column,
+    normalize_string,
+    parse_date,
+    parse_tempo_lavorato,
+    parse_time,
+    safe_int_conversion,
+)
 
 logger = logging.getLogger(__name__)
 
+# Versione dell'output dei parser: va incrementata ad ogni modifica che cambia i DataFrame
+# o il dettaglio sessioni prodotti (anche nella ricerca delle colonne), così la cache di
+# parsing e i profili colonne scartano i risultati precedenti.
+PARSER_VERSION = 3
+
 @dataclass
 class DoppiaSpuntaResult:
     """Risultato del parsing Doppia Spunta con dati per DB e penalità picking."""
@@ -40,22 +57,30 @@ class DoppiaSpuntaResult:
 
 
 def _read_excel_with_fallbacks(file_path: str, header_candidates: List[int]) -> pd.DataFrame:
-    """Utility interna per leggere un file Excel provando più header."""
+    """Utility interna per leggere un file Excel provando più header sulla stessa griglia."""
     errors: List[str] = []
-    for header_row in header_candidates:
-        try:
-            df = pd.read_excel(file_path, engine="openpyxl", header=header_row)
-            if not df.empty and len(df.columns) > 3:
-                logger.debug(
-                    "File letto con header=%s, righe=%d, colonne=%s",
-                    header_row,
-                    len(df),
-                    list(df.columns),
-                )
-                return df
-        except Exception as exc:
-            errors.append(f"Header {header_row}: {exc}")
-            continue
+    try:
+        grid = read_sheet_grid(file_path)
+    except Exception as exc:
+        errors.append(f"openpyxl: {exc}")
+        grid = None
+
+    if grid is not None:
+        with grid.phase("header"):
+            header_row = next(
+                (h for h in header_candidates if grid.has_data_after(h) and grid.width > 3),
+                None,
+            )
+        if header_row is not None:
+            df = grid.to_frame(header_row)
+            logger.debug(
+                "File letto con header=%s, righe=%d, colonne=%s",
+                header_row,
+                len(df),
+                list(df.columns),
+            )
+            grid.log_timings()
+            return df
 
     try:
         df = pd.read_excel(file_path, header=header_candidates[0])
@@ -74,85 +99,8 @@ def _read_excel_with_fallbacks(file_path: str, header_candidates: List[int]) ->
     )
 
 
-def parse_preparatori(file_path: str) -> pd.DataFrame:
-    """Parsa il report Preparatori (PICKING) e restituisce un DataFrame normalizzato."""
-    # Header variabile: tentativo con riga 2, fallback riga 0; engine fallback automatico.
-    df = None
-    errors = []
-    
-    # Prova diverse strategie di lettura
-    # NOTA: Alcuni file Excel hanno header complessi o righe vuote all'inizio
-    # Prima: leggi senza header per ispezionare le prime righe
-    try:
-        df_inspect = pd.read_excel(file_path, engine="openpyxl", header=None, nrows=5)
-        logger.debug("Prime 5 righe del file senza header per %s", file_path)
-        for idx, row in df_inspect.iterrows():
-            logger.debug("  Riga %s: %s", idx, list(row.values)[:10])
-        
-        # Trova quale riga contiene le intestazioni (cerca "data", "codice", etc.)
-        header_row = None
-        for idx, row in df_inspect.iterrows():
-            row_str = ' '.join([str(v).lower() for v in row.values if pd.notna(v)])
-            if 'data' in row_str and ('codice' in row_str or 'preparatore' in row_str):
-                header_row = idx
-                logger.debug("Trovata riga header: %s", idx)
-                break
-        
-        if header_row is None:
-            # Fallback: usa riga 2 se non trovata
-            header_row = 2
-            logger.debug("Header non trovato automaticamente, uso riga %s", header_row)
-    except Exception as e:
-        logger.debug("Errore ispezione file: %s, uso header=2", e)
-        header_row = 2
-    
-    # Ora leggi con l'header corretto
-    for h_row in [header_row, 2, 1, 0, 3]:
-        try:
-            df = pd.read_excel(file_path, engine="openpyxl", header=h_row)
-            if not df.empty and len(df.columns) > 3:
-                logger.debug(
-                    "File letto con header=%s, righe=%d, colonne=%d",
-                    h_row,
-                    len(df),
-                    len(df.columns),
-                )
-                # Verifica se le colonne NON sono tutte "Unnamed"
-                unnamed_count = sum(1 for col in df.columns if str(col).startswith('Unnamed'))
-                if unnamed_count < len(df.columns) * 0.5:  # Meno del 50% "Unnamed"
-                    logger.debug(
-                        "Header valido con %d colonne Unnamed su %d",
-                        unnamed_count,
-                        len(df.columns),
-                    )
-                    break
-                else:
-                    logger.debug(
-                        "Troppe colonne Unnamed (%d/%d), provo altro header",
-                        unnamed_count,
-                        len(df.columns),
-                    )
-        except Exception as e:
-            errors.append(f"Header {h_row}: {str(e)}")
-            continue
-    
-    if df is None or df.empty:
-        # Ultimo tentativo senza specificare engine
-        try:
-            df = pd.read_excel(file_path, header=0)
-            logger.debug(
-                "File letto con engine automatico, righe=%d, colonne=%s",
-                len(df),
-                list(df.columns),
-            )
-        except Exception as e:
-            raise ValueError(f"Impossibile leggere il file Excel. Errori: {'; '.join(errors + [str(e)])}")
-
-    df = df.rename(columns=lambda x: str(x).strip())
-
-    # Debug: mostra tutte le colonne disponibili con rappresentazione esatta
-    logger.debug("Colonne disponibili nel file: %s", list(df.columns))
-    
+def _resolve_preparatori_columns(df: pd.DataFrame) -> Dict[str, Optional[str]]:
+    """Individua le colonne del report Preparatori con la ricerca fuzzy di `find_column`."""
     try:
         col_data = find_column(df, [["data inizio preparazione"], ["data inizio"], ["data"]])
         logger.debug("Colonna data trovata: %s", col_data)
@@ -198,6 +146,85 @@ def parse_preparatori(file_path: str) -> pd.DataFrame:
         logger.warning("Colonna tempo lavorato assente - ore_gestionale impostato a 0")
         col_tempo = None
 
+    return {
+        "data": col_data,
+        "codice": col_cod,
+        "nome": col_nome,
+        "colli": col_colli,
+        "tempo": col_tempo,
+    }
+
+
+def parse_preparatori(file_path: str) -> pd.DataFrame:
+    """Parsa il report Preparatori (PICKING) e restituisce un DataFrame normalizzato."""
+    # Header variabile: il foglio viene letto una sola volta e l'header cercato in memoria.
+    # NOTA: Alcuni file Excel hanno header complessi o righe vuote all'inizio
+    df = None
+    try:
+        grid = read_sheet_grid(file_path)
+    except Exception as e:
+        # Ultimo tentativo senza specificare engine (es. vecchi .xls)
+        logger.debug("Lettura openpyxl fallita (%s), provo engine automatico", e)
+        try:
+            df = pd.read_excel(file_path, header=0)
+            logger.debug(
+                "File letto con engine automatico, righe=%d, colonne=%s",
+                len(df),
+                list(df.columns),
+            )
+        except Exception as exc:
+            raise ValueError(f"Impossibile leggere il file Excel. Errori: {e}; {exc}")
+    else:
+        for idx in range(min(5, len(grid.rows))):
+            logger.debug("  Riga %s: %s", idx, grid.rows[idx][:10])
+
+        # Trova quale riga contiene le intestazioni (cerca "data", "codice", etc.)
+        header_row = grid.find_header_row(
+            lambda text: "data" in text and ("codice" in text or "preparatore" in text),
+            max_rows=5,
+        )
+        if header_row is None:
+            # Fallback: usa riga 2 se non trovata
+            header_row = 2
+            logger.debug("Header non trovato automaticamente, uso riga %s", header_row)
+        else:
+            logger.debug("Trovata riga header: %s", header_row)
+
+        # Verifica i candidati in memoria: serve almeno il 50% di colonne con nome
+        candidates = [header_row, 2, 1, 0, 3]
+        with grid.phase("header"):
+            chosen = next(
+                (
+                    h for h in candidates
+                    if grid.has_data_after(h)
+                    and grid.width > 3
+                    and grid.unnamed_count(h) < grid.width * 0.5
+                ),
+                candidates[-1],
+            )
+        logger.debug(
+            "Header scelto=%s con %d colonne Unnamed su %d",
+            chosen,
+            grid.unnamed_count(chosen),
+            grid.width,
+        )
+        df = grid.to_frame(chosen)
+        if df.empty:
+            df = grid.to_frame(0)
+        grid.log_timings()
+
+    df = df.rename(columns=lambda x: str(x).strip())
+
+    # Debug: mostra tutte le colonne disponibili con rappresentazione esatta
+    logger.debug("Colonne disponibili nel file: %s", list(df.columns))
+    
+    columns = resolve_columns(df, "preparatori", _resolve_preparatori_columns, PARSER_VERSION)
+    col_data = columns["data"]
+    col_cod = columns["codice"]
+    col_nome = columns["nome"]
+    col_colli = columns["colli"]
+    col_tempo = columns["tempo"]
+
     # Seleziona colonne, gestendo il caso di col_nome opzionale
     columns_to_copy = [col_data, col_cod, col_colli]
     if col_nome:
@@ -237,53 +264,10 @@ def parse_preparatori(file_path: str) -> pd.DataFrame:
         
     sub.rename(columns=rename_dict, inplace=True)
 
-    def _parse_tempo_lavorato(value) -> float:
-        """Converte il tempo lavorato in ore decimali."""
-        if pd.isna(value):
-            return 0.0
-        if isinstance(value, datetime.timedelta):
-            return value.total_seconds() / 3600
-        if isinstance(value, datetime.time):
-            return (
-                value.hour
-                + value.minute / 60
-                + value.second / 3600
-            )
-        if isinstance(value, datetime.datetime):
-            return (
-                value.hour
-                + value.minute / 60
-                + value.second / 3600
-            )
-        if isinstance(value, (int, float)):
-            # Excel memorizza il tempo come frazione di giorno
-            return float(value) * 24
-        if isinstance(value, str):
-            value = value.strip()
-            if not value:
-                return 0.0
-            try:
-                td = pd.to_timedelta(value)
-                if pd.notna(td):
-                    return td.total_seconds() / 3600
-            except ValueError:
-                pass
-            # Tentativo di parsing manuale hh:mm[:ss]
-            try:
-                parts = value.split(":")
-                if len(parts) >= 2:
-                    hours = int(parts[0])
-                    minutes = int(parts[1])
-                    seconds = int(parts[2]) if len(parts) > 2 else 0
-                    return hours + minutes / 60 + seconds / 3600
-            except ValueError:
-                return 0.0
-        return 0.0
-
     sub["codice_preparatore"] = sub["codice_preparatore"].astype(str).str.strip()
     sub["nome_preparatore"] = sub["nome_preparatore"].astype(str).str.strip()
     sub["totale_colli"] = pd.to_numeric(sub["totale_colli"], errors="coerce").fillna(0).astype(int)
-    sub["ore_gestionale"] = sub["tempo_lavorato_raw"].apply(_parse_tempo_lavorato).astype(float)
+    sub["ore_gestionale"] = convert_unique(sub["tempo_lavorato_raw"], parse_tempo_lavorato, dtype="float")
     sub.drop(columns=["tempo_lavorato_raw"], inplace=True)
 
     out = (
@@ -295,40 +279,493 @@ def parse_preparatori(file_path: str) -> pd.DataFrame:
     return out
 
 
-def parse_carrelisti(file_path: str, data_rif: datetime.date) -> pd.DataFrame:
+DEBUG_CODICE = "a96"
+
+# Valori della colonna Tipo che, insieme a un codice preparatore, identificano una riga intestazione
+_CARRELLISTI_HEADER_TIPI = ["", "NAN", "ST", "AP", "CM"]
+
+
+def _collect_carrellisti_rows(
+    df: pd.DataFrame,
+    data_col: Optional[str],
+    prep_col: str,
+    tipo_col: str,
+    ora_inizio_col: str,
+    ora_fine_col: str,
+    errore_col: Optional[str],
+    data_rif: datetime.date,
+) -> pd.DataFrame:
+    """
+    Estrae le righe movimento del report Carrellisti con operazioni per colonna.
+
+    Il codice operatore delle righe dati deriva dall'ultima riga intestazione (forward-fill),
+    azzerato a ogni nuova sezione data; le righe TOTALE e quelle senza orari vengono scartate.
+
+    Returns:
+        Un movimento per riga, con colonne data, codice, tipo, colli, ora_inizio, ora_fine,
+        errore (None se assente), raw_ora_inizio e raw_ora_fine
+    """
+    prep = df[prep_col].where(df[prep_col].notna(), "").astype(str).str.strip()
+    tipo = df[tipo_col].where(df[tipo_col].notna(), "").astype(str).str.strip()
+    tipo_upper = tipo.str.upper()
+
+    keep = (prep.str.upper() != "TOTALE") & (tipo_upper != "TOTALE")
+    is_header = keep & (prep != "") & tipo_upper.isin(_CARRELLISTI_HEADER_TIPI)
+
+    # Stato "codice corrente": impostato dalle intestazioni, azzerato ("") dalle nuove sezioni data
+    marker = pd.Series(np.nan, index=df.index, dtype=object)
+    if data_col and "_is_new_date_section" in df.columns:
+        new_section = keep & df["_is_new_date_section"].fillna(False).astype(bool)
+        marker[new_section & ~is_header] = ""
+    marker[is_header] = prep[is_header]
+    current_code = marker.ffill()
+
+    is_data = (
+        keep
+        & ~is_header
+        & current_code.notna()
+        & (current_code != "")
+        & (tipo != "")
+        & (tipo_upper != "NAN")
+        & df[ora_inizio_col].notna()
+        & df[ora_fine_col].notna()
+    )
+    rows = df[is_data]
+
+    if data_col:
+        date_values = rows[data_col].where(rows[data_col].notna(), data_rif).to_numpy(dtype=object)
+    else:
+        date_values = np.full(len(rows), data_rif, dtype=object)
+
+    errori = np.full(len(rows), None, dtype=object)
+    colli = np.ones(len(rows), dtype=np.int64)
+    if errore_col:
+        errore_series = rows[errore_col]
+        has_errore = errore_series.notna().to_numpy()
+        errore_text = errore_series[has_errore].astype(str).str.strip().to_numpy(dtype=object)
+        errori[has_errore] = errore_text
+        colli[has_errore] = np.where(errore_text != "", 0, 1)
+
+    if logger.isEnabledFor(logging.DEBUG):
+        same_time = rows.index[
+            (prep[is_data].str.lower() == DEBUG_CODICE)
+            & (rows[ora_inizio_col] == rows[ora_fine_col])
+        ]
+        for idx in same_time:
+            logger.debug(
+                "Riga con stessa ora di inizio/fine rilevata per %s %s (%s -> %s)",
+                prep[idx],
+                tipo[idx],
+                df.at[idx, ora_inizio_col],
+                df.at[idx, ora_fine_col],
+            )
+
+    # IMPORTANTE: Per i carrellisti, ogni riga = 1 movimento
+    # La colonna N°trasporto è un CODICE IDENTIFICATIVO, non una quantità!
+    # Se c'è un errore, il movimento NON viene conteggiato (colli = 0)
+    return pd.DataFrame({
+        "data": date_values,
+        "codice": current_code[is_data].to_numpy(dtype=object),
+        "tipo": tipo[is_data].to_numpy(dtype=object),
+        "colli": colli,
+        "ora_inizio": rows[ora_inizio_col].to_numpy(dtype=object),
+        "ora_fine": rows[ora_fine_col].to_numpy(dtype=object),
+        "errore": errori,
+        "raw_ora_inizio": rows["_raw_ora_inizio"].to_numpy(dtype=object),
+        "raw_ora_fine": rows["_raw_ora_fine"].to_numpy(dtype=object),
+    })
+
+
+def _fmt_debug_minutes(total_minutes: Optional[float]) -> str:
+    if total_minutes is None:
+        return "-"
+    sign = "-" if total_minutes < 0 else ""
+    total = abs(total_minutes)
+    minutes = int(round(total))
+    hours, mins = divmod(minutes, 60)
+    if hours:
+        return f"{sign}{hours}:{mins:02d}h"
+    return f"{sign}{mins:02d}'"
+
+
+def _fmt_debug_raw(raw_val) -> str:
+    if raw_val is None:
+        return ""
+    if isinstance(raw_val, float):
+        return f"{raw_val:.12g}"
+    if isinstance(raw_val, (datetime.datetime, datetime.time)):
+        return raw_val.strftime("%H:%M:%S")
+    return str(raw_val)
+
+
+def _log_debug_sessioni(
+    data: Any,
+    codice: str,
+    righe_giorno: List[Dict[str, Any]],
+    numeri_sessione: List[int],
+    tempo_totale_ore: float,
+) -> None:
+    """Scrive nel log di debug il dettaglio riga per riga delle sessioni di `DEBUG_CODICE`."""
+    logger.debug("Dettaglio sessioni per codice %s in data %s", DEBUG_CODICE, data)
+
+    valid_rows = sum(1 for r in righe_giorno if not r.get("errore"))
+    logger.debug(
+        "Righe totali=%d | valide=%d | con errore=%d",
+        len(righe_giorno),
+        valid_rows,
+        len(righe_giorno) - valid_rows,
+    )
+    logger.debug("  #  Sess Tipo  Inizio Fine   Dur  Gap  Mov Stato RawIn RawFi Note")
+
+    prev_fine_dt = None
+    prev_sess = None
+    for idx_riga, (riga, num_sess) in enumerate(zip(righe_giorno, numeri_sessione), 1):
+        dt_inizio = datetime.datetime.combine(datetime.date.today(), riga["ora_inizio"])
+        dt_fine = datetime.datetime.combine(datetime.date.today(), riga["ora_fine"])
+        if dt_fine < dt_inizio:
+            dt_fine += datetime.timedelta(days=1)
+
+        gap_min = None
+        note_parts: List[str] = []
+        if prev_fine_dt is not None:
+            raw_gap = (dt_inizio - prev_fine_dt).total_seconds() / 60
+            if num_sess != prev_sess:
+                note_parts.append("NEW session")
+                gap_min = raw_gap
+            else:
+                if raw_gap < 0:
+                    note_parts.append("OVERLAP")
+                gap_min = max(0, raw_gap)
+
+        errore_val = riga.get("errore") or ""
+        if errore_val:
+            note_parts.append(f"Errore={errore_val}")
+
+        logger.debug(
+            "%3d  %-4s%-4s%-7s%-6s%5s%6s%5d  %-4s %-10s %-10s %s",
+            idx_riga,
+            f"S{num_sess}",
+            riga["tipo"],
+            riga["ora_inizio"].strftime("%H:%M"),
+            riga["ora_fine"].strftime("%H:%M"),
+            _fmt_debug_minutes((dt_fine - dt_inizio).total_seconds() / 60),
+            _fmt_debug_minutes(gap_min),
+            riga["colli"],
+            "SKIP" if errore_val else "OK",
+            _fmt_debug_raw(riga.get("raw_ora_inizio")),
+            _fmt_debug_raw(riga.get("raw_ora_fine")),
+            ", ".join(note_parts),
+        )
+
+        prev_fine_dt = dt_fine if prev_fine_dt is None else max(prev_fine_dt, dt_fine)
+        prev_sess = num_sess
+
+    logger.debug(
+        "Sessioni calcolate=%d | Tempo totale=%.2fh",
+        numeri_sessione[-1] if numeri_sessione else 0,
+        tempo_totale_ore,
+    )
+    logger.debug("Fine dettaglio sessioni per %s in data %s", DEBUG_CODICE, data)
+
+
+# Soglia oltre la quale una pausa tra movimenti chiude la sessione
+SESSION_GAP_MINUTES = 15
+
+_US_PER_SECOND = 1_000_000
+_US_PER_DAY = 86_400 * _US_PER_SECOND
+_SESSION_GAP_US = SESSION_GAP_MINUTES * 60 * _US_PER_SECOND
+
+
+def _times_to_us(values: pd.Series) -> np.ndarray:
+    """Converte una colonna di `datetime.time` in microsecondi dalla mezzanotte (int64)."""
+    codes, uniques = pd.factorize(values)
+    lookup = np.array(
+        [
+            ((t.hour * 60 + t.minute) * 60 + t.second) * _US_PER_SECOND + t.microsecond
+            for t in uniques
+        ],
+        dtype=np.int64,
+    )
+    return lookup[codes]
+
+
+def _running_max_by_group(values: np.ndarray, group_ids: np.ndarray) -> np.ndarray:
+    """Massimo cumulativo di `values` entro gruppi contigui e crescenti di `group_ids`."""
+    if values.size == 0:
+        return values
+    span = int(values.max() - values.min()) + 1
+    offset = (group_ids - group_ids[0]).astype(np.int64) * span
+    return np.maximum.accumulate(values + offset) - offset
+
+
+def _us_to_minutes(values: np.ndarray) -> np.ndarray:
+    """Microsecondi → minuti con la stessa aritmetica di `timedelta.total_seconds() / 60`."""
+    return values / _US_PER_SECOND / 60
+
+
+def _round2(values: np.ndarray) -> np.ndarray:
+    """Arrotonda a 2 decimali come `round(x, 2)`, anche sui valori a metà tra due centesimi."""
+    rounded = np.round(values, 2)
+    scaled = values * 100
+    # np.round moltiplica per 100 prima di arrotondare: sui casi limite decide round()
+    near_half = np.abs(scaled - np.floor(scaled) - 0.5) < 1e-6
+    if near_half.any():
+        rounded[near_half] = [round(v, 2) for v in values[near_half].tolist()]
+    return rounded
+
+
+def _nullable_int(values: np.ndarray, present: np.ndarray) -> pd.arrays.IntegerArray:
+    """Array Int64 con NA dove `present` è falso."""
+    return pd.arrays.IntegerArray(values.astype(np.int64), ~present)
+
+
+def _compute_carrellisti_sessions(
+    movimenti: pd.DataFrame,
+) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    Calcola sessioni e ore gestionale dei carrellisti su array int64.
+
+    Le righe duplicate vengono consolidate, ordinate per (data, codice, ora inizio) e divise
+    in sessioni quando l'inizio supera di oltre 15 minuti la fine più tarda della sessione
+    corrente; il tempo delle sessioni viene poi ripartito per tipo in base ai movimenti validi.
+
+    Args:
+        movimenti: Movimenti restituiti da `_collect_carrellisti_rows`
+
+    Returns:
+        (records, sessioni): un record per (data, codice, tipo) e una riga di dettaglio per
+        ogni movimento valido, con le colonne di `sessioni_carrellisti` (NaN/NA per i valori
+        assenti) come attese da `save_import_carrellisti`.
+    """
+    if movimenti.empty:
+        return pd.DataFrame(), pd.DataFrame()
+
+    data_codes, _ = pd.factorize(movimenti["data"], sort=True)
+    codice_codes, _ = pd.factorize(movimenti["codice"], sort=True)
+    tipo_codes, tipo_uniques = pd.factorize(movimenti["tipo"])
+    errore_codes, errore_uniques = pd.factorize(movimenti["errore"])
+    start_all = _times_to_us(movimenti["ora_inizio"])
+    fine_all = _times_to_us(movimenti["ora_fine"])
+
+    # STEP 1.5: RAGGRUPPA righe duplicate (stesso data, codice, ora_inizio, ora_fine, tipo, errore)
+    # PRIMA di calcolare le sessioni! Resta la prima occurrence, i colli vengono sommati.
+    dup_ids = (
+        pd.DataFrame({
+            "data": data_codes,
+            "codice": codice_codes,
+            "inizio": start_all,
+            "fine": fine_all,
+            "tipo": tipo_codes,
+            "errore": errore_codes,
+        })
+        .groupby(["data", "codice", "inizio", "fine", "tipo", "errore"], sort=False)
+        .ngroup()
+        .to_numpy()
+    )
+    _, first_pos = np.unique(dup_ids, return_index=True)
+    colli_tot = np.bincount(dup_ids, weights=movimenti["colli"].to_numpy(dtype=np.float64))
+
+    # STEP 2: ordina per (data, codice, ora_inizio) mantenendo l'ordine di comparsa a parità
+    order = np.lexsort((start_all[first_pos], codice_codes[first_pos], data_codes[first_pos]))
+    idx = first_pos[order]
+    colli = colli_tot[order].astype(np.int64)
+    start = start_all[idx]
+    fine = fine_all[idx]
+    # Passaggio della mezzanotte: la fine è del giorno successivo
+    end = np.where(fine < start, fine + _US_PER_DAY, fine)
+    tipo = tipo_codes[idx]
+    errore_attivo = np.array([str(e) != "" for e in errore_uniques], dtype=bool)
+    errore_idx = errore_codes[idx]
+    is_error = (errore_idx >= 0) & errore_attivo[np.maximum(errore_idx, 0)]
+    valid = ~is_error
+
+    n = idx.size
+    day_key = data_codes[idx].astype(np.int64) * (int(codice_codes.max()) + 1) + codice_codes[idx]
+    day_first = np.ones(n, dtype=bool)
+    day_first[1:] = day_key[1:] != day_key[:-1]
+    day_id = np.cumsum(day_first) - 1
+    n_days = int(day_id[-1]) + 1
+
+    # Nuova sessione se l'inizio supera di oltre 15' la fine più tarda vista finora nel giorno
+    running_end = _running_max_by_group(end, day_id)
+    sess_first = day_first.copy()
+    sess_first[1:] |= (start[1:] - running_end[:-1]) > _SESSION_GAP_US
+    sess_id = np.cumsum(sess_first) - 1
+    sess_start_pos = np.flatnonzero(sess_first)
+    sess_end_pos = np.r_[sess_start_pos[1:] - 1, n - 1]
+    sess_day = day_id[sess_start_pos]
+    numero_sessione = sess_id - sess_id[np.flatnonzero(day_first)][day_id] + 1
+
+    # STEP 3: durata sessione = da primo inizio a ultima fine (riga finale, non la più tarda)
+    sess_us = fine[sess_end_pos] - start[sess_start_pos]
+    sess_us = np.where(sess_us < 0, sess_us + _US_PER_DAY, sess_us)
+    sess_ore = _us_to_minutes(sess_us) / 60.0
+    day_ore = np.bincount(sess_day, weights=sess_ore, minlength=n_days)
+    sess_righe = sess_end_pos - sess_start_pos + 1
+
+    # STEP 4: proporziona il tempo della giornata in base ai movimenti validi per tipo
+    n_tipi = len(tipo_uniques)
+    pair = day_id * n_tipi + tipo
+    mov_pair = np.bincount(pair[valid], weights=colli[valid], minlength=n_days * n_tipi)
+    err_pair = np.bincount(pair[is_error], minlength=n_days * n_tipi)
+    tot_day = np.bincount(day_id[valid], weights=colli[valid], minlength=n_days)
+    # Un record per (giorno, tipo) con movimenti validi, nell'ordine di comparsa
+    pair_valid, pair_first = np.unique(pair[valid], return_index=True)
+    rec_pair = pair_valid[np.argsort(pair_first, kind="stable")]
+    # Giornate senza movimenti validi: nessun record e nessun dettaglio
+    rec_pair = rec_pair[tot_day[rec_pair // n_tipi] > 0]
+    rec_day = rec_pair // n_tipi
+    rec_mov = mov_pair[rec_pair]
+    ore_tipo = day_ore[rec_day] * (rec_mov / tot_day[rec_day])
+
+    data_obj = movimenti["data"].to_numpy(dtype=object)[idx]
+    codice_obj = movimenti["codice"].to_numpy(dtype=object)[idx]
+    day_data = data_obj[day_first]
+    day_codice = codice_obj[day_first]
+    tipo_obj = np.asarray(tipo_uniques, dtype=object)
+
+    note_errori = np.full(rec_pair.size, None, dtype=object)
+    rec_err = err_pair[rec_pair]
+    for pos in np.flatnonzero(rec_err).tolist():
+        num_errori = int(rec_err[pos])
+        note_errori[pos] = f"{num_errori} movimento{'i' if num_errori > 1 else ''} con errore"
+
+    records = pd.DataFrame({
+        "data": day_data[rec_day],
+        "codice_preparatore": day_codice[rec_day],
+        "nome_preparatore": "",
+        "totale_colli": rec_mov.astype(np.int64),
+        "penalita": 0,
+        "tipo_attivita": "CARRELLISTI",
+        "tipo": tipo_obj[rec_pair % n_tipi],
+        "ore_tim": 0.0,
+        "ore_gestionale": _round2(ore_tipo),
+        "note_errori": note_errori,
+    })
+
+    ora_inizio = movimenti["ora_inizio"].to_numpy(dtype=object)[idx]
+    ora_fine = movimenti["ora_fine"].to_numpy(dtype=object)[idx]
+
+    if logger.isEnabledFor(logging.DEBUG):
+        debug_days = np.flatnonzero(np.char.lower(day_codice.astype(str)) == DEBUG_CODICE)
+        if debug_days.size:
+            consolidati = movimenti.iloc[idx].assign(colli=colli).reset_index(drop=True)
+            for day in debug_days:
+                mask = day_id == day
+                _log_debug_sessioni(
+                    day_data[day],
+                    day_codice[day],
+                    consolidati[mask].to_dict("records"),
+                    numero_sessione[mask].tolist(),
+                    float(day_ore[day]),
+                )
+
+    # Dettaglio: solo righe valide dei giorni con almeno un movimento valido
+    # (le righe con errore non vanno in sessioni_carrellisti)
+    det = np.flatnonzero(valid & (tot_day[day_id] > 0))
+    if det.size == 0:
+        return records, pd.DataFrame()
+
+    det_day = day_id[det]
+    det_sess = sess_id[det]
+    det_start = start[det]
+    det_end = end[det]
+    det_tipo = tipo[det]
+    det_colli = colli[det]
+
+    det_day_first = np.ones(det.size, dtype=bool)
+    det_day_first[1:] = det_day[1:] != det_day[:-1]
+    day_offset = np.flatnonzero(det_day_first)
+    numero_riga = np.arange(det.size) - day_offset[np.cumsum(det_day_first) - 1] + 1
+
+    # Gap dalla fine più tarda delle righe valide precedenti della stessa sessione
+    det_sess_first = np.ones(det.size, dtype=bool)
+    det_sess_first[1:] = det_sess[1:] != det_sess[:-1]
+    prev_end = np.empty_like(det_end)
+    prev_end[1:] = _running_max_by_group(det_end, det_sess)[:-1]
+    prev_end[0] = det_end[0]
+    gap = _us_to_minutes(np.maximum(det_start - prev_end, 0))
+
+    tempo_riga = _us_to_minutes(det_end - det_start)
+
+    # ore_gestionale per tipo solo sulla prima occorrenza del tipo nella giornata
+    det_pair = pair[det]
+    first_tipo = np.zeros(det.size, dtype=bool)
+    first_tipo[np.unique(det_pair, return_index=True)[1]] = True
+    ore_per_pair = np.zeros(n_days * n_tipi)
+    ore_per_pair[rec_pair] = ore_tipo
+    ore_gest = _round2(ore_per_pair[det_pair])
+
+    det_sess_ids = det_sess[det_sess_first]
+    sessione_inizio = np.full(det.size, None, dtype=object)
+    sessione_inizio[det_sess_first] = ora_inizio[sess_start_pos[det_sess_ids]]
+    sessione_fine = np.full(det.size, None, dtype=object)
+    sessione_fine[det_sess_first] = ora_fine[sess_end_pos[det_sess_ids]]
+
+    sessioni: Dict[str, Any] = {
+        "data": day_data[det_day],
+        "codice_preparatore": day_codice[det_day],
+        "numero_riga": numero_riga,
+        "ora_inizio_riga": ora_inizio[det],
+        "ora_fine_riga": ora_fine[det],
+        "tempo_riga_minuti": _round2(tempo_riga),
+        "gap_minuti": np.where(det_sess_first, np.nan, _round2(gap)),
+    }
+    tipo_code = {str(t): code for code, t in enumerate(tipo_uniques)}
+    for sigla in ("ST", "SS", "AP", "CM"):
+        sessioni[f"movimenti_{sigla.lower()}"] = _nullable_int(
+            det_colli, det_tipo == tipo_code.get(sigla, -1)
+        )
+    sessioni.update({
+        "errore": movimenti["errore"].to_numpy(dtype=object)[idx][det],
+        "numero_sessione": numero_sessione[det],
+        "ora_inizio_sessione": sessione_inizio,
+        "ora_fine_sessione": sessione_fine,
+        "tempo_sessione_ore": np.where(det_sess_first, _round2(sess_ore[det_sess]), np.nan),
+        "totale_righe_sessione": _nullable_int(sess_righe[det_sess], det_sess_first),
+    })
+    for sigla in ("ST", "SS", "AP", "CM"):
+        sessioni[f"ore_gestionale_{sigla.lower()}"] = np.where(
+            first_tipo & (det_tipo == tipo_code.get(sigla, -1)), ore_gest, np.nan
+        )
+
+    return records, pd.DataFrame(sessioni)
+
+
+def parse_carrelisti(
+    file_path: str, data_rif: datetime.date
+) -> Tuple[pd.DataFrame, pd.DataFrame]:
     """
     Parsa il report Carrellisti (CARRELLO) con logica sessioni:
     - Legge Ora inizio e Ora fine
     - Calcola gap tra inizi consecutivi
     - Chiude sessione se gap > 15 minuti
     - Proporziona tempo sessione per tipo
-    - Restituisce DataFrame con ore_gestionale calcolato
+    - Restituisce DataFrame con ore_gestionale calcolato e dettaglio sessioni
+
+    Non scrive sul database: il dettaglio va salvato insieme ai record aggregati
+    con `database.save_import_carrellisti`.
+
+    Returns:
+        (DataFrame aggregato, dettaglio sessioni per sessioni_carrellisti)
     """
     
-    # Prova a leggere il file con diverse strategie di header
-    df = None
-    errors = []
-    
-    # Prima: ispeziona le prime righe per trovare l'header
+    # Legge il foglio una sola volta e cerca l'header tra le prime righe
     try:
-        df_inspect = pd.read_excel(file_path, engine="openpyxl", header=None, nrows=10)
-        # Cerca la riga che contiene "Preparatore" o "Data" + "Tipo" + "Ora"
-        header_row = None
-        for idx, row in df_inspect.iterrows():
-            row_str = ' '.join([str(v).lower() for v in row.values if pd.notna(v)])
-            # Cerca header con ora inizio/fine
-            if 'ora' in row_str and ('inizio' in row_str or 'fine' in row_str):
-                header_row = idx
-                break
-            elif 'preparatore' in row_str or ('data' in row_str and 'tipo' in row_str):
-                header_row = idx
-                break
-        
+        grid = read_sheet_grid(file_path)
+
+        def _is_header(text: str) -> bool:
+            # Cerca header con ora inizio/fine, oppure "Preparatore" o "Data" + "Tipo"
+            if "ora" in text and ("inizio" in text or "fine" in text):
+                return True
+            return "preparatore" in text or ("data" in text and "tipo" in text)
+
+        header_row = grid.find_header_row(_is_header, max_rows=10)
         if header_row is None:
             raise ValueError("Header non trovato nel file carrellisti")
-            
-        # Leggi con l'header trovato
-        df = pd.read_excel(file_path, engine="openpyxl", header=header_row)
+
+        df = grid.to_frame(header_row)
+        grid.log_timings()
     except Exception as e:
         logger.error("Errore lettura file carrellisti: %s", e)
         raise ValueError(f"Impossibile leggere il file carrellisti: {e}")
@@ -369,91 +806,11 @@ def parse_carrelisti(file_path: str, data_rif: datetime.date) -> pd.DataFrame:
     if not ora_inizio_col or not ora_fine_col:
         logger.debug("Colonne Ora inizio/fine non trovate, uso la logica senza sessioni")
         # Fallback alla logica vecchia (senza ore_gestionale)
-        return _parse_carrellisti_old_logic(df, data_col, prep_col, tipo_col, num_col, data_rif)
-    
-    # Funzione per convertire ora in datetime.time
-    def parse_time(val):
-        """Converte vari formati di ora in datetime.time"""
-        if pd.isna(val):
-            return None
-        
-        # Se è già datetime.time
-        if isinstance(val, datetime.time):
-            return val
-        
-        # Se è datetime.datetime
-        if isinstance(val, datetime.datetime):
-            return val.time()
-        
-        # Se è stringa formato HH:MM o HH:MM:SS
-        if isinstance(val, str):
-            val = val.strip()
-            try:
-                parts = val.split(':')
-                if len(parts) >= 2:
-                    hour = int(parts[0])
-                    minute = int(parts[1])
-                    second = int(parts[2]) if len(parts) > 2 else 0
-                    return datetime.time(hour, minute, second)
-            except:
-                pass
-        
-        # Se è un float (Excel time format: frazione di giorno)
-        if isinstance(val, (int, float)):
-            try:
-                # CASO 1: Se il valore è < 1, è una frazione di giorno Excel (0.5 = 12:00)
-                if 0 <= val < 1:
-                    total_seconds = int(val * 24 * 3600)
-                    hours = total_seconds // 3600
-                    minutes = (total_seconds % 3600) // 60
-                    seconds = total_seconds % 60
-                    return datetime.time(hours % 24, minutes, seconds)
-                
-                # CASO 2: Se il valore è >= 1, è formato HH.MM (es. 07.53 = 07:53)
-                # Es: 07.53 → ore=7, minuti=53
-                # Es: 14.09 → ore=14, minuti=09
-                else:
-                    ore = int(val)
-                    minuti_decimale = (val - ore) * 100
-                    minuti = int(round(minuti_decimale))
-                    
-                    # Valida che sia un orario sensato
-                    if 0 <= ore < 24 and 0 <= minuti < 60:
-                        return datetime.time(ore, minuti, 0)
-                    else:
-                        return None
-            except:
-                pass
-        
-        return None
+        return _parse_carrellisti_old_logic(df, data_col, prep_col, tipo_col, num_col, data_rif), pd.DataFrame()
     
     # Converti le colonne data
     if data_col:
-        def convert_date(val):
-            if pd.isna(val):
-                return None
-            if isinstance(val, (datetime.datetime, datetime.date)):
-                return val if isinstance(val, datetime.date) else val.date()
-            if isinstance(val, (int, float)):
-                val_str = str(int(val))
-                if len(val_str) == 8:
-                    try:
-                        return datetime.date(int(val_str[0:4]), int(val_str[4:6]), int(val_str[6:8]))
-                    except:
-                        pass
-            if isinstance(val, str):
-                val_str = val.strip()
-                if len(val_str) == 8 and val_str.isdigit():
-                    try:
-                        return datetime.date(int(val_str[0:4]), int(val_str[4:6]), int(val_str[6:8]))
-                    except:
-                        pass
-            try:
-                return pd.to_datetime(val).date()
-            except:
-                return None
-
-        parsed_dates = df[data_col].apply(convert_date)
+        parsed_dates = convert_unique(df[data_col], parse_date)
         df["_is_new_date_section"] = parsed_dates.notna()
         df[data_col] = parsed_dates.ffill()
     
@@ -462,467 +819,22 @@ def parse_carrelisti(file_path: str, data_rif: datetime.date) -> pd.DataFrame:
     df["_raw_ora_fine"] = df[ora_fine_col]
 
     # Converti le colonne orario
-    df[ora_inizio_col] = df[ora_inizio_col].apply(parse_time)
-    df[ora_fine_col] = df[ora_fine_col].apply(parse_time)
+    df[ora_inizio_col] = convert_unique(df[ora_inizio_col], parse_time)
+    df[ora_fine_col] = convert_unique(df[ora_fine_col], parse_time)
     
-    DEBUG_CODICE = "a96"
-
-    # STEP 1: Leggi tutti i dati e organizza per (data, preparatore)
-    all_rows = []
-    current_code = None
-    
-    for idx, row in df.iterrows():
-        prep = str(row[prep_col]).strip() if pd.notna(row[prep_col]) else ""
-        tipo = str(row[tipo_col]).strip() if pd.notna(row[tipo_col]) else ""
-        
-        if prep.upper() == "TOTALE" or tipo.upper() == "TOTALE":
-            continue
-        
-        # Determina la data
-        if data_col and pd.notna(row[data_col]):
-            record_date = row[data_col]
-        else:
-            record_date = data_rif
-        
-        # Reset se la riga contiene una nuova data (inizio sezione)
-        if data_col and bool(row.get("_is_new_date_section", False)):
-            current_code = None
+    # STEP 1: Leggi tutti i movimenti (una riga per movimento)
+    movimenti = _collect_carrellisti_rows(
+        df, data_col, prep_col, tipo_col, ora_inizio_col, ora_fine_col, errore_col, data_rif
+    )
 
-        # Riga intestazione preparatore
-        if prep and (not tipo or tipo.upper() in ["", "NAN", "ST", "AP", "CM"]):
-            current_code = prep
-            continue
-        
-        if not current_code:
-            continue
-        
-        # Riga dati
-        if tipo and tipo.upper() != "NAN":
-            ora_inizio = row[ora_inizio_col] if pd.notna(row[ora_inizio_col]) else None
-            ora_fine = row[ora_fine_col] if pd.notna(row[ora_fine_col]) else None
-            
-            if not ora_inizio or not ora_fine:
-                continue
-
-            if ora_inizio == ora_fine:
-                if prep.lower() == DEBUG_CODICE:
-                    logger.debug(
-                        "Riga con stessa ora di inizio/fine rilevata per %s %s (%s -> %s)",
-                        prep,
-                        tipo,
-                        ora_inizio,
-                        ora_fine,
-                    )
-            
-            # Leggi la colonna errore (se esiste)
-            errore = None
-            if errore_col and pd.notna(row[errore_col]):
-                errore = str(row[errore_col]).strip()
-            
-            # IMPORTANTE: Per i carrellisti, ogni riga = 1 movimento
-            # La colonna N°trasporto è un CODICE IDENTIFICATIVO, non una quantità!
-            # Se c'è un errore, il movimento NON viene conteggiato (colli = 0)
-            colli = 0 if errore else 1
-            
-            all_rows.append({
-                "data": record_date,
-                "codice": current_code,
-                "tipo": tipo,
-                "colli": colli,
-                "ora_inizio": ora_inizio,
-                "ora_fine": ora_fine,
-                "errore": errore,
-                "raw_ora_inizio": row.get("_raw_ora_inizio"),
-                "raw_ora_fine": row.get("_raw_ora_fine"),
-            })
-    
     if "_is_new_date_section" in df.columns:
         df.drop(columns=["_is_new_date_section"], inplace=True)
 
-    # STEP 1.5: RAGGRUPPA righe duplicate (stesso data, codice, ora_inizio, ora_fine, tipo, errore)
-    # PRIMA di calcolare le sessioni!
-    righe_consolidate = {}
-    for row in all_rows:
-        chiave = (row["data"], row["codice"], row["ora_inizio"], row["ora_fine"], row["tipo"], row.get("errore"))
-        if chiave not in righe_consolidate:
-            righe_consolidate[chiave] = {
-                "data": row["data"],
-                "codice": row["codice"],
-                "tipo": row["tipo"],
-                "ora_inizio": row["ora_inizio"],
-                "ora_fine": row["ora_fine"],
-                "colli": 0,
-                "errore": row.get("errore"),
-                "raw_ora_inizio": row.get("raw_ora_inizio"),
-                "raw_ora_fine": row.get("raw_ora_fine"),
-            }
-        righe_consolidate[chiave]["colli"] += row["colli"]
-    
-    # Converti il dizionario in lista
-    all_rows = list(righe_consolidate.values())
-    # STEP 2: Calcola sessioni con logica gap > 15 minuti
-    records_finali = []
-    sessioni_dettaglio = []  # Per salvare dettagli sessioni nel DB
-    # Raggruppa per (data, codice)
-    from itertools import groupby
-    
-    all_rows_sorted = sorted(all_rows, key=lambda x: (x["data"], x["codice"], x["ora_inizio"]))
-    
-    for (data, codice), group in groupby(all_rows_sorted, key=lambda x: (x["data"], x["codice"])):
-        righe_giorno = list(group)
-        righe_giorno.sort(key=lambda x: x["ora_inizio"])
-        
-        is_debug_code = codice.lower() == DEBUG_CODICE
-
-        if is_debug_code:
-            logger.debug("Dettaglio sessioni per codice %s in data %s", DEBUG_CODICE, data)
-
-            def fmt_minutes(total_minutes: Optional[float]) -> str:
-                if total_minutes is None:
-                    return "-"
-                sign = "-" if total_minutes < 0 else ""
-                total = abs(total_minutes)
-                minutes = int(round(total))
-                hours, mins = divmod(minutes, 60)
-                if hours:
-                    return f"{sign}{hours}:{mins:02d}h"
-                return f"{sign}{mins:02d}'"
-
-            def fmt_raw(raw_val) -> str:
-                if raw_val is None:
-                    return ""
-                if isinstance(raw_val, float):
-                    return f"{raw_val:.12g}"
-                if isinstance(raw_val, datetime.datetime):
-                    return raw_val.strftime("%H:%M:%S")
-                if isinstance(raw_val, datetime.time):
-                    return raw_val.strftime("%H:%M:%S")
-                return str(raw_val)
-
-            valid_rows = sum(1 for r in righe_giorno if not r.get("errore"))
-            error_rows = len(righe_giorno) - valid_rows
-            logger.debug(
-                "Righe totali=%d | valide=%d | con errore=%d",
-                len(righe_giorno),
-                valid_rows,
-                error_rows,
-            )
-            logger.debug("  #  Sess Tipo  Inizio Fine   Dur  Gap  Mov Stato RawIn RawFi Note")
-
-            prev_fine_dt = None
-            current_session = 1
-            for idx_riga, riga in enumerate(righe_giorno, 1):
-                dt_inizio = datetime.datetime.combine(datetime.date.today(), riga["ora_inizio"])
-                dt_fine = datetime.datetime.combine(datetime.date.today(), riga["ora_fine"])
-                if dt_fine < dt_inizio:
-                    dt_fine += datetime.timedelta(days=1)
-
-                durata_min = (dt_fine - dt_inizio).total_seconds() / 60
-                gap_min = None
-                note_parts: List[str] = []
-
-                if prev_fine_dt is not None:
-                    raw_gap = (dt_inizio - prev_fine_dt).total_seconds() / 60
-                    if raw_gap > 15:
-                        current_session += 1
-                        note_parts.append("NEW session")
-                        gap_min = raw_gap
-                    else:
-                        if raw_gap < 0:
-                            note_parts.append("OVERLAP")
-                        gap_min = max(0, raw_gap)
-
-                sess_label = f"S{current_session}"
-                gap_desc = fmt_minutes(gap_min)
-                durata_desc = fmt_minutes(durata_min)
-
-                errore_val = riga.get("errore") or ""
-                stato = "SKIP" if errore_val else "OK"
-                if errore_val:
-                    note_parts.append(f"Errore={errore_val}")
-
-                raw_in_str = fmt_raw(riga.get("raw_ora_inizio"))
-                raw_fi_str = fmt_raw(riga.get("raw_ora_fine"))
-
-                note = ", ".join(note_parts)
-                ora_inizio_str = riga["ora_inizio"].strftime("%H:%M")
-                ora_fine_str = riga["ora_fine"].strftime("%H:%M")
-
-                logger.debug(
-                    "%3d  %-4s%-4s%-7s%-6s%5s%6s%5d  %-4s %-10s %-10s %s",
-                    idx_riga,
-                    sess_label,
-                    riga["tipo"],
-                    ora_inizio_str,
-                    ora_fine_str,
-                    durata_desc,
-                    gap_desc,
-                    riga["colli"],
-                    stato,
-                    raw_in_str,
-                    raw_fi_str,
-                    note,
-                )
-
-                if prev_fine_dt is None:
-                    prev_fine_dt = dt_fine
-                else:
-                    prev_fine_dt = max(prev_fine_dt, dt_fine)
-
-            logger.debug("Fine dettaglio sessioni per %s in data %s", DEBUG_CODICE, data)
-        
-        # Dividi in sessioni
-        sessioni = []
-        sessione_corrente: List[dict] = []
-        session_end_dt: Optional[datetime.datetime] = None
-
-        for riga in righe_giorno:
-            dt_inizio = datetime.datetime.combine(datetime.date.today(), riga["ora_inizio"])
-            dt_fine = datetime.datetime.combine(datetime.date.today(), riga["ora_fine"])
-            if dt_fine < dt_inizio:
-                dt_fine += datetime.timedelta(days=1)
-
-            if not sessione_corrente:
-                sessione_corrente = [riga]
-                session_end_dt = dt_fine
-                continue
-
-            gap_minuti = (dt_inizio - session_end_dt).total_seconds() / 60 if session_end_dt else None
-
-            if gap_minuti is not None and gap_minuti > 15:
-                sessioni.append(sessione_corrente)
-                sessione_corrente = [riga]
-                session_end_dt = dt_fine
-            else:
-                sessione_corrente.append(riga)
-                if session_end_dt:
-                    session_end_dt = max(session_end_dt, dt_fine)
-
-        if sessione_corrente:
-            sessioni.append(sessione_corrente)
-        
-        # STEP 3: Calcola tempo totale di TUTTE le sessioni e conta movimenti per tipo
-        tempo_totale_giornata_ore = 0.0
-        movimenti_per_tipo = {}  # Conta movimenti validi per tipo
-        errori_per_tipo_giornata = {}  # Conta errori per tipo
-        righe_con_sessione = []  # Lista di TUTTE le righe con info sessione
-        
-        for num_sess, righe_sess in enumerate(sessioni, 1):
-            # Tempo totale sessione: da primo inizio a ultima fine
-            primo_inizio = righe_sess[0]["ora_inizio"]
-            ultima_fine = righe_sess[-1]["ora_fine"]
-            
-            dt_inizio = datetime.datetime.combine(datetime.date.today(), primo_inizio)
-            dt_fine = datetime.datetime.combine(datetime.date.today(), ultima_fine)
-            
-            # Gestisci caso di passaggio mezzanotte
-            if dt_fine < dt_inizio:
-                if is_debug_code:
-                    logger.debug(
-                        "Fine (%s) precedente all'inizio (%s) per codice %s in data %s",
-                        ultima_fine,
-                        primo_inizio,
-                        codice,
-                        data,
-                    )
-                dt_fine += datetime.timedelta(days=1)
-            
-            tempo_sessione_min = (dt_fine - dt_inizio).total_seconds() / 60
-            tempo_sessione_ore = tempo_sessione_min / 60.0
-            tempo_totale_giornata_ore += tempo_sessione_ore
-            
-            # Conta movimenti per tipo in questa sessione
-            # Separa movimenti validi da errori
-            for riga in righe_sess:
-                tipo = riga["tipo"]
-                colli = riga["colli"]
-                errore = riga.get("errore")
-                
-                if errore:
-                    # Conta gli errori separatamente
-                    if tipo not in errori_per_tipo_giornata:
-                        errori_per_tipo_giornata[tipo] = 0
-                    errori_per_tipo_giornata[tipo] += 1
-                else:
-                    # Conta solo i movimenti validi
-                    if tipo not in movimenti_per_tipo:
-                        movimenti_per_tipo[tipo] = 0
-                    movimenti_per_tipo[tipo] += colli
-            
-            # Salva OGNI RIGA con i dettagli della sessione
-            for idx_riga, riga in enumerate(righe_sess):
-                righe_con_sessione.append({
-                    'riga': riga,
-                    'numero_sessione': num_sess,
-                    'ora_inizio_sessione': primo_inizio,
-                    'ora_fine_sessione': ultima_fine,
-                    'tempo_sessione_ore': tempo_sessione_ore,
-                    'totale_righe_sessione': len(righe_sess)
-                })
-
-        if is_debug_code:
-            logger.debug(
-                "Sessioni calcolate=%d | Tempo totale=%.2fh",
-                len(sessioni),
-                tempo_totale_giornata_ore,
-            )
-            for idx_sess, righe_sess in enumerate(sessioni, 1):
-                start = righe_sess[0]["ora_inizio"].strftime("%H:%M")
-                end = righe_sess[-1]["ora_fine"].strftime("%H:%M")
-                validi_sess = sum(1 for r in righe_sess if not r.get("errore"))
-                errori_sess = sum(1 for r in righe_sess if r.get("errore"))
-                logger.debug(
-                    "  S%s: %s->%s | righe valide=%d | errori=%d",
-                    idx_sess,
-                    start,
-                    end,
-                    validi_sess,
-                    errori_sess,
-                )
-            logger.debug("Fine riepilogo sessioni per %s in data %s", codice, data)
-        
-        # STEP 4: Proporziona il tempo totale in base ai movimenti per tipo
-        totale_movimenti = sum(movimenti_per_tipo.values())
-        
-        if totale_movimenti == 0:
-            continue
-        
-        # Calcola ore gestionale per tipo in base ai movimenti totali
-        ore_gestionale_per_tipo = {}
-        for tipo, movimenti in movimenti_per_tipo.items():
-            proporzione = movimenti / totale_movimenti
-            ore_gestionale = tempo_totale_giornata_ore * proporzione
-            ore_gestionale_per_tipo[tipo] = ore_gestionale
-            
-            # Crea note_errori se ci sono errori per questo tipo
-            note_errori = None
-            if tipo in errori_per_tipo_giornata:
-                num_errori = errori_per_tipo_giornata[tipo]
-                note_errori = f"{num_errori} movimento{'i' if num_errori > 1 else ''} con errore"
-            
-            records_finali.append({
-                "data": data,
-                "codice_preparatore": codice,
-                "nome_preparatore": "",
-                "totale_colli": movimenti,
-                "penalita": 0,
-                "tipo_attivita": "CARRELLISTI",
-                "tipo": tipo,
-                "ore_tim": 0.0,
-                "ore_gestionale": round(ore_gestionale, 2),
-                "note_errori": note_errori,
-            })
-        
-        # Salva OGNI riga con i dettagli della sessione
-        # ESCLUDE le righe con errore (non vanno in sessioni_carrellisti)
-        numero_riga_giornata = 0
-        sessione_corrente = None
-        tipo_gia_visto_in_giornata = set()
-        fine_riga_precedente_dt: Optional[datetime.datetime] = None
-        
-        for riga_info in righe_con_sessione:
-            riga = riga_info['riga']
-            errore = riga.get('errore')
-            
-            # SALTA le righe con errore - non vanno in sessioni_carrellisti
-            if errore:
-                continue
-            
-            numero_riga_giornata += 1
-            tipo = riga['tipo']
-            num_sess = riga_info['numero_sessione']
-            ora_inizio = riga['ora_inizio']
-            ora_fine = riga['ora_fine']
-            conteggio_movimenti = riga['colli']  # Già consolidato!
-            
-            # Calcola tempo di questa riga
-            dt_inizio_riga = datetime.datetime.combine(datetime.date.today(), ora_inizio)
-            dt_fine_riga = datetime.datetime.combine(datetime.date.today(), ora_fine)
-            if dt_fine_riga < dt_inizio_riga:
-                dt_fine_riga += datetime.timedelta(days=1)
-            tempo_riga_minuti = (dt_fine_riga - dt_inizio_riga).total_seconds() / 60
-            
-            # Calcola gap: tempo tra FINE riga precedente e INIZIO riga corrente (NULL per prima riga o nuova sessione)
-            # IMPORTANTE: gap si azzera anche a inizio nuova sessione
-            if fine_riga_precedente_dt is not None and num_sess == sessione_corrente:
-                raw_gap = (dt_inizio_riga - fine_riga_precedente_dt).total_seconds() / 60
-                gap_minuti = round(max(0.0, raw_gap), 2)
-            else:
-                gap_minuti = None
-            
-            # I totali vanno solo sulla PRIMA riga di ogni sessione
-            if num_sess != sessione_corrente:
-                # Nuova sessione - metti i totali
-                sessione_corrente = num_sess
-                ora_inizio_sess = riga_info['ora_inizio_sessione']
-                ora_fine_sess = riga_info['ora_fine_sessione']
-                tempo_sess = round(riga_info['tempo_sessione_ore'], 2)
-                tot_righe = riga_info['totale_righe_sessione']
-                fine_riga_precedente_dt = dt_fine_riga
-            else:
-                # Riga successiva della stessa sessione - NULL
-                ora_inizio_sess = None
-                ora_fine_sess = None
-                tempo_sess = None
-                tot_righe = None
-                fine_riga_precedente_dt = max(fine_riga_precedente_dt, dt_fine_riga)
-            
-            # Movimenti: conteggio nella colonna corrispondente al tipo, NULL nelle altre
-            movimenti_st = conteggio_movimenti if tipo == 'ST' else None
-            movimenti_ss = conteggio_movimenti if tipo == 'SS' else None
-            movimenti_ap = conteggio_movimenti if tipo == 'AP' else None
-            movimenti_cm = conteggio_movimenti if tipo == 'CM' else None
-            
-            # ore_gestionale per tipo va solo sulla PRIMA occorrenza del tipo nella giornata
-            if tipo not in tipo_gia_visto_in_giornata:
-                ore_gest_st = round(ore_gestionale_per_tipo.get('ST', 0), 2) if tipo == 'ST' else None
-                ore_gest_ss = round(ore_gestionale_per_tipo.get('SS', 0), 2) if tipo == 'SS' else None
-                ore_gest_ap = round(ore_gestionale_per_tipo.get('AP', 0), 2) if tipo == 'AP' else None
-                ore_gest_cm = round(ore_gestionale_per_tipo.get('CM', 0), 2) if tipo == 'CM' else None
-                tipo_gia_visto_in_giornata.add(tipo)
-            else:
-                ore_gest_st = None
-                ore_gest_ss = None
-                ore_gest_ap = None
-                ore_gest_cm = None
-            
-            sessioni_dettaglio.append({
-                'data': data,
-                'codice_preparatore': codice,
-                'numero_riga': numero_riga_giornata,
-                'ora_inizio_riga': ora_inizio,
-                'ora_fine_riga': ora_fine,
-                'tempo_riga_minuti': round(tempo_riga_minuti, 2),
-                'gap_minuti': gap_minuti,
-                'movimenti_st': movimenti_st,
-                'movimenti_ss': movimenti_ss,
-                'movimenti_ap': movimenti_ap,
-                'movimenti_cm': movimenti_cm,
-                'errore': riga.get('errore'),
-                'numero_sessione': num_sess,
-                'ora_inizio_sessione': ora_inizio_sess,
-                'ora_fine_sessione': ora_fine_sess,
-                'tempo_sessione_ore': tempo_sess,
-                'totale_righe_sessione': tot_righe,
-                'ore_gestionale_st': ore_gest_st,
-                'ore_gestionale_ss': ore_gest_ss,
-                'ore_gestionale_ap': ore_gest_ap,
-                'ore_gestionale_cm': ore_gest_cm
-            })
-            
-            # fine_riga_precedente_dt già aggiornato nella logica qui sopra
+    # STEP 2-4: sessioni (pausa > 15 minuti) e ripartizione del tempo per tipo
+    out, sessioni_dettaglio = _compute_carrellisti_sessions(movimenti)
     
-    # Salva le sessioni nel database
-    if sessioni_dettaglio:
-        try:
-            from database import save_sessioni_carrellisti
-            save_sessioni_carrellisti(sessioni_dettaglio)
-        except Exception as e:
-            logger.exception("Errore nel salvataggio delle sessioni: %s", e)
-    
-    out = pd.DataFrame(records_finali)
     if out.empty:
-        return out
+        return out, sessioni_dettaglio
     
     # Raggruppa per sommare colli e ore dello stesso tipo
     out = out.groupby(
@@ -939,8 +851,7 @@ def parse_carrelisti(file_path: str, data_rif: datetime.date) -> pd.DataFrame:
     out["totale_colli"] = out["totale_colli"].astype(int)
     out["penalita"] = out["penalita"].astype(int)
     
-    # Debug: mostra i primi record
-    return out
+    return out, sessioni_dettaglio
 
 
 def _parse_carrellisti_old_logic(
@@ -1032,11 +943,18 @@ def _find_specific_prep_column(df: pd.DataFrame) -> Optional[str]:
     return None
 
 
-def parse_doppia_spunta(file_path: str) -> DoppiaSpuntaResult:
-    """Parsa il report Doppia Spunta restituendo dati per DB e penalità PICKING."""
-    df = _read_excel_with_fallbacks(file_path, [1, 0, 2, 3])
-    df = df.rename(columns=lambda x: str(x).strip())
+DOPPIA_SPUNTA_HEADER_CANDIDATES = [1, 0, 2, 3]
+DOPPIA_SPUNTA_SAMPLE_ROWS = 500
+DOPPIA_SPUNTA_CHUNK_ROWS = 5000
+# Decimali delle somme di penalità considerati prima dell'arrotondamento per eccesso
+_PENALITA_DECIMALI = 6
 
+_DOPPIA_SPUNTA_GROUP_KEYS = ["data", "codice_preparatore", "nome_preparatore", "tipo"]
+_PENALITA_PICKING_KEYS = ["data", "codice_picking"]
+
+
+def _resolve_doppia_spunta_columns(df: pd.DataFrame) -> Dict[str, str]:
+    """Individua le colonne del report Doppia Spunta; le chiavi sono i nomi normalizzati."""
     logger.debug("Colonne disponibili Doppia Spunta: %s", list(df.columns))
 
     # Data
@@ -1067,23 +985,29 @@ def parse_doppia_spunta(file_path: str) -> DoppiaSpuntaResult:
             ) from exc
     logger.debug("Colonna codice PICKING trovata: %s", col_codice_picking)
 
+    subset_cols = {
+        "data": col_data,
+        "codice_preparatore": col_codice_preparatore,
+    }
+
     # Tipo valorizzato con la colonna E ('rs' o descrizione cliente)
     col_tipo = find_column(df, [["rs"], ["tipo"], ["cliente"]], required=False)
-    if not col_tipo:
-        logger.debug("Colonna tipo non trovata, uso valore vuoto")
-        # Invece di sollevare errore, crea una colonna tipo vuota
-        df["_tipo_temp"] = ""
-        col_tipo = "_tipo_temp"
-    else:
+    if col_tipo:
         logger.debug("Colonna tipo trovata: %s", col_tipo)
+        subset_cols["tipo"] = col_tipo
+    else:
+        # Invece di sollevare errore, il tipo verrà valorizzato come stringa vuota
+        logger.debug("Colonna tipo non trovata, uso valore vuoto")
+
+    subset_cols["codice_picking"] = col_codice_picking
 
     # Penalità (differenze o colonne con 'penal')
     try:
         col_penalita = find_column(df, [["diffe"], ["penal"], ["differenze"]])
         logger.debug("Colonna penalità trovata: %s", col_penalita)
+        subset_cols["penalita"] = col_penalita
     except ValueError:
         logger.debug("Colonna penalità non trovata, uso valore 0")
-        col_penalita = None
 
     # Quantità da sommare (preferiamo UVC, altrimenti qtaspunta, righe)
     col_quantita: Optional[str] = None
@@ -1094,24 +1018,19 @@ def parse_doppia_spunta(file_path: str) -> DoppiaSpuntaResult:
             col_quantita = None
         if col_quantita:
             logger.debug("Colonna quantità trovata: %s", col_quantita)
+            subset_cols["quantita"] = col_quantita
             break
-    
+
     if not col_quantita:
         logger.debug("Nessuna colonna quantità trovata, uso valore 0")
 
-    subset_cols = {
-        "data": col_data,
-        "codice_preparatore": col_codice_preparatore,
-        "tipo": col_tipo,
-        "codice_picking": col_codice_picking,
-    }
-    if col_penalita:
-        subset_cols["penalita"] = col_penalita
-    if col_quantita:
-        subset_cols["quantita"] = col_quantita
+    return subset_cols
 
-    sub = df[list(subset_cols.values())].copy()
-    sub.columns = list(subset_cols.keys())
+
+def _normalize_doppia_spunta(sub: pd.DataFrame) -> pd.DataFrame:
+    """Normalizza le colonne selezionate (già rinominate) e calcola colli e penalità per riga."""
+    if "tipo" not in sub.columns:
+        sub["tipo"] = ""
 
     # Normalizzazione data
     sdate = sub["data"].astype(str).str.strip()
@@ -1144,28 +1063,36 @@ def parse_doppia_spunta(file_path: str) -> DoppiaSpuntaResult:
     penalita_ratio = penalita_raw.div(uvc_val.replace(0, np.nan)).fillna(penalita_raw)
     sub["penalita"] = penalita_ratio.astype(float)
 
-    sub = sub.dropna(subset=["data", "codice_preparatore", "codice_picking"])
-    
-    logger.debug("Righe valide dopo pulizia: %d", len(sub))
+    return sub.dropna(subset=["data", "codice_preparatore", "codice_picking"])
 
-    # Creo DataFrame per penalità PICKING
-    penalita_picking = (
-        sub.groupby(["data", "codice_picking"], as_index=False)["penalita"]
-        .sum()
-    )
-    penalita_picking = penalita_picking.rename(columns={"codice_picking": "codice_preparatore"})
-    penalita_picking["penalita"] = np.ceil(penalita_picking["penalita"]).astype(int)
 
+def _aggregate_doppia_spunta(sub: pd.DataFrame) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """Somma colli e penalità per preparatore e per codice PICKING (penalità non arrotondate)."""
+    penalita_picking = sub.groupby(_PENALITA_PICKING_KEYS, as_index=False)["penalita"].sum()
     grouped = (
         sub.drop(columns=["codice_picking"])
-        .groupby(["data", "codice_preparatore", "nome_preparatore", "tipo"], as_index=False)[
-            ["totale_colli", "penalita"]
-        ]
+        .groupby(_DOPPIA_SPUNTA_GROUP_KEYS, as_index=False)[["totale_colli", "penalita"]]
         .sum()
-        .assign(tipo_attivita="DOPPIA_SPUNTA")
     )
+    return grouped, penalita_picking
+
+
+def _finalize_doppia_spunta(grouped: pd.DataFrame, penalita_picking: pd.DataFrame) -> DoppiaSpuntaResult:
+    """
+    Arrotonda le penalità e riporta i DataFrame aggregati al formato comune dei parser.
+
+    Le somme vengono portate a `_PENALITA_DECIMALI` decimali prima di `np.ceil`: l'errore
+    di arrotondamento dei float dipende dall'ordine delle addizioni (diverso tra lettura
+    completa e a blocchi) e non deve far salire di un'unità un totale intero.
+    """
+    penalita_picking = penalita_picking.rename(columns={"codice_picking": "codice_preparatore"})
+    penalita_picking["penalita"] = np.ceil(
+        penalita_picking["penalita"].round(_PENALITA_DECIMALI)
+    ).astype(int)
+
+    grouped = grouped.assign(tipo_attivita="DOPPIA_SPUNTA")
     grouped["totale_colli"] = grouped["totale_colli"].astype(int)
-    grouped["penalita"] = np.ceil(grouped["penalita"]).astype(int)
+    grouped["penalita"] = np.ceil(grouped["penalita"].round(_PENALITA_DECIMALI)).astype(int)
 
     # Riorganizzo le colonne per coerenza con il resto dei parser
     grouped = grouped[[
@@ -1183,10 +1110,129 @@ def parse_doppia_spunta(file_path: str) -> DoppiaSpuntaResult:
     return DoppiaSpuntaResult(records=grouped, penalita_picking=penalita_picking)
 
 
+def parse_doppia_spunta(file_path: str, streaming: bool = True) -> DoppiaSpuntaResult:
+    """
+    Parsa il report Doppia Spunta restituendo dati per DB e penalità PICKING.
+
+    Con `streaming=True` (default per i file .xlsx/.xlsm) il foglio viene letto riga per riga
+    e aggregato a blocchi, così la memoria non cresce con il numero di mesi nel file.
+    """
+    if streaming and Path(file_path).suffix.lower() in {".xlsx", ".xlsm"}:
+        return _parse_doppia_spunta_streaming(file_path)
+
+    df = _read_excel_with_fallbacks(file_path, DOPPIA_SPUNTA_HEADER_CANDIDATES)
+    df = df.rename(columns=lambda x: str(x).strip())
+
+    subset_cols = resolve_columns(df, "doppia_spunta", _resolve_doppia_spunta_columns, PARSER_VERSION)
+    sub = df[list(subset_cols.values())].copy()
+    sub.columns = list(subset_cols.keys())
+
+    sub = _normalize_doppia_spunta(sub)
+    logger.debug("Righe valide dopo pulizia: %d", len(sub))
+
+    return _finalize_doppia_spunta(*_aggregate_doppia_spunta(sub))
+
+
+def _parse_doppia_spunta_streaming(
+    file_path: str,
+    chunk_rows: int = DOPPIA_SPUNTA_CHUNK_ROWS,
+) -> DoppiaSpuntaResult:
+    """
+    Variante a memoria costante di `parse_doppia_spunta`.
+
+    Le colonne vengono risolte su header + un campione di righe; poi per ogni blocco di
+    `chunk_rows` righe si estraggono solo le celle necessarie, si normalizzano e si
+    sommano negli aggregati per (data, codice).
+    """
+    start_time = time.perf_counter()
+    row_iter = iter_sheet_rows(file_path)
+    try:
+        # Righe iniziali: candidati header più il campione per la risoluzione delle colonne
+        # (alcune regole guardano i valori)
+        head_rows: List[List[Any]] = []
+        for row in row_iter:
+            head_rows.append(row)
+            if len(head_rows) > max(DOPPIA_SPUNTA_HEADER_CANDIDATES) + DOPPIA_SPUNTA_SAMPLE_ROWS:
+                break
+
+        # Header: primo candidato seguito da righe dati, con più di 3 colonne nel foglio
+        # (la regola di `_read_excel_with_fallbacks`)
+        width = max((len(row) for row in head_rows), default=0)
+        header_row = next(
+            (
+                h for h in DOPPIA_SPUNTA_HEADER_CANDIDATES
+                if h + 1 < len(head_rows) and width > 3
+            ),
+            None,
+        )
+        if header_row is None:
+            raise ValueError("Impossibile leggere il file Excel: intestazione Doppia Spunta non trovata.")
+
+        pending = head_rows[header_row + 1:]
+
+        sample = rows_to_frame([head_rows[header_row]] + pending, header=0)
+        sample = sample.rename(columns=lambda x: str(x).strip())
+        subset_cols = resolve_columns(sample, "doppia_spunta", _resolve_doppia_spunta_columns, PARSER_VERSION)
+        positions = {key: list(sample.columns).index(col) for key, col in subset_cols.items()}
+
+        grouped: Optional[pd.DataFrame] = None
+        penalita_picking: Optional[pd.DataFrame] = None
+        total_rows = 0
+
+        def _consume(chunk: List[List[Any]]) -> None:
+            nonlocal grouped, penalita_picking, total_rows
+            data = {
+                key: [
+                    row[pos] if pos < len(row) and row[pos] != "" else np.nan
+                    for row in chunk
+                ]
+                for key, pos in positions.items()
+            }
+            sub = _normalize_doppia_spunta(pd.DataFrame(data))
+            total_rows += len(sub)
+            part_grouped, part_penalita = _aggregate_doppia_spunta(sub)
+            if grouped is None:
+                grouped, penalita_picking = part_grouped, part_penalita
+            else:
+                grouped = (
+                    pd.concat([grouped, part_grouped], ignore_index=True)
+                    .groupby(_DOPPIA_SPUNTA_GROUP_KEYS, as_index=False)[["totale_colli", "penalita"]]
+                    .sum()
+                )
+                penalita_picking = (
+                    pd.concat([penalita_picking, part_penalita], ignore_index=True)
+                    .groupby(_PENALITA_PICKING_KEYS, as_index=False)["penalita"]
+                    .sum()
+                )
+
+        for row in row_iter:
+            pending.append(row)
+            if len(pending) >= chunk_rows:
+                _consume(pending)
+                pending = []
+        if pending or grouped is None:
+            _consume(pending)
+    finally:
+        row_iter.close()
+
+    logger.debug("Righe valide dopo pulizia: %d", total_rows)
+    logger.info(
+        "Doppia Spunta in streaming %s: %d righe in %.2fs",
+        file_path,
+        total_rows,
+        time.perf_counter() - start_time,
+    )
+    if grouped is None or penalita_picking is None:
+        raise ValueError("Impossibile leggere il file Excel: nessuna riga Doppia Spunta elaborata.")
+    return _finalize_doppia_spunta(grouped, penalita_picking)
+
+
 def parse_ricevitori(file_path: str) -> pd.DataFrame:
     """Parsa il report Ricevitori e restituisce un DataFrame normalizzato."""
     try:
-        df = pd.read_excel(file_path, engine="openpyxl", header=None)
+        grid = read_sheet_grid(file_path)
+        df = grid.to_frame(header=None)
+        grid.log_timings()
     except Exception:
         df = pd.read_excel(file_path, header=None)
 
@@ -3,7 +3,7 @@ Interfaccia per il calcolo dei premi carrellisti.
 """
 import datetime
 from decimal import Decimal
-from typing import Dict, List, Optional, Tuple
+from typing import Any, Dict, List, Optional, Tuple
 
 import tkinter as tk
 from tkinter import messagebox, ttk
@@ -18,6 +18,7 @@ from database import (
     delete_premi_carrellisti,
 )
 from ui_components import create_button
+from utils import normalize_codice, period_range
 
 
 MONTH_CHOICES: List[Tuple[str, int]] = [
@@ -36,6 +37,45 @@ MONTH_CHOICES: List[Tuple[str, int]] = [
 ]
 
 
+def build_produzione_carrellisti_query(
+    anno: int, mese: int, codice_filtro: Optional[str] = None
+) -> Tuple[str, List[Any]]:
+    """
+    Query dei movimenti carrellisti del mese per il calcolo premi.
+
+    Esclude i giorni con anomalia PRODUZIONE_SENZA_ORE; il mese è filtrato come
+    intervallo di date, così la query usa l'indice (tipo_attivita, data, ...).
+    """
+    inizio, fine = period_range(anno, mese)
+    query = """
+        SELECT 
+            dp.codice_preparatore,
+            dp.nome_preparatore,
+            dp.tipo,
+            SUM(dp.totale_colli) as colli,
+            SUM(dp.ore_tim) as ore_totali
+        FROM dati_produzione dp
+        WHERE dp.tipo_attivita = 'CARRELLISTI'
+            AND dp.data >= %s
+            AND dp.data < %s
+            AND NOT EXISTS (
+                SELECT 1 FROM anomalie a
+                WHERE a.tipo_anomalia = 'PRODUZIONE_SENZA_ORE'
+                    AND a.data_rilevamento = dp.data
+                    AND a.codice_preparatore = dp.codice_preparatore
+                    AND a.tipo_attivita = dp.tipo_attivita
+            )
+    """
+    params: List[Any] = [inizio, fine]
+
+    if codice_filtro:
+        query += " AND dp.codice_norm = %s"
+        params.append(normalize_codice(codice_filtro))
+
+    query += " GROUP BY dp.codice_preparatore, dp.nome_preparatore, dp.tipo"
+    return query, params
+
+
 class PremiCarrellistiView(tk.Frame):
     """Interfaccia per il calcolo premi carrellisti."""
 
@@ -434,45 +474,17 @@ class PremiCarrellistiView(tk.Frame):
         bonus_perc: Optional[Decimal],
     ) -> List[Dict]:
         """Calcola i premi per tutti i carrellisti."""
-        import mysql.connector
         from contextlib import closing
-        from config import MYSQL_CONFIG
+        from db_pool import get_connection
         from typing import Any, cast
 
         cent = Decimal("0.01")
 
-        # Query per recuperare dati produzione
-        # ESCLUDE i giorni con anomalia PRODUZIONE_SENZA_ORE
-        query = """
-            SELECT 
-                dp.codice_preparatore,
-                dp.nome_preparatore,
-                dp.tipo,
-                SUM(dp.totale_colli) as colli,
-                SUM(dp.ore_tim) as ore_totali
-            FROM dati_produzione dp
-            WHERE dp.tipo_attivita = 'CARRELLISTI'
-                AND YEAR(dp.data) = %s
-                AND MONTH(dp.data) = %s
-                AND NOT EXISTS (
-                    SELECT 1 FROM anomalie a
-                    WHERE a.tipo_anomalia = 'PRODUZIONE_SENZA_ORE'
-                        AND a.data_rilevamento = dp.data
-                        AND a.codice_preparatore = dp.codice_preparatore
-                        AND a.tipo_attivita = dp.tipo_attivita
-                )
-        """
-        params: List[Any] = [anno, mese]
-
-        if codice_filtro:
-            query += " AND dp.codice_preparatore = %s"
-            params.append(codice_filtro)
-
-        query += " GROUP BY dp.codice_preparatore, dp.nome_preparatore, dp.tipo"
+        query, params = build_produzione_carrellisti_query(anno, mese, codice_filtro)
 
         risultati_utente = {}
 
-        with closing(mysql.connector.connect(**MYSQL_CONFIG)) as conn:
+        with get_connection() as conn:
             with closing(conn.cursor(dictionary=True)) as cur:
                 cur.execute(query, params)
                 rows = cast(List[Dict[str, Any]], cur.fetchall())
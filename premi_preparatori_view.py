@@ -14,6 +14,7 @@ from database import (
     save_premi_preparatori,
 )
 from ui_components import create_button
+from utils import normalize_codice, period_range
 
 
 MONTH_CHOICES: List[Tuple[str, int]] = [
@@ -32,6 +33,46 @@ MONTH_CHOICES: List[Tuple[str, int]] = [
 ]
 
 
+def build_produzione_preparatori_query(
+    anno: int, mese: int, codice_filtro: Optional[str] = None
+) -> Tuple[str, List[Any]]:
+    """
+    Query della produzione PICKING del mese per il calcolo premi.
+
+    Esclude i giorni con anomalia PRODUZIONE_SENZA_ORE; il mese è filtrato come
+    intervallo di date, così la query usa l'indice (tipo_attivita, data, ...).
+    """
+    inizio, fine = period_range(anno, mese)
+    query = """
+        SELECT
+            dp.codice_preparatore,
+            dp.nome_preparatore,
+            SUM(dp.totale_colli) AS totale_colli,
+            SUM(dp.ore_tim) AS ore_tim,
+            SUM(dp.ore_gestionale) AS ore_gestionale,
+            SUM(dp.penalita) AS penalita_totale
+        FROM dati_produzione dp
+        WHERE dp.tipo_attivita = 'PICKING'
+            AND dp.data >= %s
+            AND dp.data < %s
+            AND NOT EXISTS (
+                SELECT 1 FROM anomalie a
+                WHERE a.tipo_anomalia = 'PRODUZIONE_SENZA_ORE'
+                    AND a.data_rilevamento = dp.data
+                    AND a.codice_preparatore = dp.codice_preparatore
+                    AND a.tipo_attivita = dp.tipo_attivita
+            )
+    """
+    params: List[Any] = [inizio, fine]
+
+    if codice_filtro:
+        query += " AND dp.codice_norm = %s"
+        params.append(normalize_codice(codice_filtro))
+
+    query += " GROUP BY dp.codice_preparatore, dp.nome_preparatore"
+    return query, params
+
+
 class PremiPreparatoriView(tk.Frame):
     """Interfaccia per il calcolo premi preparatori."""
 
@@ -414,44 +455,17 @@ class PremiPreparatoriView(tk.Frame):
         bonus_perc: Optional[Decimal],
     ) -> List[Dict]:
         """Calcola i premi per i preparatori."""
-        import mysql.connector
         from contextlib import closing
-        from config import MYSQL_CONFIG
+        from db_pool import get_connection
         from typing import Any, cast
 
         cent = Decimal("0.01")
 
-        query = """
-            SELECT
-                dp.codice_preparatore,
-                dp.nome_preparatore,
-                SUM(dp.totale_colli) AS totale_colli,
-                SUM(dp.ore_tim) AS ore_tim,
-                SUM(dp.ore_gestionale) AS ore_gestionale,
-                SUM(dp.penalita) AS penalita_totale
-            FROM dati_produzione dp
-            WHERE dp.tipo_attivita = 'PICKING'
-                AND YEAR(dp.data) = %s
-                AND MONTH(dp.data) = %s
-                AND NOT EXISTS (
-                    SELECT 1 FROM anomalie a
-                    WHERE a.tipo_anomalia = 'PRODUZIONE_SENZA_ORE'
-                        AND a.data_rilevamento = dp.data
-                        AND a.codice_preparatore = dp.codice_preparatore
-                        AND a.tipo_attivita = dp.tipo_attivita
-                )
-        """
-        params: List[Any] = [anno, mese]
-
-        if codice_filtro:
-            query += " AND dp.codice_preparatore = %s"
-            params.append(codice_filtro)
-
-        query += " GROUP BY dp.codice_preparatore, dp.nome_preparatore"
+        query, params = build_produzione_preparatori_query(anno, mese, codice_filtro)
 
         risultati: List[Dict[str, Any]] = []
 
-        with closing(mysql.connector.connect(**MYSQL_CONFIG)) as conn:
+        with get_connection() as conn:
             with closing(conn.cursor(dictionary=True)) as cur:
                 cur.execute(query, params)
                 rows = cast(List[Dict[str, Any]], cur.fetchall())
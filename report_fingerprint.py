@@ -0,0 +1,179 @@
+"""
+Riconoscimento automatico del tipo di report dalle intestazioni delle prime righe.
+
+Ogni tipo di report ha una firma (colonne attese con un peso, parole chiave del titolo):
+le prime righe del foglio vengono confrontate con tutte le firme e vince quella con il
+punteggio più alto, con una confidenza che tiene conto dello scarto dalla seconda.
+"""
+import logging
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+from excel_reader import read_sheet_grid
+from utils import normalize_string
+
+logger = logging.getLogger(__name__)
+
+TIPO_AUTOMATICO = "Rilevamento automatico"
+TIPO_PREPARATORI = "Preparatori (PICKING)"
+TIPO_CARRELLISTI = "Carrellisti (CARRELLO)"
+TIPO_RICEVITORI = "Ricevitori (RICEVITORI)"
+TIPO_DOPPIA_SPUNTA = "Doppia Spunta"
+
+# Righe lette per il riconoscimento (titolo + intestazione stanno sempre nelle prime)
+FINGERPRINT_MAX_ROWS = 10
+# Sotto questa confidenza il tipo non viene scelto automaticamente
+MIN_CONFIDENCE = 0.35
+
+
+@dataclass(frozen=True)
+class HeaderFeature:
+    """Colonna attesa nell'intestazione: `exact` richiede la cella identica al token."""
+
+    token: str
+    weight: float
+    exact: bool = False
+
+    def matches(self, cell: str) -> bool:
+        return cell == self.token if self.exact else self.token in cell
+
+
+@dataclass(frozen=True)
+class ReportSignature:
+    """Firma di un tipo di report."""
+
+    tipo: str
+    features: Tuple[HeaderFeature, ...]
+    title_keywords: Tuple[str, ...] = ()
+    title_weight: float = 2.0
+
+    @property
+    def total_weight(self) -> float:
+        return sum(f.weight for f in self.features) + (self.title_weight if self.title_keywords else 0.0)
+
+
+SIGNATURES: List[ReportSignature] = [
+    ReportSignature(
+        tipo=TIPO_PREPARATORI,
+        features=(
+            HeaderFeature("codice preparatore", 3),
+            HeaderFeature("descrizione preparatore", 2),
+            HeaderFeature("data inizio preparazione", 2),
+            HeaderFeature("tempo lavorato", 1),
+            HeaderFeature("lista", 1, exact=True),
+            HeaderFeature("multip", 1, exact=True),
+        ),
+        title_keywords=("preparatori",),
+    ),
+    ReportSignature(
+        tipo=TIPO_CARRELLISTI,
+        features=(
+            HeaderFeature("preparatore", 3, exact=True),
+            HeaderFeature("tipo", 2, exact=True),
+            HeaderFeature("trasporto", 1),
+            HeaderFeature("ora inizio", 1, exact=True),
+            HeaderFeature("ora fine", 1, exact=True),
+            HeaderFeature("tempo lavorato", 1),
+        ),
+        title_keywords=("carrelisti", "carrellisti"),
+    ),
+    ReportSignature(
+        tipo=TIPO_DOPPIA_SPUNTA,
+        features=(
+            HeaderFeature("codcli", 2, exact=True),
+            HeaderFeature("prepa", 2, exact=True),
+            HeaderFeature("prepc", 1, exact=True),
+            HeaderFeature("qtaspunta", 2, exact=True),
+            HeaderFeature("qtasped", 1, exact=True),
+            HeaderFeature("diffe", 1, exact=True),
+            HeaderFeature("prep", 1, exact=True),
+        ),
+        title_keywords=("doppia spunta",),
+    ),
+    ReportSignature(
+        tipo=TIPO_RICEVITORI,
+        features=(
+            HeaderFeature("nro ordine", 2),
+            HeaderFeature("nro art distinti", 2),
+            HeaderFeature("nro uvc", 1),
+            HeaderFeature("data arrivo", 2),
+            HeaderFeature("nro pallet", 1),
+            HeaderFeature("cod. for.", 1),
+        ),
+        title_keywords=("ricevitori",),
+    ),
+]
+
+
+@dataclass
+class FingerprintResult:
+    """Esito del riconoscimento: tipo scelto, punteggio (0-1) e confidenza (0-1)."""
+
+    tipo: Optional[str]
+    score: float
+    confidence: float
+    header_row: Optional[int] = None
+    scores: Dict[str, float] = field(default_factory=dict)
+
+    @property
+    def is_confident(self) -> bool:
+        return self.tipo is not None and self.confidence >= MIN_CONFIDENCE
+
+
+def _score_signature(signature: ReportSignature, rows: List[List[str]], title_text: str) -> Tuple[float, Optional[int]]:
+    """Punteggio della firma sulla riga di intestazione migliore, più il bonus titolo."""
+    best_weight = 0.0
+    best_row = None
+    for idx, cells in enumerate(rows):
+        weight = sum(f.weight for f in signature.features if any(f.matches(c) for c in cells))
+        if weight > best_weight:
+            best_weight, best_row = weight, idx
+    if signature.title_keywords and any(k in title_text for k in signature.title_keywords):
+        best_weight += signature.title_weight
+    return best_weight / signature.total_weight, best_row
+
+
+def fingerprint_rows(rows: List[List[object]]) -> FingerprintResult:
+    """Confronta le prime righe di un foglio con tutte le firme registrate."""
+    cells = [[normalize_string(v) for v in row if str(v).strip() and str(v) != "nan"] for row in rows]
+    title_text = " ".join(" ".join(c) for c in cells)
+
+    scores: Dict[str, float] = {}
+    header_rows: Dict[str, Optional[int]] = {}
+    for signature in SIGNATURES:
+        scores[signature.tipo], header_rows[signature.tipo] = _score_signature(signature, cells, title_text)
+
+    ranking = sorted(scores.items(), key=lambda item: item[1], reverse=True)
+    best_tipo, best_score = ranking[0]
+    second_score = ranking[1][1] if len(ranking) > 1 else 0.0
+    if best_score <= 0:
+        return FingerprintResult(tipo=None, score=0.0, confidence=0.0, scores=scores)
+
+    # Confidenza: punteggio del migliore ridotto in proporzione a quanto è vicino il secondo
+    confidence = best_score * (1 - second_score / best_score)
+    return FingerprintResult(
+        tipo=best_tipo,
+        score=best_score,
+        confidence=confidence,
+        header_row=header_rows[best_tipo],
+        scores=scores,
+    )
+
+
+def detect_report_type(file_path: str, max_rows: int = FINGERPRINT_MAX_ROWS) -> FingerprintResult:
+    """
+    Legge solo le prime righe del file e ne riconosce il tipo di report.
+
+    Returns:
+        FingerprintResult; `is_confident` indica se il tipo può essere usato senza conferma
+    """
+    grid = read_sheet_grid(file_path, max_rows=max_rows)
+    result = fingerprint_rows(grid.rows)
+    logger.info(
+        "Riconoscimento %s: %s (punteggio=%.2f, confidenza=%.2f)",
+        file_path,
+        result.tipo or "sconosciuto",
+        result.score,
+        result.confidence,
+    )
+    return result
@@ -0,0 +1,181 @@
+"""
+Stato della sincronizzazione TIM per giorno e tipo attività.
+
+La tabella `sync_tim_stato` registra, per ogni (data, tipo_attivita), quando il giorno
+è stato riconciliato e la firma delle attività TIM in quel momento. Un giorno va
+sincronizzato di nuovo solo se:
+- non è mai stato sincronizzato;
+- ha righe locali modificate dopo la sincronizzazione (`updated_at`);
+- la firma TIM è cambiata (attività aggiunte, rimosse o con durata diversa, oppure
+  codici gestionale modificati).
+
+Le funzioni ricevono cursori `dictionary=True` e non eseguono commit: lo stato viene
+salvato nella stessa transazione degli aggiornamenti della sincronizzazione.
+"""
+import datetime
+import logging
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+from bulk_loader import insert_values_chunked
+from config import TABLE_NAME
+
+logger = logging.getLogger(__name__)
+
+SYNC_STATE_TABLE = "sync_tim_stato"
+
+# (data "YYYY-MM-DD", tipo attività locale)
+DayKey = Tuple[str, str]
+
+
+def _date_str(value: Any) -> str:
+    return value.strftime("%Y-%m-%d") if hasattr(value, "strftime") else str(value)
+
+
+def day_key(data: Any, tipo_attivita: Any) -> DayKey:
+    """Chiave (data "YYYY-MM-DD", tipo attività) di una riga di dati_produzione."""
+    return _date_str(data), str(tipo_attivita)
+
+
+def _placeholders(values: Sequence[Any]) -> str:
+    return ", ".join(["%s"] * len(values))
+
+
+def server_now(cur: Any) -> datetime.datetime:
+    """Ora del server MySQL, confrontabile con `updated_at`."""
+    cur.execute("SELECT NOW(6) AS adesso")
+    return cur.fetchone()["adesso"]
+
+
+def fetch_tim_signatures(
+    tim_cur: Any, date: Sequence[str], tipi_tim: Sequence[str], checksum_codici: Optional[int]
+) -> Dict[Tuple[str, str], str]:
+    """
+    Firma delle attività TIM per (data, tipo TIM): numero righe, id massimo e durata totale.
+
+    Alla firma di ogni giorno si aggiunge `checksum_codici` (vedi
+    `tim_registry.fetch_codici_checksum`), così una
+    modifica ai codici (es. un codice prima non abbinato) rende di nuovo da sincronizzare
+    tutti i giorni. I giorni senza attività hanno firma con zero righe.
+    """
+    if not date or not tipi_tim:
+        return {}
+
+    tim_cur.execute(
+        f"""
+        SELECT a.data_riferimento,
+               ta.descrizione AS tipo,
+               COUNT(*) AS righe,
+               MAX(a.id) AS max_id,
+               COALESCE(SUM(a.durata), 0) AS durata
+        FROM attivita a
+        JOIN tipoattivita ta ON a.tipo_attivita_id = ta.id
+        WHERE a.data_riferimento IN ({_placeholders(date)})
+          AND ta.descrizione IN ({_placeholders(tipi_tim)})
+        GROUP BY a.data_riferimento, ta.descrizione
+        """,
+        [*date, *tipi_tim],
+    )
+    firme = {
+        (data, tipo): f"0:0:0|{checksum_codici}" for data in date for tipo in tipi_tim
+    }
+    for row in tim_cur.fetchall():
+        key = (_date_str(row["data_riferimento"]), str(row["tipo"]))
+        firme[key] = f"{row['righe']}:{row['max_id']}:{row['durata']}|{checksum_codici}"
+    return firme
+
+
+def fetch_local_changes(
+    cur: Any, date: Sequence[str], tipi_attivita: Sequence[str]
+) -> Dict[DayKey, datetime.datetime]:
+    """Ultima modifica delle righe locali per (data, tipo_attivita)."""
+    if not date or not tipi_attivita:
+        return {}
+    cur.execute(
+        f"""
+        SELECT data, tipo_attivita, MAX(updated_at) AS modificato_il
+        FROM {TABLE_NAME}
+        WHERE tipo_attivita IN ({_placeholders(tipi_attivita)})
+          AND data IN ({_placeholders(date)})
+        GROUP BY data, tipo_attivita
+        """,
+        [*tipi_attivita, *date],
+    )
+    return {
+        (_date_str(row["data"]), str(row["tipo_attivita"])): row["modificato_il"]
+        for row in cur.fetchall()
+    }
+
+
+def fetch_sync_state(
+    cur: Any, date: Sequence[str], tipi_attivita: Sequence[str]
+) -> Dict[DayKey, Tuple[datetime.datetime, Optional[str]]]:
+    """Stato salvato (sincronizzato_il, firma_tim) per (data, tipo_attivita)."""
+    if not date or not tipi_attivita:
+        return {}
+    cur.execute(
+        f"""
+        SELECT data, tipo_attivita, sincronizzato_il, firma_tim
+        FROM {SYNC_STATE_TABLE}
+        WHERE data IN ({_placeholders(date)})
+          AND tipo_attivita IN ({_placeholders(tipi_attivita)})
+        """,
+        [*date, *tipi_attivita],
+    )
+    return {
+        (_date_str(row["data"]), str(row["tipo_attivita"])): (row["sincronizzato_il"], row["firma_tim"])
+        for row in cur.fetchall()
+    }
+
+
+def dirty_days(
+    days: Iterable[DayKey],
+    local_changes: Dict[DayKey, datetime.datetime],
+    tim_signatures: Dict[DayKey, str],
+    state: Dict[DayKey, Tuple[datetime.datetime, Optional[str]]],
+) -> Set[DayKey]:
+    """
+    Giorni da sincronizzare: mai sincronizzati, modificati in locale o cambiati in TIM.
+
+    `tim_signatures` è indicizzato per tipo attività locale; un giorno senza firma TIM
+    (probe non disponibile) viene sempre sincronizzato.
+    """
+    dirty: Set[DayKey] = set()
+    for day in days:
+        saved = state.get(day)
+        firma = tim_signatures.get(day)
+        if saved is None or firma is None:
+            dirty.add(day)
+            continue
+        sincronizzato_il, firma_salvata = saved
+        modificato_il = local_changes.get(day)
+        if (modificato_il is not None and modificato_il > sincronizzato_il) or firma != firma_salvata:
+            dirty.add(day)
+    return dirty
+
+
+def save_sync_state(
+    cur: Any,
+    days: Iterable[DayKey],
+    sincronizzato_il: datetime.datetime,
+    tim_signatures: Dict[DayKey, str],
+) -> int:
+    """
+    Registra i giorni riconciliati, senza commit.
+
+    `sincronizzato_il` è l'ora del server all'inizio della sincronizzazione: le righe
+    importate mentre era in corso restano più recenti e il giorno resta da sincronizzare.
+    """
+    rows: List[Tuple[Any, ...]] = [
+        (data, tipo, sincronizzato_il, tim_signatures.get((data, tipo)))
+        for data, tipo in sorted(set(days))
+    ]
+    if not rows:
+        return 0
+    insert_values_chunked(
+        cur,
+        SYNC_STATE_TABLE,
+        ("data", "tipo_attivita", "sincronizzato_il", "firma_tim"),
+        rows,
+        on_duplicate="sincronizzato_il = VALUES(sincronizzato_il), firma_tim = VALUES(firma_tim)",
+    )
+    return len(rows)
@@ -0,0 +1,277 @@
+"""
+Anagrafica dei codici gestionale TIM (codice → utente) con copia locale.
+
+`codicegestionale` associa ogni codice operatore, per tipo attività, a un utente TIM in
+un intervallo di validità (`valido_dal`/`valido_al`). La tabella locale `tim_codici`
+ne conserva una copia con nome e cognome dell'utente, riletta da TIM quando è più
+vecchia di `TIM_REGISTRY_MAX_AGE` secondi; in memoria gli intervalli sono ordinati per
+codice e tipo attività e la ricerca per data usa `bisect`, senza query verso TIM.
+"""
+import bisect
+import datetime
+import logging
+import threading
+import time
+from contextlib import closing
+from dataclasses import dataclass
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from bulk_loader import insert_values_chunked
+from config import TIM_REGISTRY_MAX_AGE
+from db_pool import get_connection, get_tim_connection
+from migrations import ensure_schema
+from utils import normalize_codice
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_TABLE = "tim_codici"
+
+_SNAPSHOT_COLUMNS = (
+    "codice_norm",
+    "tipo_attivita_id",
+    "tipo_attivita",
+    "utente_id",
+    "nome",
+    "cognome",
+    "valido_dal",
+    "valido_al",
+    "aggiornato_il",
+    "checksum_codici",
+)
+
+
+def format_nominativo(nome: Optional[str], cognome: Optional[str]) -> str:
+    """Nominativo nel formato usato in dati_produzione e anomalie: "COGNOME NOME"."""
+    nome = (nome or "").strip().upper()
+    cognome = (cognome or "").strip().upper()
+    return " ".join(part for part in (cognome, nome) if part)
+
+
+def _as_date(value: Any) -> datetime.date:
+    if isinstance(value, datetime.datetime):
+        return value.date()
+    if isinstance(value, datetime.date):
+        return value
+    return datetime.date.fromisoformat(str(value)[:10])
+
+
+@dataclass(frozen=True)
+class TimCodice:
+    """Associazione di un codice gestionale a un utente TIM in un intervallo di validità."""
+
+    codice: str
+    tipo_attivita_id: str
+    tipo_attivita: str
+    utente_id: str
+    nome: str
+    cognome: str
+    valido_dal: datetime.date
+    valido_al: Optional[datetime.date]
+
+    @property
+    def nominativo(self) -> str:
+        return format_nominativo(self.nome, self.cognome)
+
+    def valido(self, data: datetime.date) -> bool:
+        return self.valido_dal <= data and (self.valido_al is None or data <= self.valido_al)
+
+
+class TimRegistry:
+    """Indice in memoria dei codici TIM per (codice normalizzato, tipo attività)."""
+
+    def __init__(
+        self,
+        codici: Iterable[TimCodice],
+        aggiornato_il: Optional[datetime.datetime] = None,
+        checksum_codici: Optional[int] = None,
+    ):
+        self.aggiornato_il = aggiornato_il
+        self.checksum_codici = checksum_codici
+        self.tipi: Dict[str, str] = {}
+        grouped: Dict[Tuple[str, str], List[TimCodice]] = {}
+        for codice in codici:
+            grouped.setdefault((codice.codice, codice.tipo_attivita), []).append(codice)
+            self.tipi[codice.tipo_attivita_id] = codice.tipo_attivita
+        # Per ogni chiave: inizi di validità ordinati (per bisect) e intervalli corrispondenti
+        self._index: Dict[Tuple[str, str], Tuple[List[datetime.date], List[TimCodice]]] = {}
+        for key, intervalli in grouped.items():
+            intervalli.sort(key=lambda c: c.valido_dal)
+            self._index[key] = ([c.valido_dal for c in intervalli], intervalli)
+        self._size = sum(len(v) for v in grouped.values())
+
+    def __len__(self) -> int:
+        return self._size
+
+    def resolve(self, codice: Any, tipo_attivita: str, data: Any) -> Optional[TimCodice]:
+        """
+        Associazione valida alla data per codice e tipo attività TIM (descrizione).
+
+        Con intervalli sovrapposti prevale quello iniziato più di recente.
+        """
+        entry = self._index.get((normalize_codice(codice), tipo_attivita))
+        if entry is None:
+            return None
+        inizi, intervalli = entry
+        giorno = _as_date(data)
+        pos = bisect.bisect_right(inizi, giorno) - 1
+        while pos >= 0:
+            if intervalli[pos].valido(giorno):
+                return intervalli[pos]
+            pos -= 1
+        return None
+
+    def nominativo(self, codice: Any, tipo_attivita: str, data: Any) -> Optional[str]:
+        """Nominativo "COGNOME NOME" dell'utente associato al codice alla data, se presente."""
+        trovato = self.resolve(codice, tipo_attivita, data)
+        return (trovato.nominativo or None) if trovato else None
+
+    def tipo_descrizione(self, tipo_attivita_id: str) -> Optional[str]:
+        return self.tipi.get(tipo_attivita_id)
+
+
+def fetch_codici_checksum(tim_cur: Any) -> Optional[int]:
+    """Checksum di `codicegestionale`: cambia con ogni modifica all'anagrafica codici."""
+    tim_cur.execute("CHECKSUM TABLE codicegestionale")
+    row = tim_cur.fetchone()
+    if row is None:
+        return None
+    checksum = row["Checksum"] if isinstance(row, dict) else row[1]
+    return int(checksum) if checksum is not None else None
+
+
+def refresh_snapshot() -> int:
+    """
+    Rilegge l'anagrafica codici da TIM e sostituisce la copia locale in una transazione.
+
+    Returns:
+        Numero di associazioni copiate
+    """
+    ensure_schema()
+    with get_tim_connection() as tim_conn:
+        with closing(tim_conn.cursor(dictionary=True)) as tim_cur:
+            tim_cur.execute(
+                """
+                SELECT cg.codice,
+                       cg.tipo_attivita_id,
+                       ta.descrizione AS tipo_attivita,
+                       cg.utente_id,
+                       u.nome,
+                       u.cognome,
+                       cg.valido_dal,
+                       cg.valido_al
+                FROM codicegestionale cg
+                JOIN utente u ON cg.utente_id = u.id
+                JOIN tipoattivita ta ON cg.tipo_attivita_id = ta.id
+                """
+            )
+            rows = tim_cur.fetchall()
+            checksum_codici = fetch_codici_checksum(tim_cur)
+
+    with get_connection() as conn:
+        with closing(conn.cursor()) as cur:
+            cur.execute("SELECT NOW(6)")
+            (adesso,) = cur.fetchone()
+            values = [
+                (
+                    normalize_codice(row["codice"]),
+                    str(row["tipo_attivita_id"]),
+                    str(row["tipo_attivita"]),
+                    str(row["utente_id"]),
+                    str(row["nome"] or "").strip(),
+                    str(row["cognome"] or "").strip(),
+                    row["valido_dal"],
+                    row["valido_al"],
+                    adesso,
+                    checksum_codici,
+                )
+                for row in rows
+                if row.get("codice") and row.get("valido_dal")
+            ]
+            cur.execute(f"DELETE FROM {SNAPSHOT_TABLE}")
+            insert_values_chunked(cur, SNAPSHOT_TABLE, _SNAPSHOT_COLUMNS, values)
+        conn.commit()
+
+    logger.info("Anagrafica codici TIM aggiornata: %d associazioni", len(values))
+    return len(values)
+
+
+def _snapshot_state(cur: Any) -> Tuple[Optional[float], Optional[int]]:
+    """Secondi dall'ultima copia da TIM (None se la copia locale è vuota) e checksum copiato."""
+    cur.execute(
+        f"""
+        SELECT TIMESTAMPDIFF(SECOND, MAX(aggiornato_il), NOW(6)) AS eta,
+               MAX(checksum_codici) AS checksum_codici
+        FROM {SNAPSHOT_TABLE}
+        """
+    )
+    row = cur.fetchone()
+    if row is None or row["eta"] is None:
+        return None, None
+    return float(row["eta"]), row["checksum_codici"]
+
+
+def load_snapshot() -> TimRegistry:
+    """Costruisce il registro dalla copia locale, senza interrogare TIM."""
+    ensure_schema()
+    with get_connection() as conn:
+        with closing(conn.cursor(dictionary=True)) as cur:
+            cur.execute(f"SELECT {', '.join(_SNAPSHOT_COLUMNS)} FROM {SNAPSHOT_TABLE}")
+            rows = cur.fetchall()
+    codici = [
+        TimCodice(
+            codice=row["codice_norm"],
+            tipo_attivita_id=row["tipo_attivita_id"],
+            tipo_attivita=row["tipo_attivita"],
+            utente_id=row["utente_id"],
+            nome=row["nome"] or "",
+            cognome=row["cognome"] or "",
+            valido_dal=_as_date(row["valido_dal"]),
+            valido_al=_as_date(row["valido_al"]) if row["valido_al"] is not None else None,
+        )
+        for row in rows
+    ]
+    aggiornato_il = max((row["aggiornato_il"] for row in rows), default=None)
+    checksum_codici = rows[0]["checksum_codici"] if rows else None
+    return TimRegistry(codici, aggiornato_il, checksum_codici)
+
+
+_registry: Optional[TimRegistry] = None
+_registry_loaded_at = 0.0
+_registry_lock = threading.Lock()
+
+
+def get_tim_registry(
+    max_age: Optional[float] = None,
+    force_refresh: bool = False,
+    checksum_codici: Optional[int] = None,
+) -> TimRegistry:
+    """
+    Registro dei codici TIM, condiviso nel processo.
+
+    La copia locale viene riletta da TIM quando è vuota o più vecchia di `max_age`
+    secondi (default `TIM_REGISTRY_MAX_AGE`); il registro in memoria viene ricostruito
+    con la stessa cadenza. Se `checksum_codici` (letto da TIM con `fetch_codici_checksum`)
+    è diverso da quello della copia, l'anagrafica è cambiata e viene riletta subito.
+    """
+    global _registry, _registry_loaded_at
+    max_age = TIM_REGISTRY_MAX_AGE if max_age is None else max_age
+    with _registry_lock:
+        in_memoria = (
+            _registry is not None
+            and time.monotonic() - _registry_loaded_at < max_age
+            and (checksum_codici is None or _registry.checksum_codici == checksum_codici)
+        )
+        if in_memoria and not force_refresh:
+            return _registry
+
+        ensure_schema()
+        with get_connection() as conn:
+            with closing(conn.cursor(dictionary=True)) as cur:
+                eta, checksum_copia = _snapshot_state(cur)
+        cambiato = checksum_codici is not None and checksum_copia != checksum_codici
+        if force_refresh or cambiato or eta is None or eta >= max_age:
+            refresh_snapshot()
+
+        _registry = load_snapshot()
+        _registry_loaded_at = time.monotonic()
+        return _registry
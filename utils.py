@@ -1,15 +1,29 @@
 """
 Funzioni utility per il parsing e la normalizzazione dei dati.
 """
-from typing import List, Optional
+import datetime
+import logging
+from typing import Any, Callable, Dict, List, Optional, Tuple
+import numpy as np
 import pandas as pd
 
+logger = logging.getLogger(__name__)
+
 
 def normalize_string(s: str) -> str:
     """Normalizza una stringa per confronti più tolleranti."""
     return str(s).lower().replace("°", "").strip()
 
 
+def normalize_codice(codice: Any) -> str:
+    """
+    Codice operatore nella forma usata per i confronti (maiuscolo, senza spazi).
+
+    Corrisponde alla colonna generata `codice_norm` di dati_produzione.
+    """
+    return str(codice).strip().upper()
+
+
 def find_column(df: pd.DataFrame, candidates: List[List[str]], required: bool = True) -> Optional[str]:
     """
     Trova una colonna il cui nome contiene tutte le parole di almeno una combinazione.
@@ -28,6 +42,14 @@ def find_column(df: pd.DataFrame, candidates: List[List[str]], required: bool =
     """
     names = {c: normalize_string(c) for c in df.columns}
     
+    # Prova preliminare: nome colonna identico a un'alternativa (evita che token corti
+    # come "rs" vengano trovati dentro nomi più lunghi)
+    for option in candidates:
+        target = " ".join(normalize_string(part) for part in option)
+        for col, norm in names.items():
+            if norm == target:
+                return col
+    
     # Prima prova: ricerca esatta con tutte le parole
     for col, norm in names.items():
         for option in candidates:
@@ -39,7 +61,7 @@ def find_column(df: pd.DataFrame, candidates: List[List[str]], required: bool =
         for option in candidates:
             for part in option:
                 if normalize_string(part) in norm:
-                    print(f"⚠️ Trovata colonna parziale '{col}' per '{part}'")
+                    logger.warning("Trovata colonna parziale '%s' per '%s'", col, part)
                     return col
     
     if required:
@@ -58,10 +80,238 @@ def safe_int_conversion(value, default: int = 0) -> int:
         return default
 
 
+def convert_unique(series: pd.Series, func: Callable[[Any], Any], dtype: Optional[str] = None) -> pd.Series:
+    """
+    Applica `func` una sola volta per ogni valore distinto della colonna.
+
+    I file mensili hanno poche decine di date e qualche migliaio di orari distinti su
+    decine di migliaia di righe: i valori vengono fattorizzati, convertiti e poi
+    rimappati sulle righe, con lo stesso risultato di `series.apply(func)`.
+
+    Args:
+        series: Colonna da convertire
+        func: Conversione di un singolo valore grezzo (riceve anche i valori mancanti)
+        dtype: Se indicato, tipo finale della colonna (es. "float")
+
+    Returns:
+        Serie convertita con lo stesso indice di `series`
+    """
+    codes, uniques = pd.factorize(series, use_na_sentinel=False)
+    converted = pd.Series(uniques).apply(func)
+    result = pd.Series(converted.to_numpy()[codes], index=series.index, name=series.name)
+    return result.astype(dtype) if dtype else result
+
+
+def period_range(anno: int, mese: Optional[int] = None) -> Tuple[datetime.date, datetime.date]:
+    """
+    Intervallo semiaperto [inizio, fine) di un mese o, senza mese, di un anno.
+
+    Da usare come `data >= inizio AND data < fine` al posto di YEAR()/MONTH(),
+    così il filtro può usare gli indici sulla colonna data.
+    """
+    if mese is None:
+        return datetime.date(anno, 1, 1), datetime.date(anno + 1, 1, 1)
+    inizio = datetime.date(anno, mese, 1)
+    fine = datetime.date(anno + 1, 1, 1) if mese == 12 else datetime.date(anno, mese + 1, 1)
+    return inizio, fine
+
+
+def parse_time(val) -> Optional[datetime.time]:
+    """
+    Converte vari formati di ora in datetime.time.
+
+    Gestisce datetime.time/datetime.datetime, stringhe "HH:MM[:SS]", frazioni di giorno
+    Excel (0.5 = 12:00) e il formato HH.MM come numero (7.53 = 07:53).
+    """
+    if pd.isna(val):
+        return None
+    
+    # Se è già datetime.time
+    if isinstance(val, datetime.time):
+        return val
+    
+    # Se è datetime.datetime
+    if isinstance(val, datetime.datetime):
+        return val.time()
+    
+    # Se è stringa formato HH:MM o HH:MM:SS
+    if isinstance(val, str):
+        val = val.strip()
+        try:
+            parts = val.split(':')
+            if len(parts) >= 2:
+                hour = int(parts[0])
+                minute = int(parts[1])
+                second = int(parts[2]) if len(parts) > 2 else 0
+                return datetime.time(hour, minute, second)
+        except ValueError:
+            pass
+    
+    # Se è un float (Excel time format: frazione di giorno)
+    if isinstance(val, (int, float)):
+        try:
+            # CASO 1: Se il valore è < 1, è una frazione di giorno Excel (0.5 = 12:00)
+            if 0 <= val < 1:
+                total_seconds = int(val * 24 * 3600)
+                hours = total_seconds // 3600
+                minutes = (total_seconds % 3600) // 60
+                seconds = total_seconds % 60
+                return datetime.time(hours % 24, minutes, seconds)
+            
+            # CASO 2: Se il valore è >= 1, è formato HH.MM (es. 07.53 = 07:53)
+            # Es: 07.53 → ore=7, minuti=53
+            # Es: 14.09 → ore=14, minuti=09
+            ore = int(val)
+            minuti = int(round((val - ore) * 100))
+            
+            # Valida che sia un orario sensato
+            if 0 <= ore < 24 and 0 <= minuti < 60:
+                return datetime.time(ore, minuti, 0)
+            return None
+        except (ValueError, OverflowError):
+            pass
+    
+    return None
+
+
+def _parse_yyyymmdd(val_str: str) -> Optional[datetime.date]:
+    try:
+        return datetime.date(int(val_str[0:4]), int(val_str[4:6]), int(val_str[6:8]))
+    except ValueError:
+        return None
+
+
+def parse_date(val) -> Optional[datetime.date]:
+    """
+    Converte una cella data in datetime.date.
+
+    Gestisce date/datetime, numeri e stringhe nel formato yyyymmdd e, in ultima istanza,
+    qualsiasi formato riconosciuto da `pd.to_datetime`.
+    """
+    if pd.isna(val):
+        return None
+    if isinstance(val, (datetime.datetime, datetime.date)):
+        return val if isinstance(val, datetime.date) else val.date()
+    if isinstance(val, (int, float)):
+        val_str = str(int(val))
+        if len(val_str) == 8:
+            parsed = _parse_yyyymmdd(val_str)
+            if parsed:
+                return parsed
+    if isinstance(val, str):
+        val_str = val.strip()
+        if len(val_str) == 8 and val_str.isdigit():
+            parsed = _parse_yyyymmdd(val_str)
+            if parsed:
+                return parsed
+    try:
+        return pd.to_datetime(val).date()
+    except Exception:
+        return None
+
+
+def parse_tempo_lavorato(value) -> float:
+    """Converte il tempo lavorato in ore decimali (timedelta, orario, frazione di giorno o "hh:mm[:ss]")."""
+    if pd.isna(value):
+        return 0.0
+    if isinstance(value, datetime.timedelta):
+        return value.total_seconds() / 3600
+    if isinstance(value, (datetime.time, datetime.datetime)):
+        return (
+            value.hour
+            + value.minute / 60
+            + value.second / 3600
+        )
+    if isinstance(value, (int, float)):
+        # Excel memorizza il tempo come frazione di giorno
+        return float(value) * 24
+    if isinstance(value, str):
+        value = value.strip()
+        if not value:
+            return 0.0
+        try:
+            td = pd.to_timedelta(value)
+            if pd.notna(td):
+                return td.total_seconds() / 3600
+        except ValueError:
+            pass
+        # Tentativo di parsing manuale hh:mm[:ss]
+        try:
+            parts = value.split(":")
+            if len(parts) >= 2:
+                hours = int(parts[0])
+                minutes = int(parts[1])
+                seconds = int(parts[2]) if len(parts) > 2 else 0
+                return hours + minutes / 60 + seconds / 3600
+        except ValueError:
+            return 0.0
+    return 0.0
+
+
+class ConversionErrors:
+    """Raccoglie i valori non convertibili per colonna e li riporta in un unico riepilogo."""
+
+    MAX_ESEMPI = 5
+
+    def __init__(self, contesto: str):
+        self.contesto = contesto
+        self.per_colonna: Dict[str, List[Tuple[Any, Any]]] = {}
+
+    def add(self, column: str, bad: pd.Series) -> None:
+        """Registra i valori di `bad` (indice = riga) non convertiti per `column`."""
+        if not bad.empty:
+            self.per_colonna.setdefault(column, []).extend(bad.items())
+
+    def log_summary(self) -> None:
+        if not self.per_colonna:
+            return
+        dettagli = []
+        for column, items in self.per_colonna.items():
+            esempi = ", ".join(f"riga {idx}={value!r}" for idx, value in items[: self.MAX_ESEMPI])
+            dettagli.append(f"{column}: {len(items)} valori ({esempi})")
+        logger.warning(
+            "%s: valori non convertibili sostituiti con 0 - %s",
+            self.contesto,
+            "; ".join(dettagli),
+        )
+
+
+def _int_column(df: pd.DataFrame, column: str, errors: ConversionErrors) -> List[int]:
+    """Colonna convertita in interi Python (troncando i decimali); mancanti e non validi → 0."""
+    if column not in df.columns:
+        return [0] * len(df)
+    raw = df[column]
+    numeric = pd.to_numeric(raw, errors="coerce")
+    invalid = raw.notna() & ~np.isfinite(numeric.astype(float))
+    errors.add(column, raw[invalid])
+    return numeric.where(~invalid, 0).fillna(0).astype(np.int64).tolist()
+
+
+def _float_column(df: pd.DataFrame, column: str, errors: ConversionErrors) -> List[float]:
+    """Colonna convertita in float Python; mancanti e non validi → 0.0."""
+    if column not in df.columns:
+        return [0.0] * len(df)
+    raw = df[column]
+    numeric = pd.to_numeric(raw, errors="coerce")
+    errors.add(column, raw[raw.notna() & numeric.isna()])
+    return numeric.fillna(0.0).astype(float).tolist()
+
+
+def _str_column(df: pd.DataFrame, column: str, missing: Any) -> List[Any]:
+    """Colonna convertita in stringhe; i valori mancanti diventano `missing`."""
+    if column not in df.columns:
+        return [missing] * len(df)
+    raw = df[column]
+    return raw.astype(str).where(raw.notna(), missing).tolist()
+
+
 def prepare_dataframe_for_db(df: pd.DataFrame) -> List[tuple]:
     """
     Prepara un DataFrame per l'inserimento nel database.
     
+    Le colonne vengono convertite una sola volta ciascuna; i valori non convertibili
+    diventano 0 e sono riportati in un unico riepilogo nel log.
+    
     Args:
         df: DataFrame con le colonne standard
         
@@ -70,52 +320,43 @@ def prepare_dataframe_for_db(df: pd.DataFrame) -> List[tuple]:
     """
     if df.empty:
         return []
-        
-    values = []
-    for idx, r in df.iterrows():
-        # Gestisci ore_tim e ore_gestionale se presenti
-        ore_tim = 0.0
-        ore_gestionale = 0.0
-        
-        if "ore_tim" in r and pd.notna(r["ore_tim"]):
-            ore_tim = float(r["ore_tim"])
-        
-        if "ore_gestionale" in r and pd.notna(r["ore_gestionale"]):
-            ore_gestionale = float(r["ore_gestionale"])
-        
-        # Converti esplicitamente totale_colli in int
-        try:
-            totale_colli = int(r["totale_colli"]) if pd.notna(r["totale_colli"]) else 0
-        except (ValueError, OverflowError) as e:
-            print(f"❌ ERRORE conversione totale_colli alla riga {idx}:")
-            print(f"   Valore: {r['totale_colli']} (tipo: {type(r['totale_colli'])})")
-            print(f"   Record completo: {r.to_dict()}")
-            print(f"   Errore: {e}")
-            totale_colli = 0
-        
-        try:
-            penalita = int(r.get("penalita", 0))
-        except (ValueError, OverflowError) as e:
-            print(f"❌ ERRORE conversione penalita alla riga {idx}: {e}")
-            penalita = 0
-        
-        tupla = (
-            r["data"],
-            str(r["codice_preparatore"]),
-            str(r["nome_preparatore"]) if pd.notna(r["nome_preparatore"]) else None,
-            totale_colli,
-            penalita,
-            r["tipo_attivita"],
-            str(r.get("tipo", "")) if pd.notna(r.get("tipo", "")) else "",
-            ore_tim,
-            ore_gestionale,
-        )
-        
-        # Log della tupla
-        if idx < 5:  # Log solo le prime 5
-            print(f"  Tupla {idx}: data={tupla[0]}, codice={tupla[1]}, colli={tupla[3]} ({type(tupla[3])}), ore_gest={tupla[8]}")
-        
-        values.append(tupla)
+
+    errors = ConversionErrors("Preparazione dati per DB")
+    values = list(zip(
+        df["data"].tolist(),
+        df["codice_preparatore"].astype(str).tolist(),
+        _str_column(df, "nome_preparatore", None),
+        _int_column(df, "totale_colli", errors),
+        _int_column(df, "penalita", errors),
+        df["tipo_attivita"].tolist(),
+        _str_column(df, "tipo", ""),
+        _float_column(df, "ore_tim", errors),
+        _float_column(df, "ore_gestionale", errors),
+    ))
+    errors.log_summary()
+
+    logger.info("Totale tuple preparate: %d", len(values))
+    return values
+
+
+def prepare_penalita_updates(penalita_df: pd.DataFrame) -> List[tuple]:
+    """
+    Prepara i parametri (data, codice_preparatore, penalita) per `update_penalita_picking`.
     
-    print(f"\n✅ Totale tuple preparate: {len(values)}")
-    return values
\ No newline at end of file
+    Args:
+        penalita_df: DataFrame con colonne data, codice_preparatore, penalita
+        
+    Returns:
+        Lista di tuple per l'aggiornamento batch
+    """
+    if penalita_df.empty:
+        return []
+
+    errors = ConversionErrors("Penalità PICKING")
+    values = list(zip(
+        penalita_df["data"].tolist(),
+        penalita_df["codice_preparatore"].astype(str).tolist(),
+        _int_column(penalita_df, "penalita", errors),
+    ))
+    errors.log_summary()
+    return values